@@ -1,34 +1,439 @@
-# app.py
-import streamlit as st
-import tempfile, io
-from contextlib import redirect_stdout
-import miscript
-
-st.set_page_config(page_title="Generador de Informes PDF")
-st.title("⚒️ Generador Automatizado de Informes PDF")
-
-# 1) Input: carpeta principal en el servidor
-ruta = st.text_input("1. Ruta de la carpeta principal", placeholder=r"F:\ULMU-T6-0012-Chaktemal")
-
-# 2) Input: subir el Excel que alimenta step4
-excel = st.file_uploader("2. Sube tu archivo Excel (.xlsx)", type=["xlsx"])
-
-# 3) Botón para ejecutar todo
-if st.button("▶️ Ejecutar todos los pasos"):
-    if not ruta or not excel:
-        st.error("❌ Debes indicar la ruta y subir el Excel antes de ejecutar.")
-    else:
-        # Guardar el Excel en un archivo temporal
-        tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx")
-        tmp.write(excel.read())
-        tmp.close()
-        miscript.EXCEL_PATH     = tmp.name
-        miscript.RUTA_PRINCIPAL = ruta
-
-        # Capturar la salida de print() y mostrarla en la UI
-        buffer_stdout = io.StringIO()
-        with redirect_stdout(buffer_stdout):
-            miscript.main()
-
-        st.text_area("📝 Registro de ejecución", buffer_stdout.getvalue(), height=400)
-        st.success("✅ Proceso completado")
+# app.py
+import streamlit as st
+import functools, hashlib, os, shutil, stat, tempfile, threading, time, traceback, weakref, zipfile
+
+# miscript (pandas, PyPDF2) se importa al empezar una ejecución, no en cada
+# recarga de la página: Streamlit vuelve a ejecutar este archivo con cada clic.
+st.set_page_config(page_title="Generador de Informes PDF")
+st.title("⚒️ Generador Automatizado de Informes PDF")
+
+NOMBRES_PASOS = [
+    "Renombrar carpetas",
+    "Renombrar archivos PDF",
+    "Mover archivos",
+    "Crear subcarpetas",
+    "Encarpetar archivos",
+    "Verificar archivos",
+    "Introducción general",
+    "Buscar PDFs vacíos",
+    "Ensamblar informes PDF",
+]
+
+BLOQUE_ZIP = 1 << 20  # bytes que se copian de una vez al descomprimir
+# Streamlit guarda en memoria el .zip subido (hasta server.maxUploadSize, ver
+# .streamlit/config.toml) y el resultado que se descarga: los sitios más
+# grandes se procesan con "Ruta en el servidor"
+MAX_DESCOMPRIMIDO = 16 * 2**30  # bytes que puede ocupar un .zip subido una vez descomprimido
+MAX_DESCARGA      = 1 * 2**30   # bytes del resultado comprimido que se ofrecen para descargar
+
+CACHE_ENTRADAS = 8         # Excel leídos e inventarios de sitio que se conservan entre ejecuciones
+CACHE_TTL      = 6 * 3600  # segundos que dura cada entrada y tras los que se borra una carpeta de trabajo abandonada
+PREFIJO_TRABAJO = "informes_"  # carpetas de trabajo de los .zip subidos, en la carpeta temporal
+
+
+# =============================================================================
+# CACHÉ ENTRE RECARGAS: Excel leído, inventario del sitio y archivos temporales
+# =============================================================================
+# Las funciones con caché de Streamlit se llaman en el hilo de la página, nunca
+# en el de Ejecucion: se preparan antes de iniciarla y se le pasan los resultados.
+@st.cache_resource(max_entries=CACHE_ENTRADAS, ttl=CACHE_TTL, show_spinner=False)
+def cargar_excel(clave, sitio, _excel_bytes, _log=print):
+    """
+    Filas de `sitio` del Excel subido (miscript.BaseDatos), por hash del
+    contenido: volver a ejecutar con el mismo libro no lo vuelve a leer.
+    El .xlsx solo existe en disco mientras lo lee miscript.
+    """
+    import miscript
+
+    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx")
+    try:
+        tmp.write(_excel_bytes)
+        tmp.close()
+        return miscript.cargar_base_datos(tmp.name, log=_log, sitio=sitio)
+    finally:
+        os.remove(tmp.name)
+
+
+@st.cache_resource(max_entries=CACHE_ENTRADAS, ttl=CACHE_TTL, show_spinner=False)
+def ultimo_inventario(ruta):
+    """
+    Inventario de la carpeta `ruta` que dejó la última ejecución completa,
+    con la firma de la carpeta en disco (miscript.InventarioSitio.firma).
+    """
+    return {"inventario": None, "firma": None, "lock": threading.Lock()}
+
+
+def tomar_inventario(ruta):
+    """
+    El inventario guardado de `ruta` si la carpeta no cambió desde entonces
+    (o None). La firma solo mira la carpeta principal: los cambios dentro de
+    sus subcarpetas no se ven y la página ofrece volver a leer todo el sitio.
+    """
+    guardado = ultimo_inventario(ruta)
+    with guardado["lock"]:
+        # Mientras dura la ejecución nadie más lo usa: los pasos lo modifican
+        inventario, firma = guardado["inventario"], guardado["firma"]
+        guardado["inventario"] = guardado["firma"] = None
+    if inventario is not None and inventario.firma() == firma:
+        return inventario
+    return None
+
+
+def guardar_inventario(ruta, inventario):
+    guardado = ultimo_inventario(ruta)
+    firma = inventario.firma()
+    with guardado["lock"]:
+        guardado["inventario"], guardado["firma"] = inventario, firma
+
+
+def limpiar_carpetas_abandonadas():
+    """
+    Borra las carpetas de trabajo de más de CACHE_TTL segundos: las que dejó
+    un servidor anterior o una sesión que se abandonó sin descargar el
+    resultado (las demás se borran al terminar la sesión o empezar otra
+    ejecución, ver Ejecucion.limpiar). Se llama al empezar cada ejecución
+    con un .zip, justo antes de crear una carpeta de trabajo nueva.
+    """
+    limite = time.time() - CACHE_TTL
+    with os.scandir(tempfile.gettempdir()) as it:
+        for e in it:
+            if e.name.startswith(PREFIJO_TRABAJO) and e.is_dir(follow_symlinks=False) \
+                    and e.stat(follow_symlinks=False).st_mtime < limite:
+                shutil.rmtree(e.path, ignore_errors=True)
+
+
+# =============================================================================
+# SITIO COMPRIMIDO: subir un .zip y descargar el resultado
+# =============================================================================
+def _nombre_miembro(info):
+    """
+    Nombre de una entrada del .zip. Sin la marca UTF-8, zipfile lo lee como
+    cp437, pero el Explorador de Windows en español escribe cp850 (y otros
+    programas, UTF-8 sin marcarlo): "Excavación" llegaría como "Excavaci¾n".
+    """
+    if info.flag_bits & 0x800:
+        return info.filename
+    crudo = info.filename.encode("cp437")
+    try:
+        return crudo.decode("utf-8")
+    except UnicodeDecodeError:
+        return crudo.decode("cp850")
+
+
+def _entradas_zip(zf, log=print):
+    """
+    (ZipInfo, partes de la ruta) de las entradas del .zip que se extraen.
+    Rechaza las rutas absolutas o con ".." (zip slip) y omite los enlaces
+    simbólicos y las carpetas __MACOSX.
+    """
+    entradas = []
+    for info in zf.infolist():
+        partes = [p for p in _nombre_miembro(info).replace("\\", "/").split("/") if p not in ("", ".")]
+        if not partes or partes[0] == "__MACOSX" or partes[-1] == ".DS_Store":
+            continue
+        if info.filename.startswith(("/", "\\")) or ".." in partes or ":" in partes[0]:
+            raise ValueError(f"Ruta no permitida en el .zip: {info.filename}")
+        if stat.S_ISLNK(info.external_attr >> 16):
+            log(f"⏭️ Se omite el enlace simbólico {'/'.join(partes)}")
+            continue
+        entradas.append((info, partes))
+    return entradas
+
+
+def _carpeta_principal(archivo, entradas):
+    """
+    (nombre, prefijo): la única carpeta de primer nivel del .zip o, si hay
+    varias entradas sueltas, el nombre del .zip sin extensión, que se
+    antepone (`prefijo`) a todas las entradas.
+    """
+    primeros = {partes[0] for _, partes in entradas}
+    if len(primeros) == 1 and all(len(partes) > 1 or info.is_dir() for info, partes in entradas):
+        return primeros.pop(), []
+    nombre = os.path.splitext(os.path.basename(getattr(archivo, "name", None) or str(archivo)))[0]
+    return nombre, [nombre]
+
+
+def sitio_zip(archivo):
+    """
+    Nombre de la carpeta principal que extraer_zip() sacará del .zip
+    `archivo`, sin descomprimir nada (solo se lee el índice del .zip).
+    """
+    with zipfile.ZipFile(archivo) as zf:
+        nombre, _ = _carpeta_principal(archivo, _entradas_zip(zf, log=lambda *a, **k: None))
+    if hasattr(archivo, "seek"):
+        archivo.seek(0)
+    return nombre
+
+
+def extraer_zip(archivo, destino, log=print):
+    """
+    Descomprime el .zip `archivo` (ruta o archivo abierto, p. ej. el
+    UploadedFile de Streamlit) en `destino`, entrada por entrada y en
+    bloques de BLOQUE_ZIP bytes: no se copia antes el .zip a disco ni se
+    carga ninguna entrada entera en memoria.
+
+    Se rechazan las rutas absolutas o con ".." (zip slip) y los .zip que
+    descomprimidos pasan de MAX_DESCOMPRIMIDO bytes o del espacio libre, antes
+    de escribir nada; se omiten los enlaces simbólicos y las carpetas
+    __MACOSX (ver _entradas_zip). Devuelve la carpeta principal: la única
+    carpeta de primer nivel del .zip o, si hay varias entradas sueltas,
+    `destino`/<nombre del .zip sin extensión>.
+    """
+    raiz_destino = os.path.realpath(destino)
+    with zipfile.ZipFile(archivo) as zf:
+        entradas = _entradas_zip(zf, log)
+        nombre, prefijo = _carpeta_principal(archivo, entradas)
+        principal = os.path.join(destino, nombre)
+
+        # zipfile no lee de una entrada más bytes de los que declara: el total es fiable
+        total = sum(info.file_size for info, _ in entradas)
+        if total > MAX_DESCOMPRIMIDO:
+            raise ValueError(f"El .zip ocupa {total / 2**30:.1f} GB descomprimido y el máximo es "
+                             f"{MAX_DESCOMPRIMIDO / 2**30:.1f} GB: procesa el sitio con 'Ruta en el servidor'")
+        libre = shutil.disk_usage(destino).free
+        if total > libre:
+            raise ValueError(f"El .zip ocupa {total / 2**30:.1f} GB descomprimido y solo hay {libre / 2**30:.1f} GB libres")
+        log(f"📦 Descomprimiendo {len(entradas)} entradas ({total / 2**20:.1f} MB)...")
+        for info, partes in entradas:
+            ruta = os.path.join(destino, *prefijo, *partes)
+            if not os.path.realpath(ruta).startswith(raiz_destino + os.sep):
+                raise ValueError(f"Ruta no permitida en el .zip: {info.filename}")
+            if info.is_dir():
+                os.makedirs(ruta, exist_ok=True)
+                continue
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            with zf.open(info) as origen, open(ruta, "wb") as salida:
+                shutil.copyfileobj(origen, salida, BLOQUE_ZIP)
+    os.makedirs(principal, exist_ok=True)
+    return principal
+
+
+def comprimir_resultado(carpetas, base, salida):
+    """
+    Escribe en `salida` un .zip con `carpetas` (rutas relativas a `base`),
+    archivo por archivo y directamente en disco. Los PDF ya van comprimidos
+    y se guardan sin volver a comprimir; se omiten los archivos internos
+    de miscript (.informes_*: caché, diario, índice de rutas).
+    """
+    with zipfile.ZipFile(salida, "w", zipfile.ZIP_DEFLATED, compresslevel=6) as zf:
+        for carpeta in carpetas:
+            for raiz, dirs, archivos in os.walk(carpeta):
+                dirs.sort()
+                zf.write(raiz, os.path.relpath(raiz, base))  # también las carpetas vacías
+                for nombre in sorted(archivos):
+                    if nombre.startswith(".informes_"):
+                        continue
+                    ruta = os.path.join(raiz, nombre)
+                    tipo = zipfile.ZIP_STORED if nombre.lower().endswith(".pdf") else zipfile.ZIP_DEFLATED
+                    zf.write(ruta, os.path.relpath(ruta, base), compress_type=tipo)
+    return salida
+
+
+def leer_resultado(ruta):
+    """
+    Contenido del .zip de resultado; el archivo se cierra antes de
+    devolverlo. Streamlit lo guarda entero en memoria para servirlo: solo se
+    ofrece si no pasa de MAX_DESCARGA bytes (ver Ejecucion._ejecutar).
+    """
+    with open(ruta, "rb") as f:
+        return f.read()
+
+
+class Ejecucion:
+    """
+    Ejecución de miscript.main() en un hilo en segundo plano.
+
+    Cada ejecución tiene su propio ContextoSitio, así que dos usuarios que
+    pulsan "Ejecutar" a la vez no comparten las variables globales de miscript.
+    El hilo solo agrega líneas a `lineas` y actualiza `progreso`; la página
+    los lee en cada refresco.
+
+    La página lee antes el Excel (`base_datos`, ver cargar_excel) y, si lo
+    hay, toma el `inventario` de la última ejecución sobre la ruta; al
+    terminar deja en `inventario` el de esta ejecución para que la página
+    lo guarde (guardar_inventario).
+
+    Con `zip_sitio` (el .zip subido) en lugar de `ruta`, el sitio se
+    descomprime en una carpeta de trabajo propia de la ejecución y al
+    terminar se deja en `resultado_zip` el árbol reorganizado con los
+    informes. limpiar() elimina la carpeta de trabajo; si no se llama, se
+    elimina cuando la sesión termina y la ejecución deja de usarse.
+    """
+
+    def __init__(self, ruta, base_datos, inventario=None, zip_sitio=None):
+        self.ruta = ruta
+        self.base_datos = base_datos
+        self.inventario = inventario
+        self.zip_sitio = zip_sitio
+        self.carpeta_trabajo = None
+        self.resultado_zip = None
+        self._limpieza = None
+        self.lineas = []
+        self.progreso = (0, 0, 0)  # (paso, hechos, total)
+        self.metricas = []  # un registro por paso terminado (miscript.medir_paso)
+        self.estado = "ejecutando"  # "ejecutando", "completado", "cancelado" o "error"
+        self.error = None
+        self.cancelar = threading.Event()
+        self.hilo = threading.Thread(target=self._ejecutar, daemon=True)
+
+    def iniciar(self):
+        self.hilo.start()
+
+    def activa(self):
+        return self.hilo.is_alive()
+
+    def _log(self, *args, sep=" ", end="\n", **kwargs):
+        self.lineas.extend((sep.join(str(a) for a in args) + end).rstrip("\n").split("\n"))
+
+    def _progreso(self, paso, hechos, total):
+        self.progreso = (paso, hechos, total)
+
+    def limpiar(self):
+        """Elimina la carpeta de trabajo (sitio descomprimido y resultado)."""
+        if self._limpieza is not None:
+            self._limpieza()  # weakref.finalize: solo borra la primera vez
+        self.carpeta_trabajo = self.resultado_zip = None
+
+    def _ejecutar(self):
+        import miscript
+
+        try:
+            if self.zip_sitio is not None:
+                self.carpeta_trabajo = tempfile.mkdtemp(prefix=PREFIJO_TRABAJO)
+                self._limpieza = weakref.finalize(self, shutil.rmtree, self.carpeta_trabajo, ignore_errors=True)
+                self.ruta = extraer_zip(self.zip_sitio, self.carpeta_trabajo, log=self._log)
+                self.zip_sitio = None  # Streamlit puede liberar el archivo subido
+            ruta = os.path.normpath(self.ruta)
+            base_datos, inventario = self.base_datos, self.inventario
+            self.base_datos = self.inventario = None
+            if inventario is not None:
+                self._log("♻️ El sitio no cambió desde la última ejecución: se reutiliza su inventario")
+            ctx = miscript.ContextoSitio(
+                ruta, base_datos=base_datos, inventario=inventario, log=self._log,
+                progreso=self._progreso, cancelar=self.cancelar,
+            )
+            self.metricas = ctx.metricas
+            miscript.main(ctx)
+            if self.carpeta_trabajo is None:
+                # Un sitio descomprimido es nuevo en cada ejecución: solo se guarda el de una ruta
+                self.inventario = ctx.inventario
+            else:
+                self._log("📦 Comprimiendo el resultado...")
+                salida = os.path.join(self.carpeta_trabajo, f"{ctx.sitio}_resultado.zip")
+                carpetas = [ctx.ruta, miscript._carpeta_informes(ctx)]
+                self.resultado_zip = comprimir_resultado(
+                    [c for c in carpetas if os.path.isdir(c)], self.carpeta_trabajo, salida,
+                )
+                tamano = os.path.getsize(salida)
+                self._log(f"✅ Resultado comprimido: {tamano / 2**20:.1f} MB")
+                if tamano > MAX_DESCARGA:
+                    self._log(f"⚠️ El resultado pasa de {MAX_DESCARGA / 2**20:.0f} MB y no se ofrece para "
+                              f"descargar; queda en el servidor: {salida}")
+            self.estado = "completado"
+        except miscript.EjecucionCancelada as e:
+            self._log(f"⏹️ {e}")
+            self.estado = "cancelado"
+        except Exception as e:
+            self._log(traceback.format_exc())
+            self.error = f"{type(e).__name__}: {e}"
+            self.estado = "error"
+
+
+def mostrar_progreso(ejecucion, barra, registro):
+    paso, hechos, total = ejecucion.progreso
+    if paso:
+        fraccion = (paso - 1 + (hechos / total if total else 0)) / len(NOMBRES_PASOS)
+        texto = f"Paso {paso}/{len(NOMBRES_PASOS)}: {NOMBRES_PASOS[paso - 1]} ({hechos}/{total})"
+        barra.progress(min(fraccion, 1.0), text=texto)
+    registro.code("\n".join(ejecucion.lineas[-200:]) or " ", language=None)
+
+
+# 1) Input: carpeta principal comprimida o en el servidor
+origen = st.radio("1. Carpeta principal", ["Subir un .zip", "Ruta en el servidor"], horizontal=True)
+ruta = zip_sitio = None
+releer = False
+if origen == "Subir un .zip":
+    zip_sitio = st.file_uploader("Carpeta principal comprimida (.zip)", type=["zip"])
+    st.caption("La carpeta dentro del .zip (o el .zip, si no tiene una sola carpeta) debe llamarse "
+               "como el 'Nombre Sitio' del Excel. Al terminar se descarga el resultado comprimido.")
+else:
+    ruta = st.text_input("Ruta de la carpeta principal", placeholder=r"F:\ULMU-T6-0012-Chaktemal")
+    releer = st.checkbox("Volver a leer todo el sitio",
+                         help="Si la carpeta principal no cambió, se reutiliza lo que se leyó del sitio en la "
+                              "última ejecución. Márcalo si cambiaste archivos dentro de sus subcarpetas.")
+
+# 2) Input: subir el Excel que alimenta step4
+excel = st.file_uploader("2. Sube tu archivo Excel (.xlsx)", type=["xlsx"])
+
+ejecucion = st.session_state.get("ejecucion")
+en_curso = ejecucion is not None and ejecucion.activa()
+
+# 3) Botón para ejecutar todo (en segundo plano)
+if st.button("▶️ Ejecutar todos los pasos", disabled=en_curso):
+    if not (ruta or zip_sitio) or not excel:
+        st.error("❌ Debes indicar la carpeta principal y subir el Excel antes de ejecutar.")
+    else:
+        if ejecucion is not None:
+            ejecucion.limpiar()  # la carpeta de trabajo de la ejecución anterior
+        avisos = []
+        try:
+            with st.spinner("Leyendo el Excel..."):
+                sitio = sitio_zip(zip_sitio) if zip_sitio is not None else os.path.basename(os.path.normpath(ruta))
+                excel_bytes = excel.getvalue()
+                base_datos = cargar_excel(hashlib.sha256(excel_bytes).hexdigest(), sitio, excel_bytes,
+                                          _log=avisos.append)
+        except Exception as e:
+            st.error(f"❌ No se pudo preparar la ejecución: {type(e).__name__}: {e}")
+        else:
+            inventario = None
+            if zip_sitio is not None:
+                limpiar_carpetas_abandonadas()
+            elif not releer:
+                inventario = tomar_inventario(os.path.normpath(ruta))
+            ejecucion = Ejecucion(ruta, base_datos, inventario=inventario, zip_sitio=zip_sitio)
+            ejecucion.lineas.extend(avisos)
+            ejecucion.iniciar()
+            st.session_state["ejecucion"] = ejecucion
+            en_curso = True
+
+if ejecucion is not None:
+    if en_curso and st.button("⏹️ Cancelar"):
+        ejecucion.cancelar.set()
+    barra = st.empty()
+    registro = st.empty()
+    # Refrescar mientras el hilo trabaja; cualquier interacción interrumpe este
+    # bucle (Streamlit vuelve a ejecutar la página) pero no la ejecución.
+    while ejecucion.activa():
+        mostrar_progreso(ejecucion, barra, registro)
+        time.sleep(0.5)
+    mostrar_progreso(ejecucion, barra, registro)
+    if ejecucion.inventario is not None:
+        guardar_inventario(os.path.normpath(ejecucion.ruta), ejecucion.inventario)
+        ejecucion.inventario = None
+    registro.empty()
+    st.text_area("📝 Registro de ejecución", "\n".join(ejecucion.lineas), height=400)
+    if ejecucion.metricas:
+        st.subheader("📊 Métricas por paso")
+        st.dataframe(ejecucion.metricas, hide_index=True)
+    if ejecucion.estado == "completado":
+        st.success("✅ Proceso completado")
+        if ejecucion.resultado_zip and os.path.exists(ejecucion.resultado_zip):
+            # El .zip se lee del disco solo cuando se pulsa el botón, no en cada refresco
+            resultado = ejecucion.resultado_zip
+            tamano = os.path.getsize(resultado)
+            if tamano > MAX_DESCARGA:
+                st.warning(f"⚠️ El resultado ocupa {tamano / 2**30:.1f} GB, más de lo que se puede descargar "
+                           f"desde la página ({MAX_DESCARGA / 2**30:.1f} GB). Queda en el servidor: {resultado}. "
+                           f"Para sitios tan grandes, usa 'Ruta en el servidor'.")
+            else:
+                st.download_button(
+                    f"⬇️ Descargar resultado ({tamano / 2**20:.1f} MB)",
+                    data=functools.partial(leer_resultado, resultado),
+                    file_name=os.path.basename(resultado),
+                    mime="application/zip",
+                    on_click="ignore",
+                )
+    elif ejecucion.estado == "cancelado":
+        st.warning("⏹️ Proceso cancelado")
+    else:
+        st.error(f"❌ El proceso terminó con un error: {ejecucion.error}")
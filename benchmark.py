@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Banco de pruebas del flujo de miscript.main() con sitios sintéticos.
+
+Genera un sitio falso con la misma estructura que entrega el campo
+(Excavacion/..., RegistroUnico/..., Prospeccion, IntroduccionGeneral.pdf),
+su Excel con las columnas que usa el flujo y PDF pequeños válidos, vacíos y
+dañados; luego ejecuta todos los pasos y guarda el tiempo de cada uno.
+
+Uso:
+    python benchmark.py                              # 1k, 10k y 100k archivos
+    python benchmark.py --tamanos 1000 --repeticiones 3 --salida bench.jsonl
+"""
+
+import os
+import io
+import json
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import pandas as pd
+import PyPDF2
+
+import miscript
+
+# =============================================================================
+# CONFIGURACIÓN
+# =============================================================================
+TAMANOS      = [1_000, 10_000, 100_000]  # archivos aproximados por sitio
+NOMBRE_SITIO = "SitioBench"
+SALIDA       = "benchmark_resultados.jsonl"
+
+# Subcarpetas de "Excavacion" tal como llegan del campo (el paso 1 las renombra)
+SUBCARPETAS_EXCAVACION = [
+    "Introduccion",
+    "FichaDeExcavacion",
+    "Dibujos",
+    "RegistroDeCapas",
+    "RegistroDeFotogrametria",
+    "RegistroDeMaterialesArqueologicos",
+    "RegistrosArqueologicos",
+]
+
+PROPORCION_REGISTROS = 0.1    # monumentos de registro único por monumento de excavación
+PROPORCION_MULTI_ID  = 0.1    # PDF cuyo nombre lleva dos IDs (T1_3_T1_4.pdf)
+PROPORCION_VACIOS    = 0.01   # PDF de 0 bytes
+PROPORCION_DANADOS   = 0.005  # PDF ilegibles
+
+PDF_DANADO = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\nesto no es un PDF\n"
+MARCA_PDF = b"0000000000000000"  # título del PDF válido; cada archivo lo cambia por su número
+
+
+# =============================================================================
+# GENERACIÓN DEL SITIO
+# =============================================================================
+def _pdf_valido():
+    """
+    PDF mínimo de una página en blanco con MARCA_PDF como título. Cambiar la
+    marca por otra del mismo largo no mueve la tabla xref, así que cada
+    archivo del sitio puede tener un contenido distinto, como en el campo.
+    """
+    escritor = PyPDF2.PdfWriter()
+    escritor.add_blank_page(width=200, height=200)
+    escritor.add_metadata({"/Title": MARCA_PDF.decode()})
+    buffer = io.BytesIO()
+    escritor.write(buffer)
+    return buffer.getvalue()
+
+
+def generar_sitio(carpeta, archivos, semilla=0):
+    """
+    Crea en `carpeta` el sitio NOMBRE_SITIO con unos `archivos` PDF y su Excel
+    (`carpeta`/base.xlsx). Devuelve (ruta del sitio, ruta del Excel, PDF creados).
+
+    Cada monumento de excavación tiene un PDF en cada subcarpeta de
+    "Excavacion" y otro en "Prospeccion"; algunos nombres llevan dos IDs y
+    algunos monumentos se agrupan por "Monumentos superiores" o "Monumentos
+    Asociados por cercanía", como en los sitios reales.
+    """
+    azar = random.Random(semilla)
+    por_monumento = len(SUBCARPETAS_EXCAVACION) + 1 + PROPORCION_REGISTROS
+    n_excavacion = max(2, round(archivos / por_monumento))
+    n_registros = max(1, round(n_excavacion * PROPORCION_REGISTROS))
+
+    sitio = os.path.join(carpeta, NOMBRE_SITIO)
+    if os.path.exists(sitio):
+        shutil.rmtree(sitio)
+    valido = _pdf_valido()
+    creados = 0
+
+    def escribir(ruta):
+        nonlocal creados
+        r = azar.random()
+        if r < PROPORCION_VACIOS:
+            datos = b""
+        elif r < PROPORCION_VACIOS + PROPORCION_DANADOS:
+            datos = PDF_DANADO
+        else:
+            datos = valido.replace(MARCA_PDF, b"%016d" % creados)
+        with open(ruta, "wb") as f:
+            f.write(datos)
+        creados += 1
+
+    # Excavación: T1_<n>.pdf en cada subcarpeta; algunos comparten PDF con el siguiente monumento
+    ids = [f"T1_{i}" for i in range(1, n_excavacion + 1)]
+    nombres = []
+    for i, id_ in enumerate(ids):
+        if i + 1 < len(ids) and azar.random() < PROPORCION_MULTI_ID:
+            nombres.append(f"{id_}_{ids[i + 1]}.pdf")
+        else:
+            nombres.append(f"{id_}.pdf")
+    for sub in SUBCARPETAS_EXCAVACION:
+        ruta_sub = os.path.join(sitio, "Excavacion", sub)
+        os.makedirs(ruta_sub)
+        for nombre in nombres:
+            escribir(os.path.join(ruta_sub, nombre))
+
+    # Prospección: un PDF por monumento de excavación
+    os.makedirs(os.path.join(sitio, "Prospeccion"))
+    for id_ in ids:
+        escribir(os.path.join(sitio, "Prospeccion", f"{id_}.pdf"))
+
+    # Registros únicos
+    ids_registros = [f"T2_{i}" for i in range(1, n_registros + 1)]
+    ruta_registros = os.path.join(sitio, "RegistroUnico", "RegistrosArqueologicos")
+    os.makedirs(ruta_registros)
+    for id_ in ids_registros:
+        escribir(os.path.join(ruta_registros, f"{id_}.pdf"))
+
+    escribir(os.path.join(sitio, "IntroduccionGeneral.pdf"))
+
+    # Excel con las columnas de miscript.COLUMNAS_EXCEL (y un sitio ajeno)
+    filas = []
+    for i, id_ in enumerate(ids):
+        superior = ids[i - 1] if i and azar.random() < 0.2 else ""
+        cercania = ids[i + 1] if i + 1 < len(ids) and azar.random() < 0.1 else ""
+        filas.append((NOMBRE_SITIO, id_, superior, cercania, "Excavación"))
+    for id_ in ids_registros:
+        filas.append((NOMBRE_SITIO, id_, "", "", "Registro único"))
+    filas.append(("OtroSitio", "T9_1", "", "", "Excavación"))
+    excel = os.path.join(carpeta, "base.xlsx")
+    pd.DataFrame(filas, columns=miscript.COLUMNAS_EXCEL).to_excel(excel, index=False)
+    return sitio, excel, creados
+
+
+# =============================================================================
+# MEDICIÓN
+# =============================================================================
+def medir(archivos, carpeta, semilla=0, log=print):
+    """Genera un sitio de `archivos` PDF, ejecuta main() y devuelve el registro de resultados."""
+    inicio = time.perf_counter()
+    sitio, excel, creados = generar_sitio(carpeta, archivos, semilla)
+    generacion = time.perf_counter() - inicio
+    log(f"🏗️ Sitio de {creados} PDF generado en {generacion:.1f} s")
+
+    # Caché del Excel vacía y propia de la medición: se mide la lectura en frío
+    cache_excel = miscript.CACHE_EXCEL_DIR
+    miscript.CACHE_EXCEL_DIR = os.path.join(carpeta, "cache_excel")
+    shutil.rmtree(miscript.CACHE_EXCEL_DIR, ignore_errors=True)
+    try:
+        ctx = miscript.ContextoSitio(sitio, excel, log=None)
+        inicio = time.perf_counter()
+        miscript.main(ctx)
+        total = time.perf_counter() - inicio
+    finally:
+        miscript.CACHE_EXCEL_DIR = cache_excel
+    log(miscript.tabla_metricas(ctx.metricas))
+    log(f"⏱️ Total {total:.2f} s (carga del Excel e inventario: {total - sum(m['duracion'] for m in ctx.metricas):.2f} s)")
+    return {
+        "tamano": archivos,
+        "archivos": creados,
+        "generacion": round(generacion, 4),
+        "total": round(total, 4),
+        "preparacion": round(total - sum(m["duracion"] for m in ctx.metricas), 4),
+        "pasos": ctx.metricas,
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Mide los pasos de miscript con sitios sintéticos.")
+    parser.add_argument("--tamanos", type=int, nargs="+", default=TAMANOS,
+                        help="archivos por sitio (por defecto 1000 10000 100000)")
+    parser.add_argument("--repeticiones", type=int, default=1)
+    parser.add_argument("--carpeta", help="carpeta de trabajo (por defecto una temporal que se borra al final)")
+    parser.add_argument("--salida", default=SALIDA, help="archivo .jsonl donde se agregan los resultados")
+    parser.add_argument("--semilla", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    carpeta = args.carpeta or tempfile.mkdtemp(prefix="bench_informes_")
+    os.makedirs(carpeta, exist_ok=True)
+    try:
+        for tamano in args.tamanos:
+            for repeticion in range(args.repeticiones):
+                print(f"\n=== {tamano} archivos (repetición {repeticion + 1}/{args.repeticiones}) ===")
+                resultado = medir(tamano, carpeta, semilla=args.semilla + repeticion)
+                resultado["repeticion"] = repeticion + 1
+                with open(args.salida, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(resultado, ensure_ascii=False) + "\n")
+    finally:
+        if not args.carpeta:
+            shutil.rmtree(carpeta, ignore_errors=True)
+    print(f"\n📝 Resultados agregados a {args.salida}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
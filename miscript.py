@@ -1,539 +1,3877 @@
-#!/usr/bin/env python
-# -*- coding: utf-8 -*-
-"""
-Script único que ejecuta el siguiente flujo de trabajo:
-1. Renombrar carpetas
-2. Renombrar archivos PDF en la carpeta "Excavación" y "Registros únicos"
-3. Mover archivos renombrados a "Excavación por ID Monumento"
-4. Crear subcarpetas en "Excavación por ID Monumento" y "Registros únicos"
-5. Encarpetar archivos en "Excavación por ID Monumento"  y "Registros únicos"
-6. Verificar archivos en la carpeta principal
-7. Crear subcarpeta "Introducción general" y mover el archivo "IntroduccionGeneral.pdf"
-8. Buscar archivos PDF vacíos
-
-IMPORTANTE:
--La carpeta principal se debe nombrar de la misma manera que la columna "Nombre Sitio" de la base de datos (excel)
-- Solo se define la ruta principal una vez (variable RUTA_PRINCIPAL).
-- A partir de RUTA_PRINCIPAL se construyen las rutas para cada paso.
-"""
-
-import os
-import shutil
-import pandas as pd
-from collections import defaultdict
-import PyPDF2
-# =============================================================================
-# DEFINICIÓN DE LA RUTA PRINCIPAL (única definición) y # RUTAS DE ARCHIVOS
-# =============================================================================
-RUTA_PRINCIPAL = None  # ruta base para procesar carpetas y PDFs
-EXCEL_PATH     = None  # ruta al archivo Excel para step4
-
-# =============================================================================
-# Paso 1: RENOMBRAR CARPETAS
-# =============================================================================
-def step1_renombrar_carpetas():
-    if not RUTA_PRINCIPAL:
-        raise ValueError("RUTA_PRINCIPAL no está definida")
-    print("\n--- Paso 1: Renombrar Carpetas ---")
-    
-    # Diccionario con los nombres actuales y sus respectivos cambios
-    renombrar = {
-        "Excavacion": "Excavación",
-        "Prospeccion": "Prospección",
-        "RegistroUnico": "Registros únicos",
-        "Dibujos": "Dibujos arquitectónicos",
-        "FichaDeExcavacion": "Ficha de excavación",
-        "Introduccion": "Introducción",
-        "RegistroDeCapas": "Registro de capas",
-        "RegistroDeFotogrametria": "Registro de fotogrametría",
-        "RegistroDeMaterialesArqueologicos": "Registro de materiales arqueológicos",
-        "RegistrosArqueologicos": "Registros arqueológicos"
-    }
-    
-    def renombrar_carpetas_en_ruta(ruta_base):
-        for root, dirs, files in os.walk(ruta_base, topdown=False):
-            for carpeta in dirs:
-                ruta_actual = os.path.join(root, carpeta)
-                nuevo_nombre = renombrar.get(carpeta, None)
-                if nuevo_nombre:
-                    ruta_nueva = os.path.join(root, nuevo_nombre)
-                    if not os.path.exists(ruta_nueva):
-                        os.rename(ruta_actual, ruta_nueva)
-                        print(f"Renombrado: {ruta_actual} → {ruta_nueva}")
-                    else:
-                        print(f"❌ No se pudo renombrar {ruta_actual} porque {ruta_nueva} ya existe.")
-    
-    renombrar_carpetas_en_ruta(RUTA_PRINCIPAL)
-
-
-# =============================================================================
-# Paso 2: RENOMBRAR ARCHIVOS EN LA CARPETA "Excavación" Y "Registros únicos"
-# =============================================================================
-def step2_renombrar_archivos():
-    if not RUTA_PRINCIPAL:
-        raise ValueError("RUTA_PRINCIPAL no está definida")
-    print("\n--- Paso 2: Renombrar Archivos PDF ---")
-
-    # Define las rutas de ambas carpetas
-    carpeta_excavacion = os.path.join(RUTA_PRINCIPAL, "Excavación")
-    carpeta_registros_unicos = os.path.join(RUTA_PRINCIPAL, "Registros únicos")
-    
-    def rename_pdfs_in_subfolders(main_path):
-        for root, dirs, files in os.walk(main_path):
-            folder_name = os.path.basename(root)
-            for file in files:
-                if file.endswith(".pdf"):
-                    old_path = os.path.join(root, file)
-                    new_name = f"{os.path.splitext(file)[0]}_{folder_name}.pdf"
-                    new_path = os.path.join(root, new_name)
-                    # Renombra solo si aún no tiene el sufijo de la subcarpeta
-                    if not file.endswith(f"_{folder_name}.pdf"):
-                        os.rename(old_path, new_path)
-                        print(f"✅ Renombrado: {file} → {new_name}")
-                    else:
-                        print(f"⚠️ Ya tiene el formato esperado: {file}")
-    
-    # Procesa la carpeta "Excavación"
-    if os.path.exists(carpeta_excavacion):
-        print(f"Procesando archivos en 'Excavación'...")
-        rename_pdfs_in_subfolders(carpeta_excavacion)
-    else:
-        print(f"❌ La carpeta 'Excavación' no existe en {RUTA_PRINCIPAL}")
-    
-    # Procesa la carpeta "Registros únicos"
-    if os.path.exists(carpeta_registros_unicos):
-        print(f"Procesando archivos en 'Registros únicos'...")
-        rename_pdfs_in_subfolders(carpeta_registros_unicos)
-    else:
-        print(f"❌ La carpeta 'Registros únicos' no existe en {RUTA_PRINCIPAL}")
-
-
-# =============================================================================
-# Paso 3: MOVER ARCHIVOS RENOMBRADOS A "Excavación por ID Monumento"
-# =============================================================================
-def step3_mover_archivos_renombrados():
-    if not RUTA_PRINCIPAL:
-        raise ValueError("RUTA_PRINCIPAL no está definida")
-    print("\n--- Paso 3: Mover Archivos ---")
-    
-    # Parte 1: Mover archivos desde "Excavación" a "Excavación por ID Monumento"
-    carpeta_excavacion = os.path.join(RUTA_PRINCIPAL, "Excavación")
-    carpeta_destino = os.path.join(RUTA_PRINCIPAL, "Excavación por ID Monumento")
-    os.makedirs(carpeta_destino, exist_ok=True)
-    
-    def move_pdfs(main_path, output_path):
-        for root, dirs, files in os.walk(main_path):
-            for file in files:
-                if file.endswith(".pdf"):
-                    old_path = os.path.join(root, file)
-                    new_path = os.path.join(output_path, file)
-                    if os.path.exists(new_path):
-                        print(f"⚠️ El archivo ya existe en {output_path}: {file}, se omite.")
-                    else:
-                        shutil.move(old_path, new_path)
-                        print(f"✅ Movido: {file} → {output_path}")
-    
-    if os.path.exists(carpeta_excavacion):
-        move_pdfs(carpeta_excavacion, carpeta_destino)
-    else:
-        print(f"❌ La carpeta 'Excavación' no existe en {RUTA_PRINCIPAL}")
-    
-    # Parte 2: Mover archivos de las subcarpetas de "Registros únicos" a la carpeta "Registros únicos" (limpiar subcarpetas)
-    carpeta_registros_unicos = os.path.join(RUTA_PRINCIPAL, "Registros únicos")
-    if os.path.exists(carpeta_registros_unicos):
-        print(f"Procesando archivos en subcarpetas de 'Registros únicos'...")
-        for root, dirs, files in os.walk(carpeta_registros_unicos):
-            # Si estamos en la carpeta raíz, no se mueve nada
-            if os.path.abspath(root) == os.path.abspath(carpeta_registros_unicos):
-                continue
-            for file in files:
-                if file.endswith(".pdf"):
-                    old_path = os.path.join(root, file)
-                    new_path = os.path.join(carpeta_registros_unicos, file)
-                    if os.path.exists(new_path):
-                        print(f"⚠️ El archivo ya existe en {carpeta_registros_unicos}: {file}, se omite.")
-                    else:
-                        shutil.move(old_path, new_path)
-                        print(f"✅ Movido: {file} → {carpeta_registros_unicos}")
-    else:
-        print(f"❌ La carpeta 'Registros únicos' no existe en {RUTA_PRINCIPAL}")
-
-
-
-# =============================================================================
-# Paso 4: CREAR SUBCARPETAS EN "Excavación por ID Monumento" Y "Registros únicos"
-# =============================================================================
-import os
-import pandas as pd
-
-def step4_crear_subcarpetas():
-    if not RUTA_PRINCIPAL or not EXCEL_PATH:
-        raise ValueError("Debe definir RUTA_PRINCIPAL y EXCEL_PATH")
-    print("\n--- Paso 4: Crear Subcarpetas desde Excel ---")
-    df = pd.read_excel(EXCEL_PATH, engine='openpyxl', dtype=str).fillna("")
-    sitio = os.path.basename(RUTA_PRINCIPAL)
-    df = df[df["Nombre Sitio"] == sitio]
-
-    handled_ids = set()       # Para no procesar dos veces un mismo ID base
-    created_combos = set()    # Para no crear dos veces la misma combinación
-
-    for _, row in df.iterrows():
-        base_id = row["ID Monumento"].strip()
-
-        # --- Condicional: si alguno de esos dos campos empieza con "A", OMITIMOS el base_id ---
-        sup = row.get("Monumentos superiores", "").strip()
-        assoc = row.get("Monumentos Asociados por cercanía", "").strip()
-        include_base = not (sup.startswith("A") or assoc.startswith("A"))
-
-        # Si no incluimos base_id y no hay otros T…, saltamos la fila
-        other_ts = [row.get(col, "").strip() for col in ["Monumentos superiores", "Monumentos Asociados por cercanía"] if row.get(col, "").strip().startswith("T")]
-        if not include_base and not other_ts:
-            continue
-
-        # Construir lista de IDs
-        ids = set()
-        if include_base:
-            # sólo agregamos el ID propio si no empieza A en ninguno de los dos campos
-            ids.add(base_id)
-
-        for col in ["Monumentos superiores", "Monumentos Asociados por cercanía"]:
-            val = row.get(col, "").strip()
-            if val.startswith("T"):
-                ids.add(val)
-
-        # Si ya procesamos todos esos IDs, lo saltamos
-        if ids & handled_ids:
-            continue
-
-        # Marcar todos como manejados
-        handled_ids.update(ids)
-
-        # Ordenar para evitar duplicados en distinto orden
-        sorted_ids = sorted(ids)
-        combo_key = tuple(sorted_ids)
-        if combo_key in created_combos:
-            continue
-        created_combos.add(combo_key)
-
-        # Nombre de carpeta
-        folder_name = ", ".join(sorted_ids)
-
-        # Elegir carpeta padre
-        tipo = row.get("Tipo de intervención", "").strip()
-        if tipo == "Excavación":
-            base = os.path.join(RUTA_PRINCIPAL, "Excavación por ID Monumento")
-        elif tipo == "Registro único":
-            base = os.path.join(RUTA_PRINCIPAL, "Registros únicos")
-        else:
-            print(f"⚠️ Tipo desconocido '{tipo}' para ID {base_id}, se omite.")
-            continue
-
-        ruta_sub = os.path.join(base, folder_name)
-        os.makedirs(ruta_sub, exist_ok=True)
-        print(f"✅ Subcarpeta creada: {ruta_sub}")
-
-# =============================================================================
-# Paso 5: ENCARPETAR ARCHIVOS EN "Excavación por ID Monumento" Y "Registros únicos"
-# =============================================================================
-import os
-import re
-import shutil
-
-def step5_encarpetar_archivos():
-    if not RUTA_PRINCIPAL:
-        raise ValueError("RUTA_PRINCIPAL no está definida")
-    print("\n--- Paso 5: Encarpetar Archivos ---")
-    carpeta_excavacion = os.path.join(RUTA_PRINCIPAL, "Excavación por ID Monumento")
-    carpeta_registros = os.path.join(RUTA_PRINCIPAL, "Registros únicos")
-
-    def procesar_carpeta(carpeta):
-        print(f"\nProcesando en: {carpeta}")
-        # 1) Construyo mapa identificador → ruta de subcarpeta
-        mapa = {}
-        for sub in os.listdir(carpeta):
-            ruta_sub = os.path.join(carpeta, sub)
-            if not os.path.isdir(ruta_sub):
-                continue
-            for id_ in [i.strip() for i in sub.split(",")]:
-                if id_:
-                    mapa[id_] = ruta_sub
-        print(f"  Mapeados {len(mapa)} IDs a subcarpeta.")
-
-        # 2) Recorrer PDFs en la raíz de 'carpeta'
-        for nombre in os.listdir(carpeta):
-            if not nombre.lower().endswith(".pdf"):
-                continue
-            ruta_pdf = os.path.join(carpeta, nombre)
-            stem = os.path.splitext(nombre)[0]
-
-            # Extraigo T##_##### aunque haya guiones bajos contiguos
-            ids_en_nombre = re.findall(r"T\d+_\d+", stem)
-            if not ids_en_nombre:
-                print(f"⚠️ No hay IDs en '{nombre}', no se copia ni elimina.")
-                continue
-
-            # 3) Copiar a cada subcarpeta encontrada
-            copiado_al_menos_una_vez = False
-            for id_ in ids_en_nombre:
-                if id_ in mapa:
-                    destino = mapa[id_]
-                    ruta_destino = os.path.join(destino, nombre)
-                    if not os.path.exists(ruta_destino):
-                        shutil.copy2(ruta_pdf, ruta_destino)
-                        print(f"✅ Copiado: {nombre} → {destino}")
-                    else:
-                        print(f"⚠️ Ya existe en {destino}: {nombre}")
-                    copiado_al_menos_una_vez = True
-                else:
-                    print(f"⚠️ Sin carpeta para ID '{id_}' (archivo {nombre})")
-
-            # 4) Si al menos se copió una vez, elimino el original
-            if copiado_al_menos_una_vez:
-                try:
-                    os.remove(ruta_pdf)
-                    print(f"🗑️ Eliminado original: {ruta_pdf}")
-                except Exception as e:
-                    print(f"❌ No se pudo eliminar {ruta_pdf}: {e}")
-
-    # Ejecutar en ambas carpetas si existen
-    if os.path.isdir(carpeta_excavacion):
-        procesar_carpeta(carpeta_excavacion)
-    else:
-        print(f"❌ No existe: {carpeta_excavacion}")
-
-    if os.path.isdir(carpeta_registros):
-        procesar_carpeta(carpeta_registros)
-    else:
-        print(f"❌ No existe: {carpeta_registros}")
-
-    print("\n🎉 Paso 5 completado.")
-
-
-# =============================================================================
-# Paso 6: VERIFICACIÓN DE ARCHIVOS EN LA CARPETA PRINCIPAL
-# =============================================================================
-def step6_verificacion_archivos():
-    if not RUTA_PRINCIPAL or not EXCEL_PATH:
-        raise ValueError("Debe definir RUTA_PRINCIPAL y EXCEL_PATH")
-    print("\n--- Paso 6: Verificación de Archivos ---")
-    
-    # Rutas para la verificación
-    prospection_dir = os.path.join(RUTA_PRINCIPAL, "Prospección")
-    excavation_id_dir = os.path.join(RUTA_PRINCIPAL, "Excavación por ID Monumento")
-    registros_unicos_dir = os.path.join(RUTA_PRINCIPAL, "Registros únicos")
-    
-    expected_suffixes = [
-        "Introducción.pdf",
-        "Ficha de excavación.pdf",
-        "Dibujos arquitectónicos.pdf",
-        "Registro de capas.pdf",
-        "Registro de fotogrametría.pdf",
-        "Registro de materiales arqueológicos.pdf",
-        "Registros arqueológicos.pdf"
-    ]
-    
-    def verify_prospection_files(EXCEL_PATH):
-        try:
-            df = pd.read_excel(EXCEL_PATH, engine='openpyxl', dtype=str)
-            if "ID Monumento" not in df.columns or "Nombre Sitio" not in df.columns:
-                print("❌ El archivo Excel no contiene las columnas esperadas (ID Monumento y Nombre Sitio).")
-                return
-            # Se filtran los registros que correspondan al nombre de la carpeta principal
-            df_filtered = df[df["Nombre Sitio"] == os.path.basename(RUTA_PRINCIPAL)]
-            expected_files = set(df_filtered["ID Monumento"].dropna().astype(str) + ".pdf")
-            existing_files = set(f for f in os.listdir(prospection_dir) if f.endswith(".pdf"))
-            missing_files = expected_files - existing_files
-            if missing_files:
-                print("❌ Faltan archivos en Prospección:")
-                for missing in missing_files:
-                    print(f"   - {missing}")
-            extra_files = existing_files - expected_files
-            if extra_files:
-                print("🚨 Archivos adicionales encontrados en Prospección:")
-                for extra in extra_files:
-                    print(f"   - {extra}")
-            if not missing_files and not extra_files:
-                print("✅ Todos los archivos esperados están en la carpeta Prospección.")
-        except Exception as e:
-            print(f"❌ Error al procesar el archivo Excel: {e}")
-    
-    # Ajusta la ruta del Excel según corresponda
-    verify_prospection_files(EXCEL_PATH)
-    
-    
-    # --- Archivos fuera de subcarpetas en Excavación por ID ---
-    sueltos = [
-        f for f in os.listdir(excavation_id_dir)
-        if os.path.isfile(os.path.join(excavation_id_dir, f)) and f.lower().endswith(".pdf")
-    ]
-    if sueltos:
-        print("🚨 Archivos fuera de subcarpetas encontrados en 'Excavación por ID Monumento':")
-        for f in sueltos:
-            print(f"   - {f}")
-    else:
-        print("✅ No hay archivos fuera de las subcarpetas en 'Excavación por ID Monumento'.")
-    
-    # --- Verificación dentro de cada subcarpeta ---
-    for folder in os.listdir(excavation_id_dir):
-        folder_path = os.path.join(excavation_id_dir, folder)
-        if not os.path.isdir(folder_path):
-            continue
-        
-        print(f"\n🔍 Verificando carpeta: {folder}")
-        found_files    = defaultdict(list)
-        extra_files    = []
-        files_in_folder = [f for f in os.listdir(folder_path) if f.lower().endswith(".pdf")]
-        
-        # 1) Clasificar cada PDF según suffix
-        for f in files_in_folder:
-            matched = False
-            for suffix in expected_suffixes:
-                if f.endswith(suffix):
-                    found_files[suffix].append(f)
-                    matched = True
-                    break
-            if not matched:
-                extra_files.append(f)
-        
-        # 2) Detectar faltantes
-        missing = [s for s in expected_suffixes if s not in found_files]
-        if missing:
-            print("❌ Faltan archivos:")
-            for m in missing:
-                print(f"   - {m}")
-        
-        # 3) Detectar duplicados
-        dupes = {s: lst for s, lst in found_files.items() if len(lst) > 1}
-        if dupes:
-            print("⚠️ Archivos duplicados encontrados:")
-            for suf, lst in dupes.items():
-                print(f"   - {suf}: {', '.join(lst)}")
-        
-        # 4) Detectar extras
-        if extra_files:
-            print("🚨 Archivos adicionales encontrados:")
-            for e in extra_files:
-                print(f"   - {e}")
-        
-        if not (missing or dupes or extra_files):
-            print("✅ Todo está en orden en esta carpeta.")
-    
-    
-    # VERIFICACIÓN PARA "REGISTROS ÚNICOS"
-    print("\n--- Verificando la carpeta 'Registros únicos' ---")
-    if os.path.exists(registros_unicos_dir):
-        # 1. Verificar archivos PDF fuera de subcarpetas en "Registros únicos"
-        archivos_sueltos = [f for f in os.listdir(registros_unicos_dir) 
-                             if os.path.isfile(os.path.join(registros_unicos_dir, f)) and f.endswith(".pdf")]
-        if archivos_sueltos:
-            print("🚨 Archivos fuera de subcarpetas encontrados en 'Registros únicos':")
-            for archivo in archivos_sueltos:
-                print(f"   - {archivo}")
-        else:
-            print("✅ No hay archivos fuera de subcarpetas en 'Registros únicos'.")
-        
-        # 2. Verificar que cada subcarpeta cuyo nombre inicie con "T" tenga al menos un PDF
-        for folder in os.listdir(registros_unicos_dir):
-            folder_path = os.path.join(registros_unicos_dir, folder)
-            if os.path.isdir(folder_path) and folder.startswith("T"):
-                pdfs_en_folder = [f for f in os.listdir(folder_path) if f.endswith(".pdf")]
-                if not pdfs_en_folder:
-                    print(f"❌ ALERTA: La subcarpeta '{folder}' no contiene ningún documento PDF.")
-                else:
-                    print(f"✅ La subcarpeta '{folder}' tiene {len(pdfs_en_folder)} documento(s) PDF.")
-    else:
-        print(f"❌ La carpeta 'Registros únicos' no existe en {RUTA_PRINCIPAL}")
-    
-    print("\n🎉 Verificación completada en la carpeta principal.")
-
-# =============================================================================
-# Paso 7: CREAR SUBCARPETA "Introducción general" y MOVER el archivo "IntroduccionGeneral.pdf"
-# =============================================================================
-def step7_encarpetar_introduccion_general():
-    if not RUTA_PRINCIPAL:
-        raise ValueError("RUTA_PRINCIPAL no está definida")
-    print("\n--- Paso 7: Encarpetar Introducción General ---")
-    
-    # Ruta del archivo "IntroduccionGeneral.pdf" en la carpeta principal
-    archivo_introduccion = os.path.join(RUTA_PRINCIPAL, "IntroduccionGeneral.pdf")
-    
-    # Ruta de la subcarpeta "Introducción general" dentro de la carpeta principal
-    carpeta_introduccion_general = os.path.join(RUTA_PRINCIPAL, "Introducción general")
-    
-    # Verificar si el archivo existe en la carpeta principal
-    if os.path.exists(archivo_introduccion):
-        # Crear la subcarpeta "Introducción general" si no existe
-        os.makedirs(carpeta_introduccion_general, exist_ok=True)
-        
-        # Mover el archivo a la subcarpeta
-        nuevo_destino = os.path.join(carpeta_introduccion_general, "IntroduccionGeneral.pdf")
-        if os.path.exists(nuevo_destino):
-            print(f"⚠️ El archivo ya existe en '{carpeta_introduccion_general}': IntroduccionGeneral.pdf")
-        else:
-            shutil.move(archivo_introduccion, nuevo_destino)
-            print(f"✅ Movido 'IntroduccionGeneral.pdf' a '{carpeta_introduccion_general}'")
-    else:
-        print(f"❌ No se encontró 'IntroduccionGeneral.pdf' en {RUTA_PRINCIPAL}")
-
-# =============================================================================
-# Paso 8: BUSCAR ARCHIVOS PDF VACÍOS
-# =============================================================================
-def step8_buscar_pdfs_vacios():
-    if not RUTA_PRINCIPAL:
-        raise ValueError("RUTA_PRINCIPAL no está definida")
-    print("\n--- Paso 8: Buscar PDFs Vacíos ---")
-    """
-    Determina si un PDF es vacío.
-    Se considera vacío si el tamaño del archivo es 0 bytes o
-    si al leerlo no se detectan páginas.
-    """
-    try:
-        if os.path.getsize(ruta_pdf) == 0:
-            return True
-        with open(ruta_pdf, 'rb') as archivo:
-            lector = PyPDF2.PdfReader(archivo)
-            if len(lector.pages) == 0:
-                return True
-    except Exception as e:
-        print(f"Error al leer {ruta_pdf}: {e}")
-    return False
-
-def buscar_pdfs_vacios(carpeta_raiz):
-    """
-    Recorre la carpeta y subcarpetas para encontrar archivos PDF vacíos.
-    """
-    pdfs_vacios = []
-    for ruta_directorio, subdirectorios, archivos in os.walk(carpeta_raiz):
-        for archivo in archivos:
-            if archivo.lower().endswith('.pdf'):
-                ruta_completa = os.path.join(ruta_directorio, archivo)
-                if es_pdf_vacio(ruta_completa):
-                    pdfs_vacios.append(ruta_completa)
-    return pdfs_vacios
-
-def step8_buscar_pdfs_vacios():
-    print("\n--- Paso 8: Buscar PDFs Vacíos ---")
-    pdfs_vacios = buscar_pdfs_vacios(RUTA_PRINCIPAL)
-    if pdfs_vacios:
-        print("Se encontraron los siguientes archivos PDF vacíos:")
-        for ruta in pdfs_vacios:
-            print(ruta)
-    else:
-        print("No se encontraron archivos PDF vacíos.")
-
-# =============================================================================
-# Función principal
-# =============================================================================
-def main():
-    # Validar
-    if RUTA_PRINCIPAL is None or EXCEL_PATH is None:
-        raise ValueError("RUTA_PRINCIPAL y EXCEL_PATH deben asignarse antes de ejecutar main()")
-    # Llamadas secuenciales
-    step1_renombrar_carpetas()
-    step2_renombrar_archivos()
-    step3_mover_archivos_renombrados()
-    step4_crear_subcarpetas()
-    step5_encarpetar_archivos()
-    step6_verificacion_archivos()
-    step7_encarpetar_introduccion_general()
-    step8_buscar_pdfs_vacios()
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Script único que ejecuta el siguiente flujo de trabajo:
+1. Renombrar carpetas
+2. Renombrar archivos PDF en la carpeta "Excavación" y "Registros únicos"
+3. Mover archivos renombrados a "Excavación por ID Monumento"
+4. Crear subcarpetas en "Excavación por ID Monumento" y "Registros únicos"
+5. Encarpetar archivos en "Excavación por ID Monumento"  y "Registros únicos"
+6. Verificar archivos en la carpeta principal
+7. Crear subcarpeta "Introducción general" y mover el archivo "IntroduccionGeneral.pdf"
+8. Buscar archivos PDF vacíos
+9. Ensamblar un informe PDF por monumento (y uno del sitio) con marcadores por sección
+
+IMPORTANTE:
+-La carpeta principal se debe nombrar de la misma manera que la columna "Nombre Sitio" de la base de datos (excel)
+- Solo se define la ruta principal una vez (variable RUTA_PRINCIPAL).
+- A partir de RUTA_PRINCIPAL se construyen las rutas para cada paso.
+- También se puede pasar un ContextoSitio a main() y a cada paso en lugar de usar
+  las variables globales; procesar_lote() ejecuta todos los sitios de una carpeta.
+- `python miscript.py --site ... --excel ... --vigilar` deja el script vigilando
+  el sitio y procesa solo los PDF que van llegando (ver vigilar_sitio).
+- Los pasos que modifican el árbol primero planifican sus operaciones y luego
+  las aplican (ver ejecutar_plan); `python miscript.py --site ... --excel ... --dry-run`
+  muestra el plan completo sin tocar el disco.
+- `--steps 1-5,8` ejecuta solo esos pasos y `--jobs N` ejecuta a la vez los pasos
+  que no dependen entre sí (ver DEPENDENCIAS).
+"""
+
+import os
+import contextlib
+import csv
+import errno
+import functools
+import hashlib
+import io
+import json
+import mmap
+import multiprocessing
+import re
+import select
+import shutil
+import sqlite3
+import struct
+import sys
+import threading
+import time
+import traceback
+import openpyxl
+import pandas as pd
+from collections import defaultdict, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
+import PyPDF2
+from PyPDF2.generic import (
+    ArrayObject, DecodedStreamObject, DictionaryObject, IndirectObject, NameObject, NullObject, NumberObject,
+    StreamObject, create_string_object,
+)
+# =============================================================================
+# DEFINICIÓN DE LA RUTA PRINCIPAL (única definición) y # RUTAS DE ARCHIVOS
+# =============================================================================
+RUTA_PRINCIPAL = None  # ruta base para procesar carpetas y PDFs
+EXCEL_PATH     = None  # ruta al archivo Excel para step4
+
+# =============================================================================
+# INVENTARIO DEL SITIO (un solo recorrido con os.scandir)
+# =============================================================================
+def _clave(ruta):
+    """Clave normalizada de una ruta (insensible a mayúsculas en Windows)."""
+    return os.path.normcase(os.path.normpath(ruta))
+
+
+FICLONE = 0x40049409  # ioctl de Linux para clonar archivos (btrfs, XFS, ...)
+
+
+def _reflink(origen, destino):
+    """
+    Crea `destino` como clon copy-on-write de `origen` (sin copiar datos).
+    Lanza OSError si el sistema de archivos o la plataforma no lo permiten.
+    """
+    if sys.platform.startswith("linux"):
+        import fcntl
+        with open(origen, "rb") as src:
+            fd = os.open(destino, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+            try:
+                fcntl.ioctl(fd, FICLONE, src.fileno())
+            except OSError:
+                os.close(fd)
+                os.remove(destino)
+                raise
+            os.close(fd)
+        shutil.copystat(origen, destino)
+    elif sys.platform == "darwin":
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        if libc.clonefile(os.fsencode(origen), os.fsencode(destino), 0) != 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), destino)
+    else:
+        raise OSError(errno.ENOTSUP, "reflink no disponible en esta plataforma", destino)
+
+
+class InventarioSitio:
+    """
+    Inventario en memoria del árbol de carpetas del sitio.
+
+    Se construye una sola vez con os.scandir y cada paso lo actualiza al
+    renombrar, mover, copiar o eliminar archivos, de modo que los pasos
+    siguientes consultan el inventario en lugar de volver al disco.
+    """
+
+    def __init__(self, raiz):
+        self.raiz = os.path.normpath(raiz)
+        # clave de carpeta -> {"ruta": ruta real, "carpetas": {clave: nombre}, "archivos": {clave: nombre}}
+        self._carpetas = {}
+        self.diario = None  # Diario donde se registran las operaciones en disco (opcional)
+        self._hilo = threading.local()
+        self._lock = threading.RLock()  # el ejecutor de planes actualiza el inventario desde varios hilos
+        self._escanear()
+
+    @property
+    def contadores(self):
+        """Contadores del paso en curso (opcional); cada hilo tiene los suyos, ver ContextoSitio.paso."""
+        return getattr(self._hilo, "contadores", None)
+
+    @contadores.setter
+    def contadores(self, contadores):
+        self._hilo.contadores = contadores
+
+    def copia(self):
+        """Copia solo en memoria (sin diario) para simular un plan sin tocar el disco."""
+        nueva = InventarioSitio.__new__(InventarioSitio)
+        nueva.raiz = self.raiz
+        nueva.diario = None
+        nueva._hilo = threading.local()
+        nueva._lock = threading.RLock()
+        with self._lock:
+            nueva._carpetas = {
+                clave: {"ruta": nodo["ruta"], "carpetas": dict(nodo["carpetas"]), "archivos": dict(nodo["archivos"])}
+                for clave, nodo in self._carpetas.items()
+            }
+        return nueva
+
+    def firma(self):
+        """
+        Huella de la carpeta raíz en disco (dispositivo, inodo y fecha de
+        modificación, que cambia al crear, renombrar o eliminar algo en ella),
+        o None si ya no existe. Es una sola consulta al disco: no ve los
+        cambios dentro de las subcarpetas, así que quien reutiliza un
+        inventario por su firma debe poder pedir que se vuelva a escanear.
+        """
+        try:
+            st = os.stat(self.raiz)
+        except OSError:
+            return None
+        return st.st_dev, st.st_ino, st.st_mtime_ns
+
+    def reescanear(self):
+        """Vuelve a leer todo el árbol desde el disco (tras cambios que no pasaron por el inventario)."""
+        with self._lock:
+            self._carpetas = {}
+            self._escanear()
+
+    # ------------------------------------------------------------------ lectura
+    def _escanear(self):
+        pendientes = [self.raiz]
+        while pendientes:
+            ruta = pendientes.pop()
+            nodo = self._nodo_nuevo(ruta)
+            try:
+                with os.scandir(ruta) as it:
+                    for entrada in it:
+                        if entrada.is_dir(follow_symlinks=False):
+                            nodo["carpetas"][os.path.normcase(entrada.name)] = entrada.name
+                            pendientes.append(entrada.path)
+                        elif entrada.is_file():
+                            nodo["archivos"][os.path.normcase(entrada.name)] = entrada.name
+            except (FileNotFoundError, NotADirectoryError):
+                del self._carpetas[_clave(ruta)]
+
+    def _nodo_nuevo(self, ruta):
+        nodo = {"ruta": os.path.normpath(ruta), "carpetas": {}, "archivos": {}}
+        self._carpetas[_clave(ruta)] = nodo
+        return nodo
+
+    def _nodo(self, carpeta):
+        nodo = self._carpetas.get(_clave(carpeta))
+        if nodo is None:
+            raise FileNotFoundError(f"No existe la carpeta en el inventario: {carpeta}")
+        return nodo
+
+    def _dentro(self, ruta):
+        clave, raiz = _clave(ruta), _clave(self.raiz)
+        return clave == raiz or clave.startswith(raiz.rstrip(os.sep) + os.sep)
+
+    def es_carpeta(self, ruta):
+        if not self._dentro(ruta):
+            return os.path.isdir(ruta)
+        return _clave(ruta) in self._carpetas
+
+    def es_archivo(self, ruta):
+        if not self._dentro(ruta):
+            return os.path.isfile(ruta)
+        padre = self._carpetas.get(_clave(os.path.dirname(ruta)))
+        return padre is not None and os.path.normcase(os.path.basename(ruta)) in padre["archivos"]
+
+    def existe(self, ruta):
+        return self.es_carpeta(ruta) or self.es_archivo(ruta)
+
+    def archivos(self, carpeta):
+        """Nombres de los archivos directamente dentro de `carpeta` (como os.listdir)."""
+        return list(self._nodo(carpeta)["archivos"].values())
+
+    def subcarpetas(self, carpeta):
+        """Nombres de las subcarpetas directas de `carpeta`."""
+        return list(self._nodo(carpeta)["carpetas"].values())
+
+    def listar(self, carpeta):
+        return self.subcarpetas(carpeta) + self.archivos(carpeta)
+
+    def contar_archivos(self, carpeta, extension=".pdf"):
+        """Número de archivos con `extension` en `carpeta` y sus subcarpetas."""
+        return sum(
+            1 for _, _, archivos in self.recorrer(carpeta) for a in archivos if a.endswith(extension)
+        )
+
+    def recorrer(self, carpeta, topdown=True):
+        """Equivalente a os.walk sobre el inventario."""
+        if _clave(carpeta) not in self._carpetas:
+            return
+        if not topdown:
+            # Se toma una instantánea para poder renombrar carpetas durante el recorrido
+            orden = []
+            with self._lock:
+                pila = [(self._nodo(carpeta)["ruta"], False)]
+                while pila:
+                    ruta, visitada = pila.pop()
+                    nodo = self._carpetas[_clave(ruta)]
+                    if visitada:
+                        orden.append((ruta, list(nodo["carpetas"].values()), list(nodo["archivos"].values())))
+                        continue
+                    pila.append((ruta, True))
+                    for sub in reversed(list(nodo["carpetas"].values())):
+                        pila.append((os.path.join(ruta, sub), False))
+            yield from orden
+            return
+        pila = [self._nodo(carpeta)["ruta"]]
+        while pila:
+            ruta = pila.pop()
+            nodo = self._carpetas.get(_clave(ruta))
+            if nodo is None:
+                continue
+            dirs = list(nodo["carpetas"].values())
+            yield ruta, dirs, list(nodo["archivos"].values())
+            pila.extend(os.path.join(ruta, d) for d in reversed(dirs))
+
+    # ------------------------------------------- actualización solo en memoria
+    def registrar_archivo(self, ruta):
+        with self._lock:
+            padre = self._carpetas.get(_clave(os.path.dirname(ruta)))
+            if padre is not None:
+                nombre = os.path.basename(ruta)
+                padre["archivos"][os.path.normcase(nombre)] = nombre
+
+    def registrar_eliminado(self, ruta):
+        with self._lock:
+            padre = self._carpetas.get(_clave(os.path.dirname(ruta)))
+            if padre is not None:
+                padre["archivos"].pop(os.path.normcase(os.path.basename(ruta)), None)
+
+    def registrar_carpeta(self, ruta):
+        with self._lock:
+            ruta = os.path.normpath(ruta)
+            if not self._dentro(ruta) or _clave(ruta) in self._carpetas:
+                return
+            padre = os.path.dirname(ruta)
+            self.registrar_carpeta(padre)
+            self._nodo_nuevo(ruta)
+            nodo_padre = self._carpetas.get(_clave(padre))
+            if nodo_padre is not None:
+                nombre = os.path.basename(ruta)
+                nodo_padre["carpetas"][os.path.normcase(nombre)] = nombre
+
+    def registrar_renombrado(self, origen, destino):
+        with self._lock:
+            origen, destino = os.path.normpath(origen), os.path.normpath(destino)
+            clave_origen = _clave(origen)
+            if clave_origen not in self._carpetas:
+                self.registrar_eliminado(origen)
+                self.registrar_archivo(destino)
+                return
+            # Carpeta: se re-indexan todas las descendientes
+            prefijo = clave_origen.rstrip(os.sep) + os.sep
+            movidas = {c: n for c, n in self._carpetas.items() if c == clave_origen or c.startswith(prefijo)}
+            for clave, nodo in movidas.items():
+                del self._carpetas[clave]
+                nodo["ruta"] = destino + nodo["ruta"][len(origen):]
+                self._carpetas[_clave(nodo["ruta"])] = nodo
+            padre_origen = self._carpetas.get(_clave(os.path.dirname(origen)))
+            if padre_origen is not None:
+                padre_origen["carpetas"].pop(os.path.normcase(os.path.basename(origen)), None)
+            padre_destino = self._carpetas.get(_clave(os.path.dirname(destino)))
+            if padre_destino is not None:
+                nombre = os.path.basename(destino)
+                padre_destino["carpetas"][os.path.normcase(nombre)] = nombre
+
+    # ----------------------------------------- operaciones en disco + inventario
+    def _operacion(self, accion, origen, destino=None):
+        if self.diario is None:
+            return contextlib.nullcontext()
+        return self.diario.operacion(accion, origen, destino)
+
+    def _contar(self, clave, n=1):
+        if self.contadores is not None:
+            self.contadores.sumar(clave, n)
+
+    def renombrar(self, origen, destino):
+        with self._operacion("renombrar", origen, destino):
+            os.rename(origen, destino)
+        self.registrar_renombrado(origen, destino)
+        self._contar("renombrados")
+
+    def mover(self, origen, destino):
+        with self._operacion("mover", origen, destino):
+            shutil.move(origen, destino)
+        self.registrar_renombrado(origen, destino)
+        self._contar("movidos")
+
+    def copiar(self, origen, destino):
+        with self._operacion("copiar", origen, destino):
+            shutil.copy2(origen, destino)
+        self.registrar_archivo(destino)
+        self._contar("copiados")
+        self._contar("bytes_copiados", os.path.getsize(destino))
+
+    def enlazar(self, origen, destino, metodos=("reflink", "hardlink")):
+        """
+        Crea `destino` con el contenido de `origen` sin duplicar datos si se puede.
+        Prueba `metodos` en orden y si ninguno funciona copia con shutil.copy2.
+        Devuelve el método usado: "reflink", "hardlink" o "copia".
+        """
+        usado = "copia"
+        with self._operacion("enlazar", origen, destino):
+            for metodo in metodos:
+                try:
+                    if metodo == "reflink":
+                        _reflink(origen, destino)
+                    else:
+                        os.link(origen, destino)
+                except (OSError, AttributeError):
+                    continue
+                usado = metodo
+                break
+            else:
+                shutil.copy2(origen, destino)
+        self.registrar_archivo(destino)
+        if usado == "copia":
+            self._contar("copiados")
+            self._contar("bytes_copiados", os.path.getsize(destino))
+        else:
+            self._contar("enlazados")
+        return usado
+
+    def eliminar(self, ruta):
+        with self._operacion("eliminar", ruta):
+            os.remove(ruta)
+        self.registrar_eliminado(ruta)
+        self._contar("eliminados")
+
+    def crear_carpeta(self, ruta):
+        with self._operacion("crear_carpeta", ruta):
+            os.makedirs(ruta, exist_ok=True)
+        self.registrar_carpeta(ruta)
+        self._contar("carpetas_creadas")
+
+
+# =============================================================================
+# DIARIO DE OPERACIONES (reanudar ejecuciones interrumpidas)
+# =============================================================================
+DIARIO        = True                     # registrar las operaciones para poder reanudar
+NOMBRE_DIARIO = ".informes_diario.jsonl"  # archivo del diario en la carpeta principal
+
+
+class Diario:
+    """
+    Diario de escritura anticipada de una ejecución sobre un sitio.
+
+    Antes de cada operación en disco (renombrar, mover, copiar, enlazar,
+    eliminar, crear carpeta) se escribe y sincroniza un registro "plan"; al
+    terminarla se agrega "hecho". ejecutar_plan registra de una vez todas
+    las operaciones de una tanda (ver planificar), con una sola
+    sincronización. Al terminar cada paso se registra como completado.
+    Si la ejecución se interrumpe, la siguiente:
+      - omite los pasos ya completados,
+      - revisa las operaciones planificadas sin confirmar y elimina los
+        destinos que pudieron quedar a medio copiar,
+      - vuelve a ejecutar el paso interrumpido, que solo hace lo que falta
+        porque parte del estado real del disco.
+    Si el Excel cambió desde la ejecución interrumpida no se omite ningún paso.
+    """
+
+    def __init__(self, raiz, clave_excel=None, log=print):
+        self.raiz = raiz
+        self.ruta = os.path.join(raiz, NOMBRE_DIARIO)
+        self.log = log
+        self.pasos_hechos = set()
+        self._lock = threading.Lock()
+        self._siguiente = 0
+        self._planificadas = {}  # (acción, origen, destino) → número de operación ya registrada
+        registros = self._leer()
+        if registros:
+            self._reanudar(registros, clave_excel)
+        self._f = open(self.ruta, "a", encoding="utf-8")
+        if not registros:
+            self._escribir({"inicio": time.time(), "clave_excel": clave_excel}, sincronizar=True)
+
+    def _leer(self):
+        try:
+            with open(self.ruta, encoding="utf-8") as f:
+                lineas = f.readlines()
+        except FileNotFoundError:
+            return []
+        registros = []
+        for linea in lineas:
+            try:
+                registros.append(json.loads(linea))
+            except ValueError:
+                pass  # última línea cortada por la interrupción
+        return registros
+
+    def _reanudar(self, registros, clave_excel):
+        ops = {}
+        for r in registros:
+            if "paso" in r:
+                self.pasos_hechos.add(r["paso"])
+            elif r.get("estado") == "plan":
+                for o in r.get("ops", [r]):  # un registro por operación o uno por tanda
+                    ops[o["op"]] = o
+                    self._siguiente = max(self._siguiente, o["op"] + 1)
+            elif r.get("estado") == "hecho":
+                ops.pop(r["op"], None)
+        if registros[0].get("clave_excel") != clave_excel:
+            self.log("⚠️ El Excel cambió desde la ejecución interrumpida; se repiten todos los pasos.")
+            self.pasos_hechos.clear()
+        self.log(f"🔁 Reanudando ejecución interrumpida (pasos completados: "
+                 f"{', '.join(map(str, sorted(self.pasos_hechos))) or 'ninguno'}).")
+        for r in ops.values():
+            self._reparar(r)
+
+    def _reparar(self, r):
+        """Deshace lo que una operación sin confirmar pudo dejar a medias."""
+        origen = os.path.join(self.raiz, r["origen"])
+        destino = os.path.join(self.raiz, r["destino"]) if r.get("destino") else None
+        # Una copia (o un movimiento entre unidades, que copia y luego borra) interrumpida
+        # puede dejar el destino incompleto mientras el origen sigue intacto.
+        if r["accion"] in ("mover", "copiar", "enlazar") and destino \
+                and os.path.isfile(origen) and os.path.isfile(destino):
+            os.remove(destino)
+            self.log(f"🧹 Eliminado destino incompleto: {destino}")
+
+    def _escribir(self, registro, sincronizar=False):
+        with self._lock:
+            self._f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+            self._f.flush()
+        # Fuera del cerrojo: los hilos de ejecutar_plan siguen escribiendo mientras otro sincroniza
+        if sincronizar:
+            os.fsync(self._f.fileno())
+
+    def _relativa(self, ruta):
+        return os.path.relpath(ruta, self.raiz) if ruta else None
+
+    def planificar(self, operaciones):
+        """
+        Registra el "plan" de varias operaciones (Operacion de un plan) en un
+        solo registro y con una sola sincronización: en una unidad de red
+        cada fsync es un viaje de ida y vuelta. operacion() reconoce después
+        las ya registradas y solo agrega su "hecho".
+        """
+        ops = []
+        with self._lock:
+            for op in operaciones:
+                registro = {"op": self._siguiente, "accion": op.accion,
+                            "origen": self._relativa(op.origen), "destino": self._relativa(op.destino)}
+                self._planificadas[(registro["accion"], registro["origen"], registro["destino"])] = self._siguiente
+                self._siguiente += 1
+                ops.append(registro)
+        if ops:
+            self._escribir({"ops": ops, "estado": "plan"}, sincronizar=True)
+
+    @contextlib.contextmanager
+    def operacion(self, accion, origen, destino=None):
+        origen, destino = self._relativa(origen), self._relativa(destino)
+        with self._lock:
+            op = self._planificadas.pop((accion, origen, destino), None)
+            registrada = op is not None
+            if not registrada:
+                op = self._siguiente
+                self._siguiente += 1
+        if not registrada:
+            self._escribir({"op": op, "accion": accion, "origen": origen,
+                            "destino": destino, "estado": "plan"}, sincronizar=True)
+        yield
+        self._escribir({"op": op, "estado": "hecho"})
+
+    def paso_completado(self, numero):
+        self.pasos_hechos.add(numero)
+        self._escribir({"paso": numero}, sincronizar=True)
+
+    def cerrar(self, terminado=False, inventario=None):
+        """
+        Cierra el diario; si la ejecución terminó completa, lo elimina (a
+        través de `inventario`, si se indica, para que deje de listarlo).
+        """
+        self._f.close()
+        if terminado:
+            if inventario is not None:
+                inventario.eliminar(self.ruta)
+            else:
+                os.remove(self.ruta)
+
+
+# =============================================================================
+# MÉTRICAS POR PASO
+# =============================================================================
+METRICAS_JSONL   = None  # archivo .jsonl al que se agregan las métricas de cada paso (None = no se guardan)
+PERFILAR         = None  # None, "cprofile" o "tracemalloc": perfil opcional de cada paso
+CARPETA_PERFILES = None  # carpeta de los .prof de cProfile (None = carpeta actual)
+
+CONTADORES = (
+    "escaneados", "renombrados", "movidos", "copiados", "enlazados",
+    "eliminados", "carpetas_creadas", "bytes_copiados", "errores",
+)
+
+
+class Contadores:
+    """Contadores de un paso; los incrementan los pasos y el inventario, también desde varios hilos."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.valores = dict.fromkeys(CONTADORES, 0)
+
+    def sumar(self, clave, n=1):
+        with self._lock:
+            self.valores[clave] += n
+
+
+@contextlib.contextmanager
+def medir_paso(ctx, numero, nombre):
+    """
+    Mide un paso: tiempo real, tiempo de CPU del proceso y los Contadores que
+    suman el paso y el inventario. Al terminar agrega el registro a
+    ctx.metricas y, si se indicó ctx.metricas_jsonl, lo escribe como una línea JSON.
+
+    Con ctx.perfilar = "cprofile" guarda el perfil del hilo principal en
+    <carpeta_perfiles>/<sitio>_paso<n>.prof; con "tracemalloc" añade el pico
+    de memoria de Python (sin contar los procesos del paso 8).
+    """
+    contadores = Contadores()
+    ctx.contadores = ctx.inventario.contadores = contadores
+    registro = {"sitio": ctx.sitio, "paso": numero, "nombre": nombre,
+                "inicio": time.strftime("%Y-%m-%dT%H:%M:%S")}
+    perfil = None
+    if ctx.perfilar == "cprofile":
+        import cProfile
+        perfil = cProfile.Profile()
+    elif ctx.perfilar == "tracemalloc":
+        import tracemalloc
+        tracemalloc.start()
+    estado = "error"
+    inicio, inicio_cpu = time.perf_counter(), time.process_time()
+    if perfil is not None:
+        perfil.enable()
+    try:
+        yield contadores
+        estado = "ok"
+    except EjecucionCancelada:
+        estado = "cancelado"
+        raise
+    finally:
+        if perfil is not None:
+            perfil.disable()
+        registro["estado"] = estado
+        registro["duracion"] = round(time.perf_counter() - inicio, 4)
+        registro["cpu"] = round(time.process_time() - inicio_cpu, 4)
+        registro.update(contadores.valores)
+        if ctx.perfilar == "tracemalloc":
+            registro["memoria_pico"] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        if perfil is not None:
+            carpeta = ctx.carpeta_perfiles or os.getcwd()
+            os.makedirs(carpeta, exist_ok=True)
+            registro["perfil"] = os.path.join(carpeta, f"{ctx.sitio}_paso{numero}.prof")
+            perfil.dump_stats(registro["perfil"])
+        ctx.contadores = ctx.inventario.contadores = None
+        ctx.metricas.append(registro)
+        if ctx.metricas_jsonl:
+            with open(ctx.metricas_jsonl, "a", encoding="utf-8") as f:
+                f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+
+
+def tabla_metricas(metricas):
+    """Resumen de las métricas de los pasos como tabla de texto."""
+    cabecera = f"{'Paso':<5}{'Estado':<10}{'Tiempo s':>9}{'CPU s':>8}{'Escan.':>8}{'Renom.':>8}" \
+               f"{'Movid.':>8}{'Copia.':>8}{'Enlaz.':>8}{'Elim.':>7}{'Carp.':>7}{'MB cop.':>9}{'Err.':>6}"
+    lineas = [cabecera, "-" * len(cabecera)]
+    for m in metricas:
+        lineas.append(
+            f"{m['paso']:<5}{m['estado']:<10}{m['duracion']:>9.2f}{m['cpu']:>8.2f}{m['escaneados']:>8}"
+            f"{m['renombrados']:>8}{m['movidos']:>8}{m['copiados']:>8}{m['enlazados']:>8}{m['eliminados']:>7}"
+            f"{m['carpetas_creadas']:>7}{m['bytes_copiados'] / 2**20:>9.1f}{m['errores']:>6}"
+        )
+    return "\n".join(lineas)
+
+
+# =============================================================================
+# CONTEXTO DE EJECUCIÓN DE UN SITIO
+# =============================================================================
+class ContextoSitio:
+    """
+    Lo que necesitan los pasos para trabajar sobre un sitio: la carpeta
+    principal, el Excel (o la BaseDatos ya cargada), el inventario (se
+    escanea al usarlo si no se pasa uno ya construido), las opciones y la
+    función de registro (`log`, por defecto print).
+
+    Cada ejecución usa su propio contexto, así varios sitios pueden
+    procesarse a la vez sin compartir las variables globales del módulo.
+    Las opciones que no se indiquen toman el valor de las variables globales.
+
+    `progreso(paso, hechos, total)` recibe el avance de cada paso y
+    `cancelar` (un threading.Event) permite detener la ejecución: el paso en
+    curso lanza EjecucionCancelada en cuanto lo comprueba.
+
+    Con `log=None` no se escribe el registro legible; las métricas de cada
+    paso quedan en `metricas` (ver medir_paso).
+    """
+
+    def __init__(self, ruta, excel_path=None, base_datos=None, inventario=None, log=print,
+                 estrategia_encarpetado=None, pdf_workers=None, cache_pdf=None, ruta_cache_pdf=None,
+                 progreso=None, cancelar=None, usar_diario=None, io_workers=None,
+                 metricas_jsonl=None, perfilar=None, carpeta_perfiles=None, carpeta_informes=None,
+                 nivel_pdf=None, duplicados=None, colapsar_duplicados=None, ensamblado_workers=None):
+        self.ruta = os.path.normpath(ruta) if ruta else ruta
+        self.excel_path = excel_path
+        self.log = log or (lambda *args, **kwargs: None)
+        self.progreso = progreso
+        self.cancelar = cancelar
+        self._hilo = threading.local()
+        self.estrategia_encarpetado = estrategia_encarpetado or ESTRATEGIA_ENCARPETADO
+        self.pdf_workers = pdf_workers or PDF_WORKERS
+        self.ensamblado_workers = ensamblado_workers or ENSAMBLADO_WORKERS
+        self.cache_pdf = CACHE_PDF if cache_pdf is None else cache_pdf
+        self.ruta_cache_pdf = ruta_cache_pdf
+        self.nivel_pdf = nivel_pdf or NIVEL_PDF
+        self.duplicados = DUPLICADOS if duplicados is None else duplicados
+        self.colapsar_duplicados = COLAPSAR_DUPLICADOS if colapsar_duplicados is None else colapsar_duplicados
+        self.usar_diario = DIARIO if usar_diario is None else usar_diario
+        self.io_workers = io_workers or IO_WORKERS
+        self.metricas_jsonl = metricas_jsonl or METRICAS_JSONL
+        self.perfilar = perfilar or PERFILAR
+        self.carpeta_perfiles = carpeta_perfiles or CARPETA_PERFILES
+        self.carpeta_informes = carpeta_informes or CARPETA_INFORMES
+        self.metricas = []  # un registro por paso ejecutado (ver medir_paso)
+        self.resultados = {}  # número de paso → lo que devolvió (ver main())
+        self._base_datos = base_datos
+        self._inventario = inventario
+        self._indice_rutas = None
+
+    # main() puede ejecutar varios pasos a la vez, cada uno en su hilo: el paso
+    # en curso y sus contadores son del hilo que lo ejecuta
+    @property
+    def paso(self):
+        """Número del paso en curso (lo fija main())."""
+        return getattr(self._hilo, "paso", None)
+
+    @paso.setter
+    def paso(self, numero):
+        self._hilo.paso = numero
+
+    @property
+    def contadores(self):
+        """Contadores del paso en curso (ver medir_paso)."""
+        return getattr(self._hilo, "contadores", None)
+
+    @contadores.setter
+    def contadores(self, contadores):
+        self._hilo.contadores = contadores
+
+    @property
+    def sitio(self):
+        """Nombre del sitio ("Nombre Sitio" en el Excel) = nombre de la carpeta principal."""
+        return os.path.basename(self.ruta)
+
+    @property
+    def inventario(self):
+        if self._inventario is None:
+            self._inventario = InventarioSitio(self.ruta)
+        return self._inventario
+
+    @property
+    def base_datos(self):
+        if self._base_datos is None:
+            # Solo las filas de este sitio: la memoria no crece con el tamaño del Excel
+            self._base_datos = cargar_base_datos(self.excel_path, log=self.log, sitio=self.sitio)
+        return self._base_datos
+
+    @property
+    def indice_rutas(self):
+        """
+        Índice ID → carpeta del paso 4: el que dejó el paso 4 en este contexto,
+        el guardado en la carpeta principal si es del mismo Excel o, si no,
+        uno calculado desde el Excel (vacío si no hay Excel).
+        """
+        if self._indice_rutas is None:
+            clave = self.base_datos.clave if self.tiene_excel() else None
+            indice = IndiceRutas.cargar(os.path.join(self.ruta, NOMBRE_INDICE_RUTAS), clave)
+            if indice is None and self.tiene_excel():
+                df = self.base_datos.sitio(self.sitio)
+                indice = IndiceRutas.desde_grupos(agrupar_monumentos(df, log=lambda *a: None), df, clave)
+            self._indice_rutas = indice or IndiceRutas()
+        return self._indice_rutas
+
+    @indice_rutas.setter
+    def indice_rutas(self, indice):
+        self._indice_rutas = indice
+
+    def tiene_excel(self):
+        return self._base_datos is not None or bool(self.excel_path)
+
+    def contar(self, clave, n=1):
+        """Suma `n` al contador `clave` del paso en curso (si se está midiendo)."""
+        if self.contadores is not None:
+            self.contadores.sumar(clave, n)
+
+    def avance(self, hechos, total):
+        """Informa el avance del paso en curso y comprueba si se pidió cancelar."""
+        if self.cancelar is not None and self.cancelar.is_set():
+            raise EjecucionCancelada(f"Ejecución cancelada durante el paso {self.paso}")
+        if self.progreso is not None:
+            self.progreso(self.paso, hechos, total)
+
+
+class EjecucionCancelada(Exception):
+    """Se pidió detener la ejecución (ContextoSitio.cancelar)."""
+
+
+_CONTEXTO = None  # contexto construido a partir de RUTA_PRINCIPAL y EXCEL_PATH
+
+
+def _contexto(ctx=None):
+    """Devuelve `ctx` o, si no se indica, el contexto de las variables globales."""
+    global _CONTEXTO
+    if ctx is not None:
+        return ctx
+    ruta = os.path.normpath(RUTA_PRINCIPAL) if RUTA_PRINCIPAL else RUTA_PRINCIPAL
+    if _CONTEXTO is None or _CONTEXTO.ruta != ruta or _CONTEXTO.excel_path != EXCEL_PATH:
+        _CONTEXTO = ContextoSitio(RUTA_PRINCIPAL, EXCEL_PATH, ruta_cache_pdf=RUTA_CACHE_PDF)
+    return _CONTEXTO
+
+
+# =============================================================================
+# PLAN DE OPERACIONES: planificar sin tocar el disco y luego ejecutar
+# =============================================================================
+IO_WORKERS = 8  # hilos que aplican las operaciones de un plan (1 = una tras otra)
+
+# Operación planificada por un paso.
+# accion: "renombrar", "mover", "enlazar", "eliminar" o "crear_carpeta" (tocan el disco),
+#         "aviso" (solo un mensaje) o "conflicto" (operación que no se puede aplicar y se omite).
+Operacion = namedtuple("Operacion", ["paso", "accion", "origen", "destino", "mensaje"])
+
+
+def _aviso(paso, mensaje):
+    return Operacion(paso, "aviso", None, None, mensaje)
+
+
+def _conflicto(paso, mensaje):
+    return Operacion(paso, "conflicto", None, None, mensaje)
+
+
+def _simular(inv, op):
+    """Aplica `op` solo al inventario `inv`."""
+    if op.accion in ("renombrar", "mover"):
+        inv.registrar_renombrado(op.origen, op.destino)
+    elif op.accion == "enlazar":
+        inv.registrar_archivo(op.destino)
+    elif op.accion == "eliminar":
+        inv.registrar_eliminado(op.origen)
+    elif op.accion == "crear_carpeta":
+        inv.registrar_carpeta(op.origen)
+
+
+def _validar_plan(inv, operaciones):
+    """
+    Recorre el plan sobre una copia del inventario y separa las operaciones
+    que ya no se pueden aplicar (origen ausente o destino ocupado, p. ej. si
+    el plan se hizo con otro estado del árbol). Devuelve (validas, conflictos).
+    """
+    sim = inv.copia()
+    validas, conflictos = [], []
+    for op in operaciones:
+        if op.accion in ("aviso", "conflicto"):
+            validas.append(op)
+            continue
+        if op.accion != "crear_carpeta" and not sim.existe(op.origen):
+            conflictos.append(_conflicto(op.paso, f"❌ No se puede {op.accion} {op.origen}: ya no existe."))
+            continue
+        if op.destino is not None and sim.existe(op.destino):
+            conflictos.append(_conflicto(op.paso, f"❌ No se puede {op.accion} {op.origen}: {op.destino} ya existe."))
+            continue
+        _simular(sim, op)
+        validas.append(op)
+    return validas, conflictos
+
+
+def _aplicar(inv, op, metodos):
+    """Aplica `op` en disco e inventario y devuelve el mensaje para el registro."""
+    if op.accion == "renombrar":
+        inv.renombrar(op.origen, op.destino)
+    elif op.accion == "mover":
+        inv.mover(op.origen, op.destino)
+    elif op.accion == "enlazar":
+        metodo = inv.enlazar(op.origen, op.destino, metodos)
+        nombre, destino = os.path.basename(op.destino), os.path.dirname(op.destino)
+        if metodo == "copia":
+            return f"✅ Copiado: {nombre} → {destino}"
+        return f"🔗 Enlazado ({metodo}): {nombre} → {destino}"
+    elif op.accion == "eliminar":
+        inv.eliminar(op.origen)
+    elif op.accion == "crear_carpeta":
+        inv.crear_carpeta(op.origen)
+    return op.mensaje
+
+
+def _agrupar_operaciones(operaciones):
+    """
+    Reparte las operaciones en grupos independientes: dos operaciones van al
+    mismo grupo si comparten origen o destino (p. ej. enlazar y luego mover el
+    mismo PDF, o renombrar A→B y después B→C) o si una de sus rutas está
+    dentro de una ruta de la otra (renombrar una carpeta y algo de su
+    interior). Cada grupo conserva el orden del plan y grupos distintos se
+    pueden aplicar a la vez.
+    """
+    padre = list(range(len(operaciones)))
+    duenio = {}  # clave de ruta → primera operación que la toca
+    contiene = {}  # clave de una carpeta → primera operación con una ruta dentro de ella
+
+    def raiz(i):
+        while padre[i] != i:
+            padre[i] = padre[padre[i]]
+            i = padre[i]
+        return i
+
+    def unir(i, j):
+        padre[raiz(i)] = raiz(j)
+
+    for i, op in enumerate(operaciones):
+        for ruta in (op.origen, op.destino):
+            if ruta is None:
+                continue
+            clave = _clave(ruta)
+            for otra in (duenio, contiene):
+                if clave in otra:
+                    unir(i, otra[clave])
+            duenio.setdefault(clave, i)
+            carpeta = os.path.dirname(clave)
+            while carpeta and carpeta != clave:
+                if carpeta in duenio:
+                    unir(i, duenio[carpeta])
+                contiene.setdefault(carpeta, i)
+                clave, carpeta = carpeta, os.path.dirname(carpeta)
+    grupos = {}
+    for i, op in enumerate(operaciones):
+        grupos.setdefault(raiz(i), []).append(op)
+    return list(grupos.values())
+
+
+def _tandas(operaciones, por_niveles=False):
+    """
+    Tandas en que ejecutar_plan aplica `operaciones` (cada una, una lista de
+    grupos de _agrupar_operaciones). Con `por_niveles` hay una tanda por
+    profundidad del origen, de la más profunda a la menos.
+    """
+    if not por_niveles:
+        return [_agrupar_operaciones(operaciones)]
+    niveles = defaultdict(list)
+    for op in operaciones:
+        niveles[os.path.normpath(op.origen).count(os.sep)].append(op)
+    return [_agrupar_operaciones(niveles[n]) for n in sorted(niveles, reverse=True)]
+
+
+def ejecutar_plan(ctx, operaciones, por_niveles=False):
+    """
+    Aplica un plan sobre el disco (y el inventario de `ctx`) y devuelve el
+    número de operaciones que fallaron.
+
+    Antes de tocar nada se informan los avisos y los conflictos del plan.
+    Primero se crean las carpetas; el resto se reparte en grupos
+    independientes (ver _agrupar_operaciones) que se envían a un pool de
+    ctx.io_workers hilos: en unidades de red cada operación es un viaje de
+    ida y vuelta, así que se solapan en lugar de esperar una tras otra.
+    Con `por_niveles` las operaciones se aplican por tandas según la
+    profundidad del origen, de la más profunda a la menos (renombrar
+    carpetas de abajo arriba). Si una operación falla se omiten las
+    siguientes de su grupo sobre el mismo origen.
+    """
+    inv = ctx.inventario
+    validas, conflictos = _validar_plan(inv, operaciones)
+    pendientes = []
+    for op in validas:
+        if op.accion in ("aviso", "conflicto"):
+            ctx.log(op.mensaje)
+        else:
+            pendientes.append(op)
+    if conflictos:
+        ctx.log(f"⚠️ {len(conflictos)} operaciones en conflicto con el estado actual, se omiten:")
+        for op in conflictos:
+            ctx.log(op.mensaje)
+
+    metodos = METODOS_ENLACE[ctx.estrategia_encarpetado]
+    carpetas = [op for op in pendientes if op.accion == "crear_carpeta"]
+    tandas = _tandas([op for op in pendientes if op.accion != "crear_carpeta"], por_niveles)
+
+    total = len(pendientes)
+    cerrojo = threading.Lock()
+    hechos = errores = 0
+    paso, contadores, contadores_inv = ctx.paso, ctx.contadores, inv.contadores
+
+    def planificar(grupos):
+        # Un registro y una sincronización del diario por tanda, no uno por operación
+        if inv.diario is not None:
+            inv.diario.planificar([op for grupo in grupos for op in grupo])
+
+    def aplicar_grupo(grupo):
+        nonlocal hechos, errores
+        # El paso en curso y sus contadores son de cada hilo
+        ctx.paso, ctx.contadores, inv.contadores = paso, contadores, contadores_inv
+        fallidos = set()
+        for op in grupo:
+            with cerrojo:
+                ctx.avance(hechos, total)
+                hechos += 1
+            if _clave(op.origen) in fallidos:
+                ctx.log(f"⏭️ Se omite {op.accion} {op.origen}: falló una operación anterior.")
+                continue
+            try:
+                mensaje = _aplicar(inv, op, metodos)
+            except Exception as e:
+                fallidos.add(_clave(op.origen))
+                with cerrojo:
+                    errores += 1
+                ctx.contar("errores")
+                ctx.log(f"❌ No se pudo {op.accion} {op.origen}: {e}")
+                continue
+            if mensaje:
+                ctx.log(mensaje)
+
+    planificar([carpetas])
+    aplicar_grupo(carpetas)
+    if ctx.io_workers <= 1 or all(len(grupos) <= 1 for grupos in tandas):
+        for grupos in tandas:
+            planificar(grupos)
+            for grupo in grupos:
+                aplicar_grupo(grupo)
+        return errores
+    with ThreadPoolExecutor(max_workers=ctx.io_workers) as pool:
+        for grupos in tandas:
+            planificar(grupos)
+            futuros = [pool.submit(aplicar_grupo, grupo) for grupo in grupos]
+            try:
+                for futuro in as_completed(futuros):
+                    futuro.result()
+            except BaseException:
+                pool.shutdown(wait=True, cancel_futures=True)
+                raise
+    return errores
+
+
+# =============================================================================
+# Paso 1: RENOMBRAR CARPETAS
+# =============================================================================
+# Diccionario con los nombres actuales y sus respectivos cambios
+RENOMBRAR_CARPETAS = {
+    "Excavacion": "Excavación",
+    "Prospeccion": "Prospección",
+    "RegistroUnico": "Registros únicos",
+    "Dibujos": "Dibujos arquitectónicos",
+    "FichaDeExcavacion": "Ficha de excavación",
+    "Introduccion": "Introducción",
+    "RegistroDeCapas": "Registro de capas",
+    "RegistroDeFotogrametria": "Registro de fotogrametría",
+    "RegistroDeMaterialesArqueologicos": "Registro de materiales arqueológicos",
+    "RegistrosArqueologicos": "Registros arqueológicos"
+}
+
+
+def planificar_paso1(ctx, inv):
+    """Renombrados de carpetas según RENOMBRAR_CARPETAS, de abajo arriba."""
+    plan = []
+    for root, dirs, files in inv.recorrer(ctx.ruta, topdown=False):
+        ctx.contar("escaneados", len(dirs))
+        for carpeta in dirs:
+            nuevo_nombre = RENOMBRAR_CARPETAS.get(carpeta, None)
+            if nuevo_nombre:
+                ruta_actual = os.path.join(root, carpeta)
+                ruta_nueva = os.path.join(root, nuevo_nombre)
+                if not inv.existe(ruta_nueva):
+                    plan.append(Operacion(1, "renombrar", ruta_actual, ruta_nueva,
+                                          f"Renombrado: {ruta_actual} → {ruta_nueva}"))
+                    inv.registrar_renombrado(ruta_actual, ruta_nueva)
+                else:
+                    plan.append(_conflicto(1, f"❌ No se pudo renombrar {ruta_actual} porque {ruta_nueva} ya existe."))
+    return plan
+
+
+def step1_renombrar_carpetas(ctx=None):
+    ctx = _contexto(ctx)
+    if not ctx.ruta:
+        raise ValueError("RUTA_PRINCIPAL no está definida")
+    ctx.log("\n--- Paso 1: Renombrar Carpetas ---")
+    # Las carpetas hijas se renombran antes que sus padres
+    ejecutar_plan(ctx, planificar_paso1(ctx, ctx.inventario.copia()), por_niveles=True)
+
+
+# =============================================================================
+# Paso 2: RENOMBRAR ARCHIVOS EN LA CARPETA "Excavación" Y "Registros únicos"
+# =============================================================================
+def planificar_paso2(ctx, inv, solo=None):
+    """
+    Añade a cada PDF el nombre de su subcarpeta como sufijo.
+    Con `solo` (claves de ruta, ver _clave) únicamente se planifican esos PDF.
+    """
+    plan = []
+
+    def rename_pdfs_in_subfolders(main_path):
+        for root, dirs, files in inv.recorrer(main_path):
+            folder_name = os.path.basename(root)
+            for file in files:
+                if file.endswith(".pdf"):
+                    if solo is not None and _clave(os.path.join(root, file)) not in solo:
+                        continue
+                    ctx.contar("escaneados")
+                    # Renombra solo si aún no tiene el sufijo de la subcarpeta
+                    if file.endswith(f"_{folder_name}.pdf"):
+                        plan.append(_aviso(2, f"⚠️ Ya tiene el formato esperado: {file}"))
+                        continue
+                    old_path = os.path.join(root, file)
+                    new_name = f"{os.path.splitext(file)[0]}_{folder_name}.pdf"
+                    new_path = os.path.join(root, new_name)
+                    if inv.existe(new_path):
+                        plan.append(_conflicto(2, f"❌ No se pudo renombrar {file} porque {new_name} ya existe."))
+                        continue
+                    plan.append(Operacion(2, "renombrar", old_path, new_path, f"✅ Renombrado: {file} → {new_name}"))
+                    inv.registrar_renombrado(old_path, new_path)
+
+    # Procesa las carpetas "Excavación" y "Registros únicos"
+    for nombre in ("Excavación", "Registros únicos"):
+        carpeta = os.path.join(ctx.ruta, nombre)
+        if inv.existe(carpeta):
+            plan.append(_aviso(2, f"Procesando archivos en '{nombre}'..."))
+            rename_pdfs_in_subfolders(carpeta)
+        else:
+            plan.append(_aviso(2, f"❌ La carpeta '{nombre}' no existe en {ctx.ruta}"))
+    return plan
+
+
+def step2_renombrar_archivos(ctx=None):
+    ctx = _contexto(ctx)
+    if not ctx.ruta:
+        raise ValueError("RUTA_PRINCIPAL no está definida")
+    ctx.log("\n--- Paso 2: Renombrar Archivos PDF ---")
+    ejecutar_plan(ctx, planificar_paso2(ctx, ctx.inventario.copia()))
+
+
+# =============================================================================
+# Paso 3: MOVER ARCHIVOS RENOMBRADOS A "Excavación por ID Monumento"
+# =============================================================================
+def planificar_paso3(ctx, inv, solo=None):
+    """
+    Mueve los PDF de "Excavación" y de las subcarpetas de "Registros únicos".
+    Con `solo` (claves de ruta) únicamente se planifican esos PDF.
+    """
+    carpeta_excavacion = os.path.join(ctx.ruta, "Excavación")
+    carpeta_destino = os.path.join(ctx.ruta, "Excavación por ID Monumento")
+    carpeta_registros_unicos = os.path.join(ctx.ruta, "Registros únicos")
+    plan = []
+    if not inv.es_carpeta(carpeta_destino):
+        plan.append(Operacion(3, "crear_carpeta", carpeta_destino, None, None))
+        inv.registrar_carpeta(carpeta_destino)
+
+    def move_pdf(old_path, output_path):
+        if solo is not None and _clave(old_path) not in solo:
+            return
+        ctx.contar("escaneados")
+        file = os.path.basename(old_path)
+        new_path = os.path.join(output_path, file)
+        if inv.existe(new_path):
+            plan.append(_conflicto(3, f"⚠️ El archivo ya existe en {output_path}: {file}, se omite."))
+        else:
+            plan.append(Operacion(3, "mover", old_path, new_path, f"✅ Movido: {file} → {output_path}"))
+            inv.registrar_renombrado(old_path, new_path)
+
+    # Parte 1: Mover archivos desde "Excavación" a "Excavación por ID Monumento"
+    if inv.existe(carpeta_excavacion):
+        for root, dirs, files in inv.recorrer(carpeta_excavacion):
+            for file in files:
+                if file.endswith(".pdf"):
+                    move_pdf(os.path.join(root, file), carpeta_destino)
+    else:
+        plan.append(_aviso(3, f"❌ La carpeta 'Excavación' no existe en {ctx.ruta}"))
+
+    # Parte 2: Mover archivos de las subcarpetas de "Registros únicos" a la carpeta "Registros únicos" (limpiar subcarpetas)
+    if inv.existe(carpeta_registros_unicos):
+        plan.append(_aviso(3, f"Procesando archivos en subcarpetas de 'Registros únicos'..."))
+        for root, dirs, files in inv.recorrer(carpeta_registros_unicos):
+            # Si estamos en la carpeta raíz, no se mueve nada
+            if os.path.abspath(root) == os.path.abspath(carpeta_registros_unicos):
+                continue
+            for file in files:
+                if file.endswith(".pdf"):
+                    move_pdf(os.path.join(root, file), carpeta_registros_unicos)
+    else:
+        plan.append(_aviso(3, f"❌ La carpeta 'Registros únicos' no existe en {ctx.ruta}"))
+    return plan
+
+
+def step3_mover_archivos_renombrados(ctx=None):
+    ctx = _contexto(ctx)
+    if not ctx.ruta:
+        raise ValueError("RUTA_PRINCIPAL no está definida")
+    ctx.log("\n--- Paso 3: Mover Archivos ---")
+    ejecutar_plan(ctx, planificar_paso3(ctx, ctx.inventario.copia()))
+
+
+# =============================================================================
+# CARGA DE LA BASE DE DATOS (Excel), una sola vez por ejecución
+# =============================================================================
+# Columnas del Excel que usa el flujo; el resto no se lee
+COLUMNAS_EXCEL = [
+    "Nombre Sitio",
+    "ID Monumento",
+    "Monumentos superiores",
+    "Monumentos Asociados por cercanía",
+    "Tipo de intervención",
+]
+CACHE_EXCEL_DIR    = None  # carpeta de la caché columnar (None = carpeta de caché del usuario)
+CACHE_EXCEL_MAX_MB = 512   # tamaño máximo de la caché columnar; se borran primero las entradas más viejas
+CACHE_EXCEL_DIAS   = 30    # días sin usarse tras los que se borra una entrada de la caché
+
+
+def _carpeta_cache_usuario():
+    base = os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "informes")
+
+
+def _hash_archivo(ruta, bloque=1 << 20):
+    h = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for trozo in iter(lambda: f.read(bloque), b""):
+            h.update(trozo)
+    return h.hexdigest()
+
+
+class BaseDatos:
+    """
+    Tabla del Excel reducida a COLUMNAS_EXCEL, con un índice por "Nombre Sitio".
+
+    `columnas` indica qué columnas estaban realmente en el Excel; las que
+    falten se rellenan con "" para que los pasos puedan usarlas igual.
+    Las columnas leídas son Categorical (ver _leer_excel) y el índice de
+    `df` es la posición de cada fila en la hoja, aunque solo estén las de un sitio.
+    """
+
+    def __init__(self, df, columnas, origen=None, clave=None):
+        self.df = df
+        self.columnas = columnas
+        self.origen = origen
+        self.clave = clave  # hash del contenido del Excel
+        self._por_sitio = {
+            sitio: grupo for sitio, grupo in df.groupby("Nombre Sitio", sort=False, observed=True)
+        }
+
+    def sitio(self, nombre, compactar=False):
+        """
+        Filas del sitio `nombre` (DataFrame vacío si no hay ninguna). Con
+        `compactar` las categorías se reducen a las que usa el sitio (para
+        enviarlo a otro proceso sin las del libro entero).
+        """
+        df = self._por_sitio.get(nombre, self.df.iloc[0:0])
+        if compactar:
+            df = df.apply(lambda c: c.cat.remove_unused_categories() if isinstance(c.dtype, pd.CategoricalDtype) else c)
+        return df
+
+    def sitios(self):
+        return list(self._por_sitio)
+
+
+def _leer_cache_excel(ruta_base):
+    for ext, lector in ((".feather", pd.read_feather), (".pkl", pd.read_pickle)):
+        if os.path.exists(ruta_base + ext):
+            try:
+                df = lector(ruta_base + ext)
+            except Exception:
+                continue  # caché ilegible o sin pyarrow: se vuelve a leer el Excel
+            with contextlib.suppress(OSError):
+                os.utime(ruta_base + ext)  # usada ahora: la poda empieza por las más viejas
+            # Feather no guarda el índice: las posiciones de las filas van en "_fila"
+            if "_fila" in df.columns:
+                df = df.set_index("_fila").rename_axis(None)
+            return df
+    return None
+
+
+def _escribir_cache_excel(ruta_base, df):
+    os.makedirs(os.path.dirname(ruta_base), exist_ok=True)
+    df = df.reset_index(names="_fila")
+    try:
+        df.to_feather(ruta_base + ".feather")
+    except ImportError:
+        df.to_pickle(ruta_base + ".pkl")
+    _podar_cache_excel(os.path.dirname(ruta_base))
+
+
+def _podar_cache_excel(carpeta):
+    """
+    Borra las entradas de la caché columnar sin usar en CACHE_EXCEL_DIAS y,
+    si aún ocupa más de CACHE_EXCEL_MAX_MB, las usadas hace más tiempo.
+    _leer_cache_excel actualiza la fecha de la entrada que lee.
+    """
+    entradas = []
+    with os.scandir(carpeta) as it:
+        for e in it:
+            if e.name.startswith("excel-") and e.is_file():
+                st = e.stat()
+                entradas.append((st.st_mtime, st.st_size, e.path))
+    entradas.sort()  # las más viejas primero
+    limite_fecha = time.time() - CACHE_EXCEL_DIAS * 86400
+    total = sum(tamano for _, tamano, _ in entradas)
+    for fecha, tamano, ruta in entradas[:-1]:  # nunca la que se acaba de escribir
+        if fecha >= limite_fecha and total <= CACHE_EXCEL_MAX_MB * 2**20:
+            break
+        with contextlib.suppress(OSError):
+            os.remove(ruta)
+            total -= tamano
+
+
+def _texto_celda(valor):
+    """Valor de una celda como lo deja read_excel(dtype=str) + fillna("")."""
+    if valor is None:
+        return ""
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))  # openpyxl entrega 12.0 para el número 12
+    return str(valor)
+
+
+def _leer_excel(excel_path, sitio=None):
+    """
+    Lee la primera hoja del Excel con openpyxl en modo de solo lectura, fila
+    a fila, guardando solo COLUMNAS_EXCEL y, si se indica `sitio`, solo las
+    filas cuyo "Nombre Sitio" coincide: la memoria depende de las filas que
+    se conservan, no del tamaño del libro.
+
+    Los valores quedan como texto ("" en las celdas vacías) y cada columna
+    como Categorical, así un ID, un sitio o un tipo repetido ocupa una sola
+    vez. El índice es la posición de la fila en la hoja (fila del Excel - 2).
+    """
+    libro = openpyxl.load_workbook(excel_path, read_only=True, data_only=True)
+    try:
+        filas = libro.worksheets[0].iter_rows(values_only=True)
+        posicion = {}
+        for i, nombre in enumerate(next(filas, ())):
+            if nombre in COLUMNAS_EXCEL and nombre not in posicion:
+                posicion[nombre] = i
+        columnas = [c for c in COLUMNAS_EXCEL if c in posicion]
+        valores = {c: [] for c in columnas}
+        indice = []
+        con_datos = 0  # filas hasta la última no vacía (las vacías del final no cuentan)
+        col_sitio = posicion.get("Nombre Sitio")
+        for n, fila in enumerate(filas):
+            if sitio is not None:
+                if col_sitio is None or col_sitio >= len(fila) or _texto_celda(fila[col_sitio]) != sitio:
+                    continue
+            vacia = True
+            for c in columnas:
+                i = posicion[c]
+                texto = sys.intern(_texto_celda(fila[i] if i < len(fila) else None))
+                valores[c].append(texto)
+                vacia = vacia and not texto
+            indice.append(n)
+            if not vacia:
+                con_datos = len(indice)
+    finally:
+        libro.close()
+    del indice[con_datos:]
+    return pd.DataFrame(
+        {c: pd.Categorical(valores[c][:con_datos]) for c in columnas},
+        index=pd.Index(indice, dtype="int64"),
+    )
+
+
+def cargar_base_datos(excel_path, log=print, sitio=None):
+    """
+    Lee el Excel una sola vez y solo las columnas que usa el flujo (con
+    `sitio`, solo las filas de ese sitio; ver _leer_excel).
+
+    El resultado se guarda en formato columnar (Feather si pyarrow está
+    disponible, pickle si no) con el hash del contenido del Excel (y el
+    sitio) como clave, así las ejecuciones siguientes sobre el mismo libro
+    no pasan por openpyxl.
+    """
+    clave = _hash_archivo(excel_path)
+    nombre_cache = f"excel-{clave[:32]}"
+    if sitio is not None:
+        nombre_cache += "-" + hashlib.sha256(sitio.encode("utf-8")).hexdigest()[:12]
+    ruta_cache = os.path.join(CACHE_EXCEL_DIR or _carpeta_cache_usuario(), nombre_cache)
+    df = _leer_cache_excel(ruta_cache)
+    if df is None:
+        df = _leer_excel(excel_path, sitio)
+        try:
+            _escribir_cache_excel(ruta_cache, df)
+        except OSError as e:
+            log(f"⚠️ No se pudo guardar la caché del Excel: {e}")
+    columnas = [c for c in COLUMNAS_EXCEL if c in df.columns]
+    for c in COLUMNAS_EXCEL:
+        if c not in df.columns:
+            df[c] = ""
+    return BaseDatos(df, columnas, origen=excel_path, clave=clave)
+
+
+# =============================================================================
+# Paso 4: CREAR SUBCARPETAS EN "Excavación por ID Monumento" Y "Registros únicos"
+# =============================================================================
+# Carpeta resultante de agrupar monumentos relacionados entre sí
+# nombre: IDs ordenados y separados por ", "; filas: índices del Excel que aportaron al grupo
+GrupoMonumentos = namedtuple("GrupoMonumentos", ["nombre", "tipo", "ids", "filas"])
+
+CARPETA_POR_TIPO = {
+    "Excavación": "Excavación por ID Monumento",
+    "Registro único": "Registros únicos",
+}
+
+
+def agrupar_monumentos(df, log=print):
+    """
+    Agrupa los monumentos de un sitio en carpetas, con los mismos nombres que
+    el recorrido fila a fila original.
+
+    Cada fila aporta su "ID Monumento" (salvo que alguno de los dos campos de
+    relación empiece por "A") y los IDs "T…" de "Monumentos superiores" y
+    "Monumentos Asociados por cercanía"; la carpeta se llama como esos IDs
+    ordenados y separados por ", ". Las columnas se preparan de una vez con
+    pandas y luego las filas se recorren en el orden del Excel: una fila con
+    algún ID que ya tiene carpeta no crea otra. Los IDs que por eso se quedan
+    sin carpeta se avisan al final en lugar de omitirse en silencio.
+    """
+    col_id, col_sup, col_assoc, col_tipo = (
+        "ID Monumento", "Monumentos superiores", "Monumentos Asociados por cercanía", "Tipo de intervención",
+    )
+    if df.empty:
+        return []
+    d = df[[col_id, col_sup, col_assoc, col_tipo]].apply(lambda c: c.astype(str).str.strip())
+    sup, assoc = d[col_sup], d[col_assoc]
+    incluir_base = ~(sup.str.startswith("A") | assoc.str.startswith("A"))
+    columnas = (
+        d[col_id].where(incluir_base, "").tolist(),
+        sup.where(sup.str.startswith("T"), "").tolist(),
+        assoc.where(assoc.str.startswith("T"), "").tolist(),
+        [tipo if tipo in CARPETA_POR_TIPO else None for tipo in d[col_tipo].tolist()],
+    )
+
+    grupos, manejados, vistos = [], set(), set()
+    for fila, base_id, superior, cercano, tipo in zip(d.index, *columnas):
+        ids = {i for i in (base_id, superior, cercano) if i}
+        if not ids:
+            continue
+        vistos |= ids
+        if not ids.isdisjoint(manejados):
+            continue
+        manejados |= ids
+        ids = sorted(ids)
+        grupos.append(GrupoMonumentos(", ".join(ids), tipo, ids, [fila]))
+
+    huerfanos = sorted(vistos - manejados)
+    if huerfanos:
+        log(f"⚠️ {len(huerfanos)} ID(s) sin carpeta: solo aparecen en filas con monumentos que ya tienen una "
+            f"({', '.join(huerfanos)}).")
+    return grupos
+
+
+NOMBRE_INDICE_RUTAS = ".informes_rutas.json"  # índice ID → carpeta, en la carpeta principal
+PATRON_ID = re.compile(r"T\d+_\d+")  # IDs de monumento en los nombres de archivo
+
+
+class IndiceRutas:
+    """
+    Índice de enrutamiento que produce el paso 4: a qué subcarpeta va cada ID
+    de monumento y de qué fila del Excel sale. El paso 5 lo consulta para
+    colocar cada PDF sin volver a listar carpetas, y se guarda en la carpeta
+    principal (NOMBRE_INDICE_RUTAS) para las ejecuciones siguientes con el
+    mismo Excel.
+    """
+
+    def __init__(self, rutas=None, sin_carpeta=None, clave_excel=None):
+        # ID → {"seccion": carpeta del tipo, "carpeta": subcarpeta, "fila": fila del Excel, "tipo": tipo}
+        self.rutas = rutas or {}
+        # ID del Excel que no tiene carpeta → motivo
+        self.sin_carpeta = sin_carpeta or {}
+        self.clave_excel = clave_excel
+
+    @classmethod
+    def desde_grupos(cls, grupos, df, clave_excel=None):
+        fila_de = {}
+        for fila, id_ in zip(df.index, df["ID Monumento"]):
+            fila_de.setdefault(id_, fila)
+        indice = cls(clave_excel=clave_excel)
+        for grupo in grupos:
+            if grupo.tipo is None:
+                tipos = sorted(set(df.loc[grupo.filas, "Tipo de intervención"].str.strip()))
+                for id_ in grupo.ids:
+                    indice.sin_carpeta[id_] = f"Tipo desconocido {tipos}"
+                continue
+            for id_ in grupo.ids:
+                indice.rutas[id_] = {
+                    "seccion": CARPETA_POR_TIPO[grupo.tipo],
+                    "carpeta": grupo.nombre,
+                    "fila": int(fila_de.get(id_, grupo.filas[0])) + 2,  # cabecera + filas desde 1
+                    "tipo": grupo.tipo,
+                }
+        return indice
+
+    def carpeta(self, raiz, id_):
+        """Ruta de la subcarpeta de `id_` dentro de `raiz`, o None si no tiene."""
+        ruta = self.rutas.get(id_)
+        return None if ruta is None else os.path.join(raiz, ruta["seccion"], ruta["carpeta"])
+
+    def guardar(self, ruta):
+        temporal = ruta + ".tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump({"clave_excel": self.clave_excel, "rutas": self.rutas, "sin_carpeta": self.sin_carpeta},
+                      f, ensure_ascii=False)
+        os.replace(temporal, ruta)
+
+    @classmethod
+    def cargar(cls, ruta, clave_excel=None):
+        """Índice guardado en `ruta`, o None si no existe, no se puede leer o es de otro Excel."""
+        try:
+            with open(ruta, encoding="utf-8") as f:
+                datos = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if clave_excel is not None and datos.get("clave_excel") != clave_excel:
+            return None
+        return cls(datos.get("rutas"), datos.get("sin_carpeta"), datos.get("clave_excel"))
+
+
+def planificar_paso4(ctx, inv):
+    """Una subcarpeta por grupo de monumentos del sitio, bajo la carpeta de su tipo."""
+    df = ctx.base_datos.sitio(ctx.sitio)
+    ctx.contar("escaneados", len(df))
+    plan = []
+    grupos = agrupar_monumentos(df, log=lambda mensaje: plan.append(_aviso(4, mensaje)))
+    # El índice queda en el contexto: el paso 5 (o su plan) lo usa directamente
+    ctx.indice_rutas = IndiceRutas.desde_grupos(grupos, df, clave_excel=ctx.base_datos.clave)
+    for grupo in grupos:
+        # Elegir carpeta padre
+        if grupo.tipo is None:
+            tipos = sorted(set(df.loc[grupo.filas, "Tipo de intervención"].str.strip()))
+            plan.append(_aviso(4, f"⚠️ Tipo desconocido {tipos} para ID {grupo.nombre}, se omite."))
+            continue
+        ruta_sub = os.path.join(ctx.ruta, CARPETA_POR_TIPO[grupo.tipo], grupo.nombre)
+        plan.append(Operacion(4, "crear_carpeta", ruta_sub, None, f"✅ Subcarpeta creada: {ruta_sub}"))
+        inv.registrar_carpeta(ruta_sub)
+    return plan
+
+
+def step4_crear_subcarpetas(ctx=None):
+    ctx = _contexto(ctx)
+    if not ctx.ruta or not ctx.tiene_excel():
+        raise ValueError("Debe definir RUTA_PRINCIPAL y EXCEL_PATH")
+    ctx.log("\n--- Paso 4: Crear Subcarpetas desde Excel ---")
+    ejecutar_plan(ctx, planificar_paso4(ctx, ctx.inventario.copia()))
+    indice = ctx.indice_rutas
+    ruta_indice = os.path.join(ctx.ruta, NOMBRE_INDICE_RUTAS)
+    try:
+        indice.guardar(ruta_indice)
+        ctx.log(f"🗺️ Índice de rutas: {len(indice.rutas)} IDs con carpeta, {len(indice.sin_carpeta)} sin carpeta.")
+    except OSError as e:
+        ctx.log(f"⚠️ No se pudo guardar el índice de rutas en {ruta_indice}: {e}")
+
+# =============================================================================
+# Paso 5: ENCARPETAR ARCHIVOS EN "Excavación por ID Monumento" Y "Registros únicos"
+# =============================================================================
+# Estrategia de colocación del paso 5:
+#   "auto"    → mover si hay un solo destino; con varios, reflink o hardlink (copia si no se puede)
+#   "reflink" → como "auto" pero solo con reflink (copy-on-write) antes de copiar
+#   "enlace"  → como "auto" pero solo con hardlink antes de copiar
+#   "copiar"  → comportamiento anterior: copy2 a cada destino y eliminar el original
+ESTRATEGIA_ENCARPETADO = "auto"
+METODOS_ENLACE = {
+    "auto": ("reflink", "hardlink"),
+    "reflink": ("reflink",),
+    "enlace": ("hardlink",),
+    "copiar": (),
+}
+
+
+def planificar_paso5(ctx, inv, sin_carpeta=None, solo=None):
+    """
+    Coloca cada PDF de la raíz de "Excavación por ID Monumento" y "Registros
+    únicos" en las subcarpetas de los IDs que aparecen en su nombre.
+
+    Las carpetas salen del índice de rutas del paso 4 (ctx.indice_rutas); los
+    IDs que no están en él se buscan en las subcarpetas que hay en disco
+    (p. ej. creadas a mano). `sin_carpeta`, si se indica, recibe
+    ID → archivos de los IDs que no tienen carpeta. Con `solo` (claves de
+    ruta) únicamente se planifican esos PDF.
+    """
+    if ctx.estrategia_encarpetado not in METODOS_ENLACE:
+        raise ValueError(f"ESTRATEGIA_ENCARPETADO desconocida: {ctx.estrategia_encarpetado!r}")
+    carpeta_excavacion = os.path.join(ctx.ruta, "Excavación por ID Monumento")
+    carpeta_registros = os.path.join(ctx.ruta, "Registros únicos")
+    indice = ctx.indice_rutas
+    sin_carpeta = {} if sin_carpeta is None else sin_carpeta
+    plan = []
+
+    def procesar_carpeta(carpeta):
+        plan.append(_aviso(5, f"\nProcesando en: {carpeta}"))
+        # 1) Destino de cada ID: el índice de rutas y, si no está, las subcarpetas en disco
+        seccion = os.path.basename(carpeta)
+        con_carpeta = sum(r["seccion"] == seccion for r in indice.rutas.values())
+        plan.append(_aviso(5, f"  {con_carpeta} IDs con carpeta en el índice de rutas."))
+        mapa = {}
+        mapa_disco = None
+
+        def destino_de(id_):
+            nonlocal mapa_disco
+            if id_ not in mapa:
+                destino = indice.carpeta(ctx.ruta, id_)
+                if destino is None or _clave(os.path.dirname(destino)) != _clave(carpeta) or not inv.es_carpeta(destino):
+                    if mapa_disco is None:
+                        mapa_disco = {}
+                        for sub in inv.subcarpetas(carpeta):
+                            for i in sub.split(","):
+                                if i.strip():
+                                    mapa_disco[i.strip()] = os.path.join(carpeta, sub)
+                    destino = mapa_disco.get(id_)
+                mapa[id_] = destino
+            return mapa[id_]
+
+        # 2) Recorrer PDFs en la raíz de 'carpeta'
+        for nombre in inv.archivos(carpeta):
+            if not nombre.lower().endswith(".pdf"):
+                continue
+            ruta_pdf = os.path.join(carpeta, nombre)
+            if solo is not None and _clave(ruta_pdf) not in solo:
+                continue
+            ctx.contar("escaneados")
+            stem = os.path.splitext(nombre)[0]
+
+            # Extraigo T##_##### aunque haya guiones bajos contiguos
+            ids_en_nombre = PATRON_ID.findall(stem)
+            if not ids_en_nombre:
+                plan.append(_aviso(5, f"⚠️ No hay IDs en '{nombre}', no se copia ni elimina."))
+                continue
+
+            # 3) Subcarpetas destino (sin repetir) que aún no tienen el archivo
+            destinos = []
+            for id_ in ids_en_nombre:
+                destino = destino_de(id_)
+                if destino is None:
+                    sin_carpeta.setdefault(id_, []).append(nombre)
+                elif destino not in destinos:
+                    destinos.append(destino)
+            if not destinos:
+                continue
+            pendientes = []
+            for destino in destinos:
+                if inv.existe(os.path.join(destino, nombre)):
+                    plan.append(_conflicto(5, f"⚠️ Ya existe en {destino}: {nombre}"))
+                else:
+                    pendientes.append(destino)
+
+            # 4) Colocar el archivo: con "copiar" se copia a todos los destinos;
+            #    si no, se enlaza a todos menos el último y el original se mueve a ese
+            if ctx.estrategia_encarpetado == "copiar":
+                enlazar, mover_a = pendientes, None
+            else:
+                enlazar, mover_a = pendientes[:-1], (pendientes[-1] if pendientes else None)
+            for destino in enlazar:
+                plan.append(Operacion(5, "enlazar", ruta_pdf, os.path.join(destino, nombre), None))
+                inv.registrar_archivo(os.path.join(destino, nombre))
+            if mover_a is not None:
+                plan.append(Operacion(5, "mover", ruta_pdf, os.path.join(mover_a, nombre),
+                                      f"✅ Movido: {nombre} → {mover_a}"))
+                inv.registrar_renombrado(ruta_pdf, os.path.join(mover_a, nombre))
+                continue
+
+            # 5) El original ya está en todos sus destinos: se elimina
+            plan.append(Operacion(5, "eliminar", ruta_pdf, None, f"🗑️ Eliminado original: {ruta_pdf}"))
+            inv.registrar_eliminado(ruta_pdf)
+
+    # Planificar en ambas carpetas si existen
+    if inv.es_carpeta(carpeta_excavacion):
+        procesar_carpeta(carpeta_excavacion)
+    else:
+        plan.append(_aviso(5, f"❌ No existe: {carpeta_excavacion}"))
+
+    if inv.es_carpeta(carpeta_registros):
+        procesar_carpeta(carpeta_registros)
+    else:
+        plan.append(_aviso(5, f"❌ No existe: {carpeta_registros}"))
+
+    if sin_carpeta:
+        plan.append(_aviso(5, f"\n⚠️ {len(sin_carpeta)} IDs sin carpeta:"))
+        for id_, archivos in sorted(sin_carpeta.items()):
+            plan.append(_aviso(5, f"   - {id_}: {', '.join(archivos)}"))
+    return plan
+
+
+def step5_encarpetar_archivos(ctx=None):
+    ctx = _contexto(ctx)
+    if not ctx.ruta:
+        raise ValueError("RUTA_PRINCIPAL no está definida")
+    ctx.log("\n--- Paso 5: Encarpetar Archivos ---")
+    sin_carpeta = {}
+    ejecutar_plan(ctx, planificar_paso5(ctx, ctx.inventario.copia(), sin_carpeta))
+
+    # Informe de IDs sin carpeta: los de los nombres de archivo y los del Excel sin tipo conocido
+    ruta_informe = os.path.join(_carpeta_informes(ctx), f"{ctx.sitio}_ids_sin_carpeta.csv")
+    try:
+        os.makedirs(os.path.dirname(ruta_informe), exist_ok=True)
+        with open(ruta_informe, "w", encoding="utf-8", newline="") as f:
+            escritor = csv.writer(f)
+            escritor.writerow(["id", "origen", "detalle"])
+            for id_, archivos in sorted(sin_carpeta.items()):
+                escritor.writerow([id_, "archivo", ";".join(archivos)])
+            for id_, motivo in sorted(ctx.indice_rutas.sin_carpeta.items()):
+                escritor.writerow([id_, "excel", motivo])
+        ctx.log(f"📝 IDs sin carpeta: {ruta_informe}")
+    except OSError as e:
+        ctx.log(f"❌ No se pudo guardar {ruta_informe}: {e}")
+    ctx.log("\n🎉 Paso 5 completado.")
+
+
+# =============================================================================
+# Paso 6: VERIFICACIÓN DE ARCHIVOS EN LA CARPETA PRINCIPAL
+# =============================================================================
+SUFIJOS_ESPERADOS = [
+    "Introducción.pdf",
+    "Ficha de excavación.pdf",
+    "Dibujos arquitectónicos.pdf",
+    "Registro de capas.pdf",
+    "Registro de fotogrametría.pdf",
+    "Registro de materiales arqueológicos.pdf",
+    "Registros arqueológicos.pdf"
+]
+CARPETA_INFORMES = None  # informes de verificación (None = "_informes" junto a la carpeta principal)
+
+
+def _carpeta_informes(ctx):
+    return ctx.carpeta_informes or os.path.join(os.path.dirname(ctx.ruta), "_informes")
+
+
+def _comparador_sufijos(sufijos):
+    """
+    Devuelve una función nombre → sufijo esperado (o None). En lugar de probar
+    endswith con cada sufijo, busca el final del nombre en un conjunto por
+    cada longitud de sufijo.
+    """
+    por_longitud = defaultdict(set)
+    for sufijo in sufijos:
+        por_longitud[len(sufijo)].add(sufijo)
+    longitudes = sorted(por_longitud, reverse=True)
+
+    def comparar(nombre):
+        for n in longitudes:
+            if nombre[-n:] in por_longitud[n]:
+                return nombre[-n:]
+        return None
+    return comparar
+
+
+def _verificar_prospeccion(ctx, informe):
+    """
+    Rellena informe["prospeccion"] comparando "Prospección" con el Excel.
+    Devuelve (filas del sitio en el Excel o None, PDF presentes en Prospección).
+    """
+    inv = ctx.inventario
+    prospection_dir = os.path.join(ctx.ruta, "Prospección")
+    informe["prospeccion"] = {"faltantes": [], "adicionales": [], "error": None}
+    df = None
+    en_prospeccion = set()
+    try:
+        base = ctx.base_datos
+        if "ID Monumento" not in base.columnas or "Nombre Sitio" not in base.columnas:
+            informe["prospeccion"]["error"] = "El archivo Excel no contiene las columnas esperadas (ID Monumento y Nombre Sitio)."
+        else:
+            # Se filtran los registros que correspondan al nombre de la carpeta principal
+            df = base.sitio(ctx.sitio)
+            ids = df["ID Monumento"]
+            expected_files = set(ids[ids != ""].astype(str) + ".pdf")
+            en_prospeccion = set(f for f in inv.archivos(prospection_dir) if f.endswith(".pdf"))
+            ctx.contar("escaneados", len(en_prospeccion))
+            informe["prospeccion"]["faltantes"] = sorted(expected_files - en_prospeccion)
+            informe["prospeccion"]["adicionales"] = sorted(en_prospeccion - expected_files)
+    except Exception as e:
+        informe["prospeccion"]["error"] = f"Error al procesar el archivo Excel: {e}"
+    return df, en_prospeccion
+
+
+def _secciones_verificacion(ctx, informe):
+    """Rellena informe["sueltos"] y devuelve (sección, carpeta padre, subcarpeta) de ambas secciones."""
+    inv = ctx.inventario
+    excavation_id_dir = os.path.join(ctx.ruta, "Excavación por ID Monumento")
+    registros_unicos_dir = os.path.join(ctx.ruta, "Registros únicos")
+    informe["sueltos"] = {"excavacion": None, "registros": None}
+    secciones = []
+    if inv.es_carpeta(excavation_id_dir):
+        informe["sueltos"]["excavacion"] = [f for f in inv.archivos(excavation_id_dir) if f.lower().endswith(".pdf")]
+        secciones += [("excavacion", excavation_id_dir, c) for c in inv.subcarpetas(excavation_id_dir)]
+    if inv.es_carpeta(registros_unicos_dir):
+        informe["sueltos"]["registros"] = [f for f in inv.archivos(registros_unicos_dir) if f.endswith(".pdf")]
+        secciones += [("registros", registros_unicos_dir, c) for c in inv.subcarpetas(registros_unicos_dir)]
+    return secciones
+
+
+def _verificar_carpetas(ctx, secciones, avance=None):
+    """
+    Filas del informe de las subcarpetas `secciones` ((sección, carpeta
+    padre, subcarpeta)): se clasifican todos sus PDF en una sola pasada y
+    los sufijos faltantes y duplicados de todas las carpetas salen de
+    operaciones de conjuntos sobre los pares (carpeta, sufijo).
+    """
+    sufijo_de = _comparador_sufijos(SUFIJOS_ESPERADOS)
+    presentes = defaultdict(list)   # (carpeta, sufijo) → archivos
+    adicionales = defaultdict(list)  # carpeta → archivos sin sufijo esperado
+    pdfs = {}
+    for hechos, (seccion, padre, carpeta) in enumerate(secciones):
+        if avance is not None:
+            avance(hechos, len(secciones))
+        archivos = [f for f in ctx.inventario.archivos(os.path.join(padre, carpeta)) if f.lower().endswith(".pdf")]
+        pdfs[(seccion, carpeta)] = len(archivos)
+        ctx.contar("escaneados", len(archivos))
+        if seccion != "excavacion":
+            continue
+        for f in archivos:
+            sufijo = sufijo_de(f)
+            if sufijo is None:
+                adicionales[carpeta].append(f)
+            else:
+                presentes[(carpeta, sufijo)].append(f)
+
+    carpetas_excavacion = [c for s, _, c in secciones if s == "excavacion"]
+    faltantes = {(c, s) for c in carpetas_excavacion for s in SUFIJOS_ESPERADOS} - presentes.keys()
+    duplicados = {clave: lista for clave, lista in presentes.items() if len(lista) > 1}
+
+    filas = []
+    for seccion, padre, carpeta in secciones:
+        fila = {
+            "seccion": seccion,
+            "carpeta": carpeta,
+            "ids": [i.strip() for i in carpeta.split(",") if i.strip()] if carpeta.startswith("T") else [],
+            "pdfs": pdfs[(seccion, carpeta)],
+            "faltantes": [],
+            "duplicados": {},
+            "adicionales": [],
+        }
+        if seccion == "excavacion":
+            fila["faltantes"] = [s for s in SUFIJOS_ESPERADOS if (carpeta, s) in faltantes]
+            fila["duplicados"] = {s: duplicados[(carpeta, s)] for s in SUFIJOS_ESPERADOS if (carpeta, s) in duplicados}
+            fila["adicionales"] = adicionales.get(carpeta, [])
+            fila["estado"] = "ok" if not (fila["faltantes"] or fila["duplicados"] or fila["adicionales"]) else "revisar"
+        elif carpeta.startswith("T"):
+            # En "Registros únicos" basta con que cada subcarpeta "T..." tenga al menos un PDF
+            fila["estado"] = "ok" if fila["pdfs"] else "sin_pdf"
+        else:
+            fila["estado"] = "ok"
+        filas.append(fila)
+    return filas
+
+
+def _completar_informe(informe, df, en_prospeccion):
+    """Calcula los monumentos y el resumen del informe a partir de sus carpetas."""
+    estado_carpeta = {}
+    for fila in informe["carpetas"]:
+        for id_ in fila["ids"]:
+            estado_carpeta[id_] = (fila["carpeta"], fila["estado"])
+
+    # --- Un registro por monumento del Excel ---
+    informe["monumentos"] = []
+    if df is not None:
+        for id_, tipo in zip(df["ID Monumento"], df["Tipo de intervención"].str.strip()):
+            if not id_:
+                continue
+            carpeta, estado = estado_carpeta.get(id_, (None, "sin_carpeta"))
+            prospeccion = f"{id_}.pdf" in en_prospeccion
+            informe["monumentos"].append({
+                "id": id_,
+                "tipo": tipo,
+                "carpeta": carpeta,
+                "en_prospeccion": prospeccion,
+                "estado": estado if prospeccion or estado != "ok" else "sin_prospeccion",
+            })
+
+    informe["resumen"] = {
+        "carpetas": len(informe["carpetas"]),
+        "carpetas_con_problemas": sum(f["estado"] != "ok" for f in informe["carpetas"]),
+        "monumentos": len(informe["monumentos"]),
+        "monumentos_con_problemas": sum(m["estado"] != "ok" for m in informe["monumentos"]),
+        "faltantes_prospeccion": len(informe["prospeccion"]["faltantes"]),
+        "adicionales_prospeccion": len(informe["prospeccion"]["adicionales"]),
+        "sueltos": sum(len(s or []) for s in informe["sueltos"].values()),
+    }
+
+
+def verificar_sitio(ctx, avance=None):
+    """
+    Verifica el sitio en una sola pasada sobre el inventario y devuelve el
+    informe como diccionario (ver escribir_informe_verificacion):
+    - "prospeccion": PDF faltantes y adicionales en "Prospección" según el Excel
+    - "sueltos": PDF fuera de subcarpetas en "Excavación por ID Monumento" y "Registros únicos"
+    - "carpetas": una fila por subcarpeta con sus sufijos faltantes, duplicados y archivos adicionales
+    - "monumentos": una fila por ID del Excel con su carpeta y si está completo
+    """
+    informe = {"sitio": ctx.sitio, "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"), "carpetas": []}
+    df, en_prospeccion = _verificar_prospeccion(ctx, informe)
+    informe["carpetas"] = _verificar_carpetas(ctx, _secciones_verificacion(ctx, informe), avance)
+    _completar_informe(informe, df, en_prospeccion)
+    return informe
+
+
+def actualizar_verificacion(ctx, informe, carpetas):
+    """
+    Actualiza un informe de verificar_sitio después de cambios en `carpetas`
+    (rutas de subcarpetas de "Excavación por ID Monumento" o "Registros
+    únicos"): solo esas subcarpetas se vuelven a verificar, el resto de las
+    filas se conserva. Prospección, los sueltos, los monumentos y el resumen
+    se recalculan desde el inventario. Devuelve las filas nuevas o cambiadas.
+    """
+    afectadas = {_clave(c) for c in carpetas}
+    anteriores = {(f["seccion"], f["carpeta"]): f for f in informe["carpetas"]}
+    informe["fecha"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    df, en_prospeccion = _verificar_prospeccion(ctx, informe)
+    secciones = _secciones_verificacion(ctx, informe)
+    # La misma verificación de verificar_sitio, filtrada a las subcarpetas nuevas o afectadas
+    elegidas = [(seccion, padre, carpeta) for seccion, padre, carpeta in secciones
+                if (seccion, carpeta) not in anteriores or _clave(os.path.join(padre, carpeta)) in afectadas]
+    nuevas = {(f["seccion"], f["carpeta"]): f for f in _verificar_carpetas(ctx, elegidas)}
+    informe["carpetas"] = [nuevas.get((seccion, carpeta)) or anteriores[(seccion, carpeta)]
+                           for seccion, _, carpeta in secciones]
+    cambiadas = [fila for clave, fila in nuevas.items() if fila != anteriores.get(clave)]
+    _completar_informe(informe, df, en_prospeccion)
+    return cambiadas
+
+
+def escribir_informe_verificacion(informe, carpeta):
+    """
+    Guarda el informe en `carpeta`: <sitio>_verificacion.json con todo el
+    informe, y <sitio>_carpetas.csv y <sitio>_monumentos.csv con una fila por
+    subcarpeta y por monumento. Devuelve las rutas escritas.
+    """
+    os.makedirs(carpeta, exist_ok=True)
+    sitio = informe["sitio"]
+    rutas = [os.path.join(carpeta, f"{sitio}_{nombre}") for nombre in ("verificacion.json", "carpetas.csv", "monumentos.csv")]
+    with open(rutas[0], "w", encoding="utf-8") as f:
+        json.dump(informe, f, ensure_ascii=False, indent=1)
+    with open(rutas[1], "w", encoding="utf-8", newline="") as f:
+        escritor = csv.writer(f)
+        escritor.writerow(["seccion", "carpeta", "ids", "pdfs", "estado", "faltantes", "duplicados", "adicionales"])
+        for fila in informe["carpetas"]:
+            escritor.writerow([
+                fila["seccion"], fila["carpeta"], ";".join(fila["ids"]), fila["pdfs"], fila["estado"],
+                ";".join(fila["faltantes"]),
+                ";".join(a for lista in fila["duplicados"].values() for a in lista),
+                ";".join(fila["adicionales"]),
+            ])
+    with open(rutas[2], "w", encoding="utf-8", newline="") as f:
+        escritor = csv.writer(f)
+        escritor.writerow(["id", "tipo", "carpeta", "en_prospeccion", "estado"])
+        for m in informe["monumentos"]:
+            escritor.writerow([m["id"], m["tipo"], m["carpeta"] or "", int(m["en_prospeccion"]), m["estado"]])
+    return rutas
+
+
+def _registrar_verificacion(ctx, informe):
+    """Escribe el informe en el registro legible, con los mismos mensajes de siempre."""
+    prospeccion = informe["prospeccion"]
+    if prospeccion["error"]:
+        ctx.log(f"❌ {prospeccion['error']}")
+    else:
+        if prospeccion["faltantes"]:
+            ctx.log("❌ Faltan archivos en Prospección:")
+            for missing in prospeccion["faltantes"]:
+                ctx.log(f"   - {missing}")
+        if prospeccion["adicionales"]:
+            ctx.log("🚨 Archivos adicionales encontrados en Prospección:")
+            for extra in prospeccion["adicionales"]:
+                ctx.log(f"   - {extra}")
+        if not prospeccion["faltantes"] and not prospeccion["adicionales"]:
+            ctx.log("✅ Todos los archivos esperados están en la carpeta Prospección.")
+
+    # --- Archivos fuera de subcarpetas en Excavación por ID ---
+    sueltos = informe["sueltos"]["excavacion"]
+    if sueltos is None:
+        ctx.log(f"❌ La carpeta 'Excavación por ID Monumento' no existe en {ctx.ruta}")
+    elif sueltos:
+        ctx.log("🚨 Archivos fuera de subcarpetas encontrados en 'Excavación por ID Monumento':")
+        for f in sueltos:
+            ctx.log(f"   - {f}")
+    else:
+        ctx.log("✅ No hay archivos fuera de las subcarpetas en 'Excavación por ID Monumento'.")
+
+    # --- Verificación dentro de cada subcarpeta ---
+    for fila in informe["carpetas"]:
+        if fila["seccion"] != "excavacion":
+            continue
+        ctx.log(f"\n🔍 Verificando carpeta: {fila['carpeta']}")
+        if fila["faltantes"]:
+            ctx.log("❌ Faltan archivos:")
+            for m in fila["faltantes"]:
+                ctx.log(f"   - {m}")
+        if fila["duplicados"]:
+            ctx.log("⚠️ Archivos duplicados encontrados:")
+            for suf, lst in fila["duplicados"].items():
+                ctx.log(f"   - {suf}: {', '.join(lst)}")
+        if fila["adicionales"]:
+            ctx.log("🚨 Archivos adicionales encontrados:")
+            for e in fila["adicionales"]:
+                ctx.log(f"   - {e}")
+        if fila["estado"] == "ok":
+            ctx.log("✅ Todo está en orden en esta carpeta.")
+
+    # VERIFICACIÓN PARA "REGISTROS ÚNICOS"
+    ctx.log("\n--- Verificando la carpeta 'Registros únicos' ---")
+    archivos_sueltos = informe["sueltos"]["registros"]
+    if archivos_sueltos is None:
+        ctx.log(f"❌ La carpeta 'Registros únicos' no existe en {ctx.ruta}")
+        return
+    if archivos_sueltos:
+        ctx.log("🚨 Archivos fuera de subcarpetas encontrados en 'Registros únicos':")
+        for archivo in archivos_sueltos:
+            ctx.log(f"   - {archivo}")
+    else:
+        ctx.log("✅ No hay archivos fuera de subcarpetas en 'Registros únicos'.")
+    for fila in informe["carpetas"]:
+        if fila["seccion"] == "registros" and fila["carpeta"].startswith("T"):
+            if not fila["pdfs"]:
+                ctx.log(f"❌ ALERTA: La subcarpeta '{fila['carpeta']}' no contiene ningún documento PDF.")
+            else:
+                ctx.log(f"✅ La subcarpeta '{fila['carpeta']}' tiene {fila['pdfs']} documento(s) PDF.")
+
+
+def step6_verificacion_archivos(ctx=None):
+    ctx = _contexto(ctx)
+    if not ctx.ruta or not ctx.tiene_excel():
+        raise ValueError("Debe definir RUTA_PRINCIPAL y EXCEL_PATH")
+    ctx.log("\n--- Paso 6: Verificación de Archivos ---")
+    informe = verificar_sitio(ctx, avance=ctx.avance)
+    _registrar_verificacion(ctx, informe)
+    carpeta = _carpeta_informes(ctx)
+    try:
+        rutas = escribir_informe_verificacion(informe, carpeta)
+        ctx.log(f"\n📝 Informe de verificación: {', '.join(rutas)}")
+    except OSError as e:
+        ctx.log(f"❌ No se pudo guardar el informe de verificación en {carpeta}: {e}")
+    ctx.log("\n🎉 Verificación completada en la carpeta principal.")
+    return informe
+
+# =============================================================================
+# Paso 7: CREAR SUBCARPETA "Introducción general" y MOVER el archivo "IntroduccionGeneral.pdf"
+# =============================================================================
+def planificar_paso7(ctx, inv):
+    """Mueve "IntroduccionGeneral.pdf" a la subcarpeta "Introducción general"."""
+    # Ruta del archivo "IntroduccionGeneral.pdf" en la carpeta principal
+    archivo_introduccion = os.path.join(ctx.ruta, "IntroduccionGeneral.pdf")
+    ctx.contar("escaneados")
+    
+    # Ruta de la subcarpeta "Introducción general" dentro de la carpeta principal
+    carpeta_introduccion_general = os.path.join(ctx.ruta, "Introducción general")
+    plan = []
+    
+    # Verificar si el archivo existe en la carpeta principal
+    if not inv.existe(archivo_introduccion):
+        plan.append(_aviso(7, f"❌ No se encontró 'IntroduccionGeneral.pdf' en {ctx.ruta}"))
+        return plan
+
+    # Crear la subcarpeta "Introducción general" si no existe
+    if not inv.es_carpeta(carpeta_introduccion_general):
+        plan.append(Operacion(7, "crear_carpeta", carpeta_introduccion_general, None, None))
+        inv.registrar_carpeta(carpeta_introduccion_general)
+    
+    # Mover el archivo a la subcarpeta
+    nuevo_destino = os.path.join(carpeta_introduccion_general, "IntroduccionGeneral.pdf")
+    if inv.existe(nuevo_destino):
+        plan.append(_conflicto(7, f"⚠️ El archivo ya existe en '{carpeta_introduccion_general}': IntroduccionGeneral.pdf"))
+    else:
+        plan.append(Operacion(7, "mover", archivo_introduccion, nuevo_destino,
+                              f"✅ Movido 'IntroduccionGeneral.pdf' a '{carpeta_introduccion_general}'"))
+        inv.registrar_renombrado(archivo_introduccion, nuevo_destino)
+    return plan
+
+
+def step7_encarpetar_introduccion_general(ctx=None):
+    ctx = _contexto(ctx)
+    if not ctx.ruta:
+        raise ValueError("RUTA_PRINCIPAL no está definida")
+    ctx.log("\n--- Paso 7: Encarpetar Introducción General ---")
+    ejecutar_plan(ctx, planificar_paso7(ctx, ctx.inventario.copia()))
+
+# =============================================================================
+# Paso 8: BUSCAR ARCHIVOS PDF VACÍOS
+# =============================================================================
+PDF_WORKERS      = None  # procesos para revisar PDFs (None = os.cpu_count())
+PDF_EN_VUELO_MAX = 4     # tareas pendientes por proceso antes de esperar resultados
+CACHE_PDF        = True  # reutilizar veredictos de ejecuciones anteriores
+RUTA_CACHE_PDF   = None  # archivo SQLite de la caché (None = ".informes_cache.sqlite" en la carpeta principal)
+DUPLICADOS          = True   # buscar PDF con el mismo contenido en todo el sitio
+COLAPSAR_DUPLICADOS = False  # sustituir las copias idénticas por enlaces duros al primer archivo
+HASH_WORKERS        = 4      # hilos que calculan los hashes (la lectura del disco domina, no la CPU)
+
+# Resultado estructurado de la revisión de un PDF.
+# veredicto: "ok", "vacio", "en_blanco" (todas sus páginas en blanco), "corrupto"
+# (no se pudo interpretar o está truncado) o "error" (fallo de E/S al leerlo;
+# no se guarda en la caché). Ver `error`. `blancas`: páginas en blanco (desde 1),
+# solo con el nivel "blancas".
+ResultadoPDF = namedtuple("ResultadoPDF", ["ruta", "veredicto", "error", "paginas", "blancas"], defaults=(None, None))
+
+NIVEL_PDF   = "paginas"  # "estructura", "paginas" o "blancas" (ver revisar_pdf)
+NIVELES_PDF = {"estructura": 1, "paginas": 2, "blancas": 3}
+VENTANA_PDF = 4096       # bytes del principio y del final que mira la revisión rápida
+
+_STARTXREF = re.compile(rb"startxref\s+(\d+)")
+_XREF = re.compile(rb"xref\s*")
+_SUBSECCION_XREF = re.compile(rb"(\d+) (\d+)[ \t]*\r?\n")
+_TRAILER = re.compile(rb"\s*trailer\s*")
+# Operadores de un stream de contenido que escriben texto o pintan (Do, las imágenes, aparte)
+_OPERADORES_DIBUJO = frozenset(
+    [b"Tj", b"TJ", b"'", b'"', b"sh", b"BI", b"f", b"f*", b"F", b"B", b"B*", b"b", b"b*", b"S", b"s"]
+)
+# Un token de contenido: blancos, comentario, nombre, << >>, cadena hexadecimal,
+# [ ] { }, el inicio de una cadena literal o una palabra (operador o número)
+_TOKEN_CONTENIDO = re.compile(
+    rb"[\s\x00]+|%[^\r\n]*|/[^\s\x00()<>\[\]{}/%]*|<<|>>|<[0-9A-Fa-f\s\x00]*>|[\[\]{}]"
+    rb"|(?P<cadena>\()|(?P<palabra>[^\s\x00()<>\[\]{}/%]+)"
+)
+_NUMERO = re.compile(rb"[+-]?(?:\d+\.?\d*|\.\d+)")
+_PARENTESIS = re.compile(rb"[()\\]")
+
+
+def _estructura_pdf(mm):
+    """
+    Revisión rápida: cabecera %PDF al principio, %%EOF y startxref al final.
+    Devuelve (error o None, posición de la xref).
+    """
+    n = len(mm)
+    if mm.find(b"%PDF-", 0, min(n, 1024)) < 0:
+        return "Sin cabecera %PDF", None
+    inicio_cola = max(0, n - VENTANA_PDF)
+    fin = mm.rfind(b"%%EOF", inicio_cola)
+    if fin < 0:
+        return "Truncado: falta %%EOF al final del archivo", None
+    m = _STARTXREF.search(mm, mm.rfind(b"startxref", inicio_cola, fin), fin)
+    if m is None or int(m.group(1)) >= n:
+        return "Sin startxref válido", None
+    return None, int(m.group(1))
+
+
+def _paginas_por_xref(mm, inicio_xref):
+    """
+    Número de páginas leyendo solo la tabla xref, el trailer y los objetos
+    /Root y /Pages. Devuelve None si el archivo no lo permite (xref
+    comprimida, cifrado, entradas mal formadas...) y hay que usar PyPDF2.
+    """
+    secciones, raiz, pos, vistas = [], None, inicio_xref, set()
+    while pos is not None and pos not in vistas:
+        vistas.add(pos)
+        m = _XREF.match(mm, pos)
+        if m is None:
+            return None  # xref en un stream (PDF 1.5+)
+        pos, subsecciones = m.end(), []
+        while True:
+            m = _SUBSECCION_XREF.match(mm, pos)
+            if m is None:
+                break
+            primero, cantidad = int(m.group(1)), int(m.group(2))
+            subsecciones.append((primero, cantidad, m.end()))
+            pos = m.end() + 20 * cantidad  # cada entrada ocupa exactamente 20 bytes
+        m = _TRAILER.match(mm, pos)
+        if m is None:
+            return None
+        fin = mm.find(b"startxref", m.end())
+        trailer = mm[m.end():fin if fin >= 0 else m.end() + VENTANA_PDF]
+        if b"/Encrypt" in trailer or b"/XRefStm" in trailer:
+            return None
+        secciones.append(subsecciones)
+        if raiz is None:
+            r = re.search(rb"/Root\s+(\d+)\s+\d+\s+R", trailer)
+            raiz = r and int(r.group(1))
+        previa = re.search(rb"/Prev\s+(\d+)", trailer)
+        pos = previa and int(previa.group(1))
+
+    def objeto(numero):
+        for subsecciones in secciones:  # de la más reciente a la más antigua
+            for primero, cantidad, inicio in subsecciones:
+                if primero <= numero < primero + cantidad:
+                    entrada = mm[inicio + 20 * (numero - primero):inicio + 20 * (numero - primero + 1)]
+                    if entrada[10:11] != b" " or entrada[16:17] != b" " or entrada[17:18] != b"n":
+                        return None
+                    desplazamiento = int(entrada[:10])
+                    m = re.compile(rb"%d\s+\d+\s+obj" % numero).match(mm, desplazamiento)
+                    fin = m and mm.find(b"endobj", m.end())
+                    return mm[m.end():fin] if m and fin >= 0 else None
+        return None
+
+    catalogo = raiz is not None and objeto(raiz)
+    r = catalogo and re.search(rb"/Pages\s+(\d+)\s+\d+\s+R", catalogo)
+    paginas = r and objeto(int(r.group(1)))
+    r = paginas and re.search(rb"/Count\s+(\d+)(\s+\d+\s+R)?", paginas)
+    if not r or r.group(2):
+        return None
+    return int(r.group(1))
+
+
+def _operadores(datos):
+    """
+    Operadores de un stream de contenido, en orden. Se saltan los nombres
+    (/F1), las cadenas, los números y los comentarios: la "F" de "/F1 12 Tf"
+    o la "S" de "(Sitio) Tj" no son operadores.
+    """
+    i, n = 0, len(datos)
+    while i < n:
+        m = _TOKEN_CONTENIDO.match(datos, i)
+        if m is None:  # ")" o ">" sueltos
+            i += 1
+            continue
+        i = m.end()
+        if m.group("cadena"):
+            nivel = 1  # las cadenas admiten paréntesis anidados y \( escapados
+            while nivel and i < n:
+                p = _PARENTESIS.search(datos, i)
+                if p is None:
+                    i = n
+                    break
+                caracter, i = datos[p.start():p.start() + 1], p.end()
+                if caracter == b"\\":
+                    i += 1
+                else:
+                    nivel += 1 if caracter == b"(" else -1
+        elif m.group("palabra") and not _NUMERO.fullmatch(m.group("palabra")):
+            yield m.group("palabra")
+
+
+def _pagina_en_blanco(pagina):
+    """
+    Una página está en blanco si su contenido no escribe texto ni dibuja, o
+    si solo pinta imágenes casi uniformes (la hoja vacía de un escaneo; esta
+    parte necesita Pillow y, si no está, la página no se da por blanca).
+    """
+    contenido = pagina.get_contents()
+    if contenido is None:
+        datos = b""
+    elif isinstance(contenido, list):  # varios streams de contenido
+        datos = b"\n".join(parte.get_object().get_data() for parte in contenido)
+    else:
+        datos = contenido.get_data()
+    con_do = False
+    for operador in _operadores(datos):
+        if operador in _OPERADORES_DIBUJO:
+            return False
+        con_do = con_do or operador == b"Do"
+    if not con_do:
+        return True
+    try:
+        from PIL import Image
+        imagenes = list(pagina.images)
+    except Exception:
+        return False
+    if not imagenes:
+        return False  # XObjects de formulario: no se analizan
+    for imagen in imagenes:
+        with Image.open(io.BytesIO(imagen.data)) as im:
+            gris = im.convert("L")
+        gris.thumbnail((512, 512))
+        histograma = gris.histogram()
+        total = sum(histograma)
+        media = sum(i * n for i, n in enumerate(histograma)) / total
+        # Hoja vacía: casi ningún píxel bastante más oscuro que el fondo
+        if sum(histograma[:max(0, int(media) - 60)]) > total * 0.0005:
+            return False
+    return True
+
+
+def revisar_pdf(ruta_pdf, nivel="paginas"):
+    """
+    Determina si un PDF es vacío o está dañado, por niveles de más barato a más caro:
+
+    - "estructura": un archivo de 0 bytes es vacío; si falta la cabecera %PDF,
+      el %%EOF o el startxref (p. ej. una subida a medias) es corrupto. Solo
+      se leen los primeros y últimos VENTANA_PDF bytes a través de mmap.
+    - "paginas": además cuenta las páginas desde la xref, el trailer, /Root
+      y /Pages, sin interpretar el resto del archivo (con PyPDF2 si la xref
+      está comprimida). Sin páginas es vacío.
+    - "blancas": además busca con PyPDF2 las páginas en blanco; si lo están
+      todas el veredicto es "en_blanco".
+    """
+    blancas = None
+    try:
+        with open(ruta_pdf, 'rb') as archivo:
+            if os.fstat(archivo.fileno()).st_size == 0:
+                return ResultadoPDF(ruta_pdf, "vacio", None, 0)
+            with mmap.mmap(archivo.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                error, inicio_xref = _estructura_pdf(mm)
+                if error is not None:
+                    return ResultadoPDF(ruta_pdf, "corrupto", error)
+                if nivel == "estructura":
+                    return ResultadoPDF(ruta_pdf, "ok", None)
+                paginas = _paginas_por_xref(mm, inicio_xref)
+            if paginas is None or nivel == "blancas":
+                archivo.seek(0)
+                lector = PyPDF2.PdfReader(archivo)
+                paginas = len(lector.pages)
+                if nivel == "blancas":
+                    blancas = []
+                    for i, pagina in enumerate(lector.pages, 1):
+                        try:
+                            en_blanco = _pagina_en_blanco(pagina)
+                        except Exception:
+                            en_blanco = False  # no se pudo analizar: se da por escrita
+                        if en_blanco:
+                            blancas.append(i)
+                    blancas = tuple(blancas)
+    except OSError as e:
+        return ResultadoPDF(ruta_pdf, "error", f"{type(e).__name__}: {e}")
+    except Exception as e:
+        return ResultadoPDF(ruta_pdf, "corrupto", f"{type(e).__name__}: {e}")
+    if paginas == 0:
+        return ResultadoPDF(ruta_pdf, "vacio", None, 0, blancas)
+    if blancas is not None and len(blancas) == paginas:
+        return ResultadoPDF(ruta_pdf, "en_blanco", None, paginas, blancas)
+    return ResultadoPDF(ruta_pdf, "ok", None, paginas, blancas)
+
+
+class CachePDF:
+    """
+    Caché persistente (SQLite) de veredictos de PDF.
+
+    Cada entrada se identifica por la ruta relativa a la carpeta principal y
+    solo es válida mientras el tamaño, mtime e inodo del archivo no cambien.
+    Si la ruta no está, se busca por (inodo, tamaño, mtime) para reconocer
+    archivos que los pasos 3 y 5 movieron o renombraron. Un veredicto solo
+    sirve para revisiones del mismo nivel (NIVELES_PDF) o inferior.
+    También guarda el SHA-256 del contenido que calcula buscar_duplicados.
+    """
+
+    COMPACTAR_DESDE = 0.25  # fracción de filas eliminadas a partir de la cual se hace VACUUM
+
+    def __init__(self, ruta_db, raiz):
+        self.raiz = raiz
+        self.con = sqlite3.connect(ruta_db)
+        self.con.execute(
+            """CREATE TABLE IF NOT EXISTS pdfs (
+                   ruta     TEXT PRIMARY KEY,
+                   tamano   INTEGER NOT NULL,
+                   mtime_ns INTEGER NOT NULL,
+                   inodo    INTEGER NOT NULL,
+                   paginas  INTEGER,
+                   veredicto TEXT NOT NULL,
+                   error    TEXT,
+                   nivel    INTEGER NOT NULL,
+                   blancas  TEXT,
+                   hash     TEXT
+               )"""
+        )
+        self.con.execute("CREATE INDEX IF NOT EXISTS pdfs_identidad ON pdfs (inodo, tamano, mtime_ns)")
+
+    def _relativa(self, ruta):
+        return os.path.relpath(ruta, self.raiz)
+
+    def buscar(self, ruta, st, nivel="paginas"):
+        columnas = "tamano, mtime_ns, inodo, paginas, veredicto, error, nivel, blancas"
+        fila = self.con.execute(
+            f"SELECT {columnas} FROM pdfs WHERE ruta = ?", (self._relativa(ruta),)
+        ).fetchone()
+        if fila is None and st.st_ino:
+            fila = self.con.execute(
+                f"SELECT {columnas} FROM pdfs WHERE inodo = ? AND tamano = ? AND mtime_ns = ?",
+                (st.st_ino, st.st_size, st.st_mtime_ns),
+            ).fetchone()
+        if fila is None or fila[:3] != (st.st_size, st.st_mtime_ns, st.st_ino):
+            return None
+        # Un archivo dañado lo es en cualquier nivel; si no, el nivel guardado debe alcanzar
+        if fila[4] != "corrupto" and fila[6] < NIVELES_PDF[nivel]:
+            return None
+        blancas = None if fila[7] is None else tuple(json.loads(fila[7]))
+        return ResultadoPDF(ruta, fila[4], fila[5], fila[3], blancas)
+
+    def guardar(self, pares, nivel="paginas"):
+        """
+        Guarda una lista de (ResultadoPDF, os.stat_result) revisados con `nivel`;
+        los errores de E/S no se guardan.
+        """
+        # El hash se conserva mientras el archivo no cambie
+        with self.con:
+            self.con.executemany(
+                """INSERT INTO pdfs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, NULL)
+                   ON CONFLICT (ruta) DO UPDATE SET
+                       hash = CASE WHEN (tamano, mtime_ns, inodo) = (excluded.tamano, excluded.mtime_ns, excluded.inodo)
+                                   THEN hash END,
+                       tamano = excluded.tamano, mtime_ns = excluded.mtime_ns, inodo = excluded.inodo,
+                       paginas = excluded.paginas, veredicto = excluded.veredicto, error = excluded.error,
+                       nivel = excluded.nivel, blancas = excluded.blancas""",
+                [
+                    (self._relativa(r.ruta), st.st_size, st.st_mtime_ns, st.st_ino, r.paginas, r.veredicto, r.error,
+                     NIVELES_PDF[nivel], None if r.blancas is None else json.dumps(r.blancas))
+                    for r, st in pares
+                    if r.veredicto != "error"
+                ],
+            )
+
+    def buscar_hash(self, ruta, st):
+        """SHA-256 guardado de `ruta` si el archivo no cambió (o de otro enlace del mismo inodo), o None."""
+        fila = self.con.execute(
+            "SELECT hash FROM pdfs WHERE ruta = ? AND tamano = ? AND mtime_ns = ? AND inodo = ? AND hash IS NOT NULL",
+            (self._relativa(ruta), st.st_size, st.st_mtime_ns, st.st_ino),
+        ).fetchone()
+        if fila is None and st.st_ino:
+            fila = self.con.execute(
+                "SELECT hash FROM pdfs WHERE inodo = ? AND tamano = ? AND mtime_ns = ? AND hash IS NOT NULL",
+                (st.st_ino, st.st_size, st.st_mtime_ns),
+            ).fetchone()
+        return fila and fila[0]
+
+    def guardar_hashes(self, tripletas):
+        """Guarda una lista de (ruta, os.stat_result, hash) en las entradas que siguen vigentes."""
+        with self.con:
+            self.con.executemany(
+                "UPDATE pdfs SET hash = ? WHERE ruta = ? AND tamano = ? AND mtime_ns = ? AND inodo = ?",
+                [(h, self._relativa(ruta), st.st_size, st.st_mtime_ns, st.st_ino) for ruta, st, h in tripletas],
+            )
+
+    def compactar(self, rutas_vistas):
+        """Elimina las entradas de archivos que ya no existen y compacta la base si hace falta."""
+        vistas = {self._relativa(r) for r in rutas_vistas}
+        total = self.con.execute("SELECT COUNT(*) FROM pdfs").fetchone()[0]
+        obsoletas = [(r,) for (r,) in self.con.execute("SELECT ruta FROM pdfs") if r not in vistas]
+        if not obsoletas:
+            return 0
+        with self.con:
+            self.con.executemany("DELETE FROM pdfs WHERE ruta = ?", obsoletas)
+        if len(obsoletas) >= total * self.COMPACTAR_DESDE:
+            self.con.execute("VACUUM")
+        return len(obsoletas)
+
+    def cerrar(self):
+        self.con.close()
+
+
+def es_pdf_vacio(ruta_pdf):
+    return revisar_pdf(ruta_pdf).veredicto == "vacio"
+
+
+def _revisar_en_paralelo(rutas, workers, avance=None, nivel="paginas"):
+    """
+    Revisa `rutas` con revisar_pdf(ruta, nivel) en un pool de procesos con un
+    número acotado de tareas en vuelo.
+    `avance(n)` se llama con el número de resultados obtenidos hasta el momento.
+    """
+    resultados = []
+    avance = avance or (lambda n: None)
+    if workers <= 1:
+        for ruta in rutas:
+            avance(len(resultados))
+            resultados.append(revisar_pdf(ruta, nivel))
+        return resultados
+    max_en_vuelo = workers * PDF_EN_VUELO_MAX
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        en_vuelo = set()
+        for ruta in rutas:
+            if len(en_vuelo) >= max_en_vuelo:
+                hechos, en_vuelo = wait(en_vuelo, return_when=FIRST_COMPLETED)
+                resultados.extend(f.result() for f in hechos)
+                avance(len(resultados))
+            en_vuelo.add(pool.submit(revisar_pdf, ruta, nivel))
+        for f in as_completed(en_vuelo):
+            resultados.append(f.result())
+            avance(len(resultados))
+    return resultados
+
+
+def _rutas_pdf(inventario, carpeta_raiz):
+    return [
+        os.path.join(ruta_directorio, archivo)
+        for ruta_directorio, subdirectorios, archivos in inventario.recorrer(carpeta_raiz)
+        for archivo in archivos
+        if archivo.lower().endswith('.pdf')
+    ]
+
+
+def buscar_pdfs_vacios(carpeta_raiz, workers=None, cache=None, inventario=None, avance=None, nivel=None,
+                       rutas=None):
+    """
+    Recorre la carpeta y subcarpetas y revisa todos los PDF con el `nivel`
+    de revisar_pdf (por defecto NIVEL_PDF).
+    Si se indica una CachePDF, solo se leen los archivos nuevos o modificados.
+    Sin `inventario` se escanea `carpeta_raiz` desde cero.
+    Con `rutas` solo se revisan esos PDF (y la caché no se compacta).
+    `avance(hechos, total)` recibe el número de PDF revisados.
+    Devuelve una lista de ResultadoPDF ordenada por ruta.
+    """
+    todas = rutas is None
+    if todas:
+        if inventario is None:
+            inventario = InventarioSitio(carpeta_raiz)
+        rutas = _rutas_pdf(inventario, carpeta_raiz)
+    nivel = nivel or NIVEL_PDF
+    if nivel not in NIVELES_PDF:
+        raise ValueError(f"NIVEL_PDF desconocido: {nivel!r}")
+    resultados, pendientes, stats = [], [], {}
+    for ruta in rutas:
+        if cache is None:
+            pendientes.append(ruta)
+            continue
+        try:
+            stats[ruta] = st = os.stat(ruta)
+        except OSError as e:
+            resultados.append(ResultadoPDF(ruta, "error", f"{type(e).__name__}: {e}"))
+            continue
+        guardado = cache.buscar(ruta, st, nivel)
+        if guardado is None:
+            pendientes.append(ruta)
+        else:
+            resultados.append(guardado)
+
+    if workers is None:
+        workers = PDF_WORKERS or os.cpu_count() or 1
+    workers = max(1, min(workers, len(pendientes)))
+    en_cache = len(resultados)
+    nuevos = _revisar_en_paralelo(
+        pendientes, workers, avance and (lambda n: avance(en_cache + n, len(rutas))), nivel
+    )
+    resultados.extend(nuevos)
+    if cache is not None:
+        # Se guardan también los aciertos para registrar la ruta actual de archivos movidos
+        cache.guardar([(r, stats[r.ruta]) for r in resultados if r.ruta in stats], nivel)
+        if todas:
+            cache.compactar(rutas)
+    return sorted(resultados, key=lambda r: r.ruta)
+
+
+# Archivos distintos en disco con el mismo contenido. `archivos` tiene una
+# tupla de rutas por archivo (varias si son enlaces duros del mismo inodo),
+# ordenadas por ruta; el primero es el que se conserva al colapsar.
+GrupoDuplicados = namedtuple("GrupoDuplicados", ["hash", "tamano", "archivos"])
+
+
+def _hash_o_error(ruta):
+    try:
+        return _hash_archivo(ruta)
+    except OSError:
+        return None
+
+
+def buscar_duplicados(rutas, cache=None, workers=None, avance=None):
+    """
+    Busca entre `rutas` los archivos con el mismo contenido (SHA-256).
+    Primero se agrupan por tamaño y solo se leen los que comparten tamaño con
+    otro archivo; los enlaces duros de un mismo inodo cuentan como un archivo.
+    Con una CachePDF no se vuelven a leer los archivos que no cambiaron.
+    `avance(hechos, total)` recibe el número de archivos leídos.
+    Devuelve una lista de GrupoDuplicados, primero los que más espacio ocupan.
+    """
+    stats, por_tamano = {}, defaultdict(dict)  # tamaño → (dispositivo, inodo) → rutas
+    for ruta in rutas:
+        try:
+            st = os.stat(ruta)
+        except OSError:
+            continue
+        if st.st_size == 0:
+            continue  # los PDF vacíos ya los informa el paso 8
+        stats[ruta] = st
+        por_tamano[st.st_size].setdefault((st.st_dev, st.st_ino), []).append(ruta)
+    candidatos = {}  # (dispositivo, inodo) → rutas, solo de tamaños repetidos
+    for archivos in por_tamano.values():
+        if len(archivos) > 1:
+            candidatos.update(archivos)
+
+    hashes, pendientes = {}, []
+    for clave, rutas_archivo in candidatos.items():
+        guardado = cache.buscar_hash(rutas_archivo[0], stats[rutas_archivo[0]]) if cache else None
+        if guardado:
+            hashes[clave] = guardado
+        else:
+            pendientes.append(clave)
+    workers = max(1, min(workers or HASH_WORKERS, len(pendientes)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # hashlib suelta el GIL con bloques grandes: los hilos leen y calculan a la vez
+        calculados = pool.map(lambda clave: _hash_o_error(candidatos[clave][0]), pendientes)
+        for hechos, (clave, h) in enumerate(zip(pendientes, calculados), 1):
+            if h:
+                hashes[clave] = h
+            if avance:
+                avance(hechos, len(pendientes))
+    if cache is not None:
+        cache.guardar_hashes([
+            (ruta, stats[ruta], hashes[clave])
+            for clave in pendientes if clave in hashes
+            for ruta in candidatos[clave]
+        ])
+
+    por_contenido = defaultdict(list)
+    for clave, h in hashes.items():
+        por_contenido[(h, stats[candidatos[clave][0]].st_size)].append(tuple(sorted(candidatos[clave])))
+    grupos = [
+        GrupoDuplicados(h, tamano, sorted(archivos))
+        for (h, tamano), archivos in por_contenido.items()
+        if len(archivos) > 1
+    ]
+    return sorted(grupos, key=lambda g: (-g.tamano * (len(g.archivos) - 1), g.archivos[0]))
+
+
+def _sin_copias_encarpetadas(ctx, grupos):
+    """
+    Quita de `grupos` las copias que el paso 5 hace a propósito: un PDF con
+    varios IDs en el nombre se coloca, con el mismo nombre, en la carpeta de
+    cada monumento (enlazado o copiado según ESTRATEGIA_ENCARPETADO). En cada
+    grupo, los archivos con el mismo nombre en distintas subcarpetas de
+    "Excavación por ID Monumento" o de "Registros únicos" cuentan como uno.
+    Devuelve (grupos que quedan, número de copias encarpetadas).
+    """
+    secciones = {_clave(os.path.join(ctx.ruta, s)) for s in ("Excavación por ID Monumento", "Registros únicos")}
+    quedan, encarpetadas = [], 0
+    for grupo in grupos:
+        archivos, posicion = [], {}  # (sección, nombre) → índice en `archivos`
+        for rutas in grupo.archivos:
+            seccion, nombre = _clave(os.path.dirname(os.path.dirname(rutas[0]))), os.path.basename(rutas[0])
+            if seccion in secciones and len(PATRON_ID.findall(nombre)) > 1:
+                clave = (seccion, os.path.normcase(nombre))
+                if clave in posicion:
+                    i = posicion[clave]
+                    archivos[i] = tuple(sorted(archivos[i] + rutas))
+                    encarpetadas += 1
+                    continue
+                posicion[clave] = len(archivos)
+            archivos.append(rutas)
+        if len(archivos) > 1:
+            quedan.append(grupo._replace(archivos=sorted(archivos)))
+    return quedan, encarpetadas
+
+
+def colapsar_duplicados(grupos, log=print, contar=None):
+    """
+    Sustituye cada copia de un grupo por un enlace duro al primer archivo
+    (enlace temporal + os.replace, así la ruta nunca queda sin archivo).
+    Ojo: los enlaces comparten el contenido, editar uno cambia todos.
+    Devuelve los bytes liberados.
+    """
+    liberados = 0
+    for grupo in grupos:
+        original = grupo.archivos[0][0]
+        for copia in grupo.archivos[1:]:
+            for ruta in copia:
+                temporal = ruta + ".enlace-tmp"
+                try:
+                    os.link(original, temporal)
+                    os.replace(temporal, ruta)
+                except OSError as e:
+                    log(f"❌ No se pudo enlazar {ruta} con {original}: {e}")
+                    if os.path.lexists(temporal):
+                        os.remove(temporal)
+                    if contar:
+                        contar("errores")
+                    break
+                if contar:
+                    contar("enlazados")
+            else:
+                liberados += grupo.tamano
+    return liberados
+
+
+def _informe_duplicados(ctx, grupos):
+    """Escribe <sitio>_duplicados.csv en la carpeta de informes (una fila por ruta)."""
+    ruta_informe = os.path.join(_carpeta_informes(ctx), f"{ctx.sitio}_duplicados.csv")
+    try:
+        os.makedirs(os.path.dirname(ruta_informe), exist_ok=True)
+        with open(ruta_informe, "w", encoding="utf-8", newline="") as f:
+            escritor = csv.writer(f)
+            escritor.writerow(["grupo", "hash", "tamano", "archivo", "ruta"])
+            for n, grupo in enumerate(grupos, 1):
+                for i, rutas in enumerate(grupo.archivos, 1):
+                    for ruta in rutas:
+                        escritor.writerow([n, grupo.hash, grupo.tamano, i, os.path.relpath(ruta, ctx.ruta)])
+        ctx.log(f"📝 Informe de duplicados: {ruta_informe}")
+    except OSError as e:
+        ctx.log(f"❌ No se pudo guardar {ruta_informe}: {e}")
+
+
+def _cache_pdf(ctx):
+    if not ctx.cache_pdf:
+        return None
+    return CachePDF(ctx.ruta_cache_pdf or os.path.join(ctx.ruta, ".informes_cache.sqlite"), ctx.ruta)
+
+
+def step8_buscar_pdfs_vacios(ctx=None):
+    ctx = _contexto(ctx)
+    if not ctx.ruta:
+        raise ValueError("RUTA_PRINCIPAL no está definida")
+    ctx.log("\n--- Paso 8: Buscar PDFs Vacíos ---")
+    cache = _cache_pdf(ctx)
+    try:
+        resultados = buscar_pdfs_vacios(ctx.ruta, workers=ctx.pdf_workers, cache=cache,
+                                        inventario=ctx.inventario, avance=ctx.avance, nivel=ctx.nivel_pdf)
+        duplicados, encarpetadas = [], 0
+        if ctx.duplicados:
+            duplicados = buscar_duplicados([r.ruta for r in resultados], cache=cache, avance=ctx.avance)
+            duplicados, encarpetadas = _sin_copias_encarpetadas(ctx, duplicados)
+    finally:
+        if cache is not None:
+            cache.cerrar()
+    vacios = [r for r in resultados if r.veredicto == "vacio"]
+    corruptos = [r for r in resultados if r.veredicto == "corrupto"]
+    errores = [r for r in resultados if r.veredicto == "error"]
+    en_blanco = [r for r in resultados if r.veredicto == "en_blanco"]
+    con_blancas = [r for r in resultados if r.veredicto == "ok" and r.blancas]
+    ctx.contar("escaneados", len(resultados))
+    ctx.contar("errores", len(errores))
+    ctx.log(f"Revisados {len(resultados)} archivos PDF.")
+    if vacios:
+        ctx.log("Se encontraron los siguientes archivos PDF vacíos:")
+        for r in vacios:
+            ctx.log(r.ruta)
+    else:
+        ctx.log("No se encontraron archivos PDF vacíos.")
+    if en_blanco:
+        ctx.log("📄 Archivos PDF con todas las páginas en blanco:")
+        for r in en_blanco:
+            ctx.log(f"   - {r.ruta}")
+    if con_blancas:
+        ctx.log("📄 Archivos PDF con alguna página en blanco:")
+        for r in con_blancas:
+            ctx.log(f"   - {r.ruta}: página(s) {', '.join(map(str, r.blancas))}")
+    if corruptos:
+        ctx.log("🚨 Archivos PDF dañados o ilegibles:")
+        for r in corruptos:
+            ctx.log(f"   - {r.ruta}: {r.error}")
+    if errores:
+        ctx.log("❌ No se pudieron leer los siguientes archivos PDF:")
+        for r in errores:
+            ctx.log(f"   - {r.ruta}: {r.error}")
+    if duplicados:
+        sobrante = sum(g.tamano * (len(g.archivos) - 1) for g in duplicados)
+        ctx.log(f"🧬 {len(duplicados)} documento(s) repetido(s) con el mismo contenido "
+                f"({sobrante / 2**20:.1f} MB en copias):")
+        for grupo in duplicados:
+            ctx.log(f"   - {' = '.join(os.path.relpath(rutas[0], ctx.ruta) for rutas in grupo.archivos)}")
+        _informe_duplicados(ctx, duplicados)
+        if ctx.colapsar_duplicados:
+            liberados = colapsar_duplicados(duplicados, log=ctx.log, contar=ctx.contar)
+            ctx.log(f"🔗 Copias sustituidas por enlaces duros: {liberados / 2**20:.1f} MB liberados.")
+    elif ctx.duplicados:
+        ctx.log("No se encontraron PDF repetidos.")
+    if encarpetadas:
+        ctx.log(f"📎 {encarpetadas} copia(s) que el paso 5 colocó en la carpeta de cada monumento de su nombre "
+                f"(no se cuentan como repetidos).")
+    return resultados
+
+
+# =============================================================================
+# Paso 9: ENSAMBLAR LOS INFORMES PDF
+# =============================================================================
+ENSAMBLADO_WORKERS = None  # procesos que ensamblan informes a la vez (None = os.cpu_count())
+INFORME_SITIO      = True  # además del de cada carpeta, un informe de todo el sitio
+VEREDICTOS_OMITIDOS = ("vacio", "corrupto", "error")  # PDF del paso 8 que no entran en los informes
+
+# Informe a ensamblar. `secciones`: lista de (título, ruta del PDF),
+# (título, lista de secciones) para anidar los marcadores o (título, ruta del
+# PDF, sus marcadores) para conservar los de un PDF ya ensamblado (ver
+# _marcadores_pdf). `fuentes`: los PDF y carpetas de los que sale; si
+# ninguno cambió después del informe, no se rehace.
+InformePDF = namedtuple("InformePDF", ["ruta", "titulo", "secciones", "fuentes"])
+
+# Resultado de un informe; estado: "ensamblado", "al_dia" o "error"
+ResultadoInforme = namedtuple("ResultadoInforme", ["ruta", "estado", "paginas", "error"], defaults=(None, None))
+
+
+class EscritorPDF:
+    """
+    Escribe un PDF nuevo con las páginas de otros PDF, objeto a objeto.
+
+    PyPDF2.PdfWriter clona todas las páginas en memoria y las escribe al
+    final, así que un informe ocupa en memoria lo mismo que sus PDF. Aquí cada
+    objeto se escribe en cuanto se copia y el lector olvida los objetos de
+    una página al terminarla: la memoria queda acotada por la página más
+    grande y no por el tamaño del informe. Los objetos que comparten las
+    páginas de un mismo PDF (fuentes, imágenes) se escriben una sola vez.
+    """
+
+    def __init__(self, ruta):
+        self._f = open(ruta, "wb")
+        self._f.write(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+        self._posiciones = [None]  # posición en el archivo de cada objeto (el 0 no se usa)
+        self.paginas = []  # referencias de las páginas escritas
+        self._raiz_paginas = self._reservar()
+
+    def _reservar(self):
+        self._posiciones.append(None)
+        return IndirectObject(len(self._posiciones) - 1, 0, None)
+
+    def _escribir(self, ref, objeto):
+        self._posiciones[ref.idnum] = self._f.tell()
+        self._f.write(f"{ref.idnum} 0 obj\n".encode())
+        objeto.write_to_stream(self._f, None)
+        self._f.write(b"\nendobj\n")
+
+    def agregar(self, ruta):
+        """Copia las páginas del PDF `ruta`; devuelve el índice de la primera (None si no tiene)."""
+        with open(ruta, "rb") as archivo:
+            lector = PyPDF2.PdfReader(archivo)
+            if lector.is_encrypted:
+                lector.decrypt("")
+            mapa, pendientes = {}, []  # (número, generación) en el origen → referencia en el informe
+
+            def traducir(obj):
+                if isinstance(obj, IndirectObject):
+                    clave = (obj.idnum, obj.generation)
+                    if clave not in mapa:
+                        mapa[clave] = self._reservar()
+                        pendientes.append(obj)
+                    return mapa[clave]
+                if isinstance(obj, StreamObject):
+                    # Los flujos ya descomprimidos (también los ContentStream que PyPDF2
+                    # interpreta) se copian tal cual; el resto, con sus bytes y su /Filter
+                    nuevo = DecodedStreamObject() if isinstance(obj, DecodedStreamObject) else StreamObject()
+                    nuevo._data = obj._data
+                elif isinstance(obj, DictionaryObject):
+                    nuevo = DictionaryObject()
+                elif isinstance(obj, ArrayObject):
+                    return ArrayObject(traducir(v) for v in obj)
+                else:
+                    return obj
+                for clave, valor in obj.items():
+                    nuevo[clave] = traducir(valor)
+                return nuevo
+
+            paginas = list(lector.pages)
+            # Las páginas se numeran antes de copiar nada: los enlaces entre páginas apuntan a su copia
+            destinos = []
+            for pagina in paginas:
+                destinos.append(self._reservar())
+                if pagina.indirect_reference is not None:
+                    ref = pagina.indirect_reference
+                    mapa[(ref.idnum, ref.generation)] = destinos[-1]
+            primera = len(self.paginas) if paginas else None
+            for pagina, destino in zip(paginas, destinos):
+                nueva = DictionaryObject()
+                for clave, valor in pagina.items():
+                    if clave not in ("/Parent", "/StructParents"):
+                        nueva[clave] = traducir(valor)
+                nueva[NameObject("/Parent")] = self._raiz_paginas
+                self._escribir(destino, nueva)
+                self.paginas.append(destino)
+                while pendientes:
+                    ref = pendientes.pop()
+                    objeto = ref.get_object()
+                    if objeto is None or isinstance(objeto, DictionaryObject) and objeto.get("/Type") == "/Pages":
+                        objeto = NullObject()  # el árbol de páginas del origen no se copia
+                    self._escribir(mapa[(ref.idnum, ref.generation)], traducir(objeto))
+                lector.resolved_objects.clear()
+        return primera
+
+    def _escribir_marcadores(self, marcadores, padre):
+        refs = [self._reservar() for _ in marcadores]
+        for i, ((titulo, pagina, hijos), ref) in enumerate(zip(marcadores, refs)):
+            item = DictionaryObject({
+                NameObject("/Title"): create_string_object(titulo),
+                NameObject("/Parent"): padre,
+                NameObject("/Dest"): ArrayObject([self.paginas[pagina], NameObject("/Fit")]),
+            })
+            if i:
+                item[NameObject("/Prev")] = refs[i - 1]
+            if i + 1 < len(refs):
+                item[NameObject("/Next")] = refs[i + 1]
+            if hijos:
+                item[NameObject("/First")], item[NameObject("/Last")] = self._escribir_marcadores(hijos, ref)
+                item[NameObject("/Count")] = NumberObject(-len(hijos))  # cerrado
+            self._escribir(ref, item)
+        return refs[0], refs[-1]
+
+    def cerrar(self, marcadores=(), titulo=None):
+        """
+        Escribe el árbol de páginas, los `marcadores` (lista de (título,
+        índice de página, marcadores hijos)), el catálogo y la tabla xref.
+        """
+        self._escribir(self._raiz_paginas, DictionaryObject({
+            NameObject("/Type"): NameObject("/Pages"),
+            NameObject("/Kids"): ArrayObject(self.paginas),
+            NameObject("/Count"): NumberObject(len(self.paginas)),
+        }))
+        catalogo = DictionaryObject({
+            NameObject("/Type"): NameObject("/Catalog"),
+            NameObject("/Pages"): self._raiz_paginas,
+        })
+        if marcadores:
+            raiz = self._reservar()
+            primero, ultimo = self._escribir_marcadores(marcadores, raiz)
+            self._escribir(raiz, DictionaryObject({
+                NameObject("/Type"): NameObject("/Outlines"),
+                NameObject("/First"): primero,
+                NameObject("/Last"): ultimo,
+                NameObject("/Count"): NumberObject(len(marcadores)),
+            }))
+            catalogo[NameObject("/Outlines")] = raiz
+            catalogo[NameObject("/PageMode")] = NameObject("/UseOutlines")
+        ref_catalogo = self._reservar()
+        self._escribir(ref_catalogo, catalogo)
+        ref_info = self._reservar()
+        info = DictionaryObject({NameObject("/Producer"): create_string_object("miscript")})
+        if titulo:
+            info[NameObject("/Title")] = create_string_object(titulo)
+        self._escribir(ref_info, info)
+
+        inicio_xref = self._f.tell()
+        lineas = [f"xref\n0 {len(self._posiciones)}\n", "0000000000 65535 f \n"]
+        lineas += [
+            "0000000000 65535 f \n" if posicion is None else f"{posicion:010d} 00000 n \n"
+            for posicion in self._posiciones[1:]
+        ]
+        self._f.write("".join(lineas).encode())
+        self._f.write(f"trailer\n<< /Size {len(self._posiciones)} /Root {ref_catalogo.idnum} 0 R "
+                      f"/Info {ref_info.idnum} 0 R >>\nstartxref\n{inicio_xref}\n%%EOF\n".encode())
+        self._f.close()
+
+    def descartar(self):
+        """Cierra el archivo sin terminarlo (el llamador lo elimina)."""
+        self._f.close()
+
+
+def ensamblar_informe(informe):
+    """
+    Ensambla `informe` (InformePDF) con un marcador por sección. Se escribe
+    en un archivo temporal que sustituye al anterior solo si todo salió bien.
+    Devuelve un ResultadoInforme.
+    """
+    os.makedirs(os.path.dirname(informe.ruta), exist_ok=True)
+    temporal = informe.ruta + ".tmp"
+    escritor = EscritorPDF(temporal)
+
+    def desplazar(marcadores, primera):
+        return [(titulo, primera + pagina, desplazar(hijos, primera)) for titulo, pagina, hijos in marcadores]
+
+    def agregar(secciones):
+        marcadores = []
+        for titulo, contenido, *propios in secciones:
+            if isinstance(contenido, str):
+                try:
+                    primera = escritor.agregar(contenido)
+                except Exception as e:
+                    raise ValueError(f"{contenido}: {type(e).__name__}: {e}") from e
+                if primera is not None:
+                    marcadores.append((titulo, primera, desplazar(propios[0], primera) if propios else []))
+            else:
+                hijos = agregar(contenido)
+                if hijos:
+                    marcadores.append((titulo, hijos[0][1], hijos))
+        return marcadores
+
+    try:
+        marcadores = agregar(informe.secciones)
+        if not escritor.paginas:
+            raise ValueError("ninguno de sus PDF tiene páginas")
+        escritor.cerrar(marcadores, informe.titulo)
+        os.replace(temporal, informe.ruta)
+    except Exception as e:
+        escritor.descartar()
+        with contextlib.suppress(OSError):
+            os.remove(temporal)
+        return ResultadoInforme(informe.ruta, "error", None, str(e) if isinstance(e, ValueError) else f"{type(e).__name__}: {e}")
+    return ResultadoInforme(informe.ruta, "ensamblado", len(escritor.paginas))
+
+
+def _informe_al_dia(informe):
+    """El informe existe y ninguna de sus fuentes cambió después (mover o quitar un PDF cambia su carpeta)."""
+    try:
+        hecho = os.stat(informe.ruta).st_mtime_ns
+        return all(os.stat(fuente).st_mtime_ns <= hecho for fuente in informe.fuentes)
+    except OSError:
+        return False
+
+
+def _titulo(nombre):
+    return os.path.splitext(nombre)[0]
+
+
+def _veredictos_pdf(ctx, rutas):
+    """
+    Resultado del paso 8 (ResultadoPDF) de cada una de `rutas`. Las que el
+    paso 8 no revisó en esta ejecución (no se eligió con --steps o ya estaba
+    hecho en la ejecución que se reanuda) se revisan ahora, con la caché.
+    """
+    veredictos = {r.ruta: r for r in ctx.resultados.get(8) or []}
+    faltan = [ruta for ruta in rutas if ruta not in veredictos]
+    if faltan:
+        cache = _cache_pdf(ctx)
+        try:
+            revisados = buscar_pdfs_vacios(ctx.ruta, workers=ctx.pdf_workers, cache=cache,
+                                           nivel=ctx.nivel_pdf, rutas=faltan)
+        finally:
+            if cache is not None:
+                cache.cerrar()
+        veredictos.update((r.ruta, r) for r in revisados)
+    return veredictos
+
+
+def _marcadores_pdf(ruta):
+    """Marcadores de un PDF como (título, índice de página, hijos), los que recibe EscritorPDF.cerrar."""
+    lector = PyPDF2.PdfReader(ruta)
+
+    def convertir(elementos):
+        marcadores = []
+        for elemento in elementos:
+            if isinstance(elemento, list):  # hijos del marcador anterior
+                if marcadores:
+                    marcadores[-1][2].extend(convertir(elemento))
+            else:
+                marcadores.append((elemento.title, lector.get_destination_page_number(elemento), []))
+        return marcadores
+
+    return convertir(lector.outline)
+
+
+def planificar_informes(ctx, carpeta_salida):
+    """
+    Informes de cada carpeta del sitio según el inventario, en `carpeta_salida`:
+    - uno por subcarpeta de "Excavación por ID Monumento" con los siete
+      documentos de SUFIJOS_ESPERADOS, en ese orden (ver _verificar_carpetas);
+    - uno por subcarpeta "T..." de "Registros únicos", por nombre de archivo.
+    Los PDF que el paso 8 marcó con VEREDICTOS_OMITIDOS no se incluyen.
+    Devuelve (informes, [(carpeta, motivo, ruta de su informe)] de las
+    carpetas sin informe, [ResultadoPDF] de los PDF omitidos).
+    """
+    inv = ctx.inventario
+    sufijo_de = _comparador_sufijos(SUFIJOS_ESPERADOS)
+    orden = {sufijo: i for i, sufijo in enumerate(SUFIJOS_ESPERADOS)}
+    candidatos, omitidas = [], []
+    carpetas = _secciones_verificacion(ctx, {})
+    for (seccion, padre, carpeta), fila in zip(carpetas, _verificar_carpetas(ctx, carpetas)):
+        ruta = os.path.join(padre, carpeta)
+        ruta_informe = os.path.join(carpeta_salida, os.path.basename(padre), f"{carpeta}.pdf")
+        pdfs = [f for f in inv.archivos(ruta) if f.lower().endswith(".pdf")]
+        if seccion == "excavacion":
+            if fila["faltantes"] or fila["duplicados"]:
+                motivo = f"faltan {', '.join(map(_titulo, fila['faltantes']))}" if fila["faltantes"] \
+                    else f"documentos repetidos: {', '.join(map(_titulo, fila['duplicados']))}"
+                omitidas.append((carpeta, motivo, ruta_informe))
+                continue
+            documentos = sorted((orden[sufijo_de(f)], f) for f in pdfs if sufijo_de(f))
+            secciones = [(_titulo(SUFIJOS_ESPERADOS[i]), os.path.join(ruta, f)) for i, f in documentos]
+        elif carpeta.startswith("T") and pdfs:
+            secciones = [(_titulo(f), os.path.join(ruta, f)) for f in sorted(pdfs)]
+        else:
+            continue
+        candidatos.append((carpeta, ruta, ruta_informe, secciones))
+
+    veredictos = _veredictos_pdf(ctx, [r for *_, secciones in candidatos for _, r in secciones])
+    informes, descartados = [], []
+    for carpeta, ruta, ruta_informe, secciones in candidatos:
+        # Las fuentes incluyen los omitidos: si se sustituyen por uno bueno, el informe se rehace
+        fuentes = [ruta] + [r for _, r in secciones]
+        malos = [veredictos[r] for _, r in secciones if veredictos[r].veredicto in VEREDICTOS_OMITIDOS]
+        descartados += malos
+        secciones = [(t, r) for t, r in secciones if veredictos[r].veredicto not in VEREDICTOS_OMITIDOS]
+        if not secciones:
+            omitidas.append((carpeta, "todos sus PDF están vacíos o dañados", ruta_informe))
+            continue
+        informes.append(InformePDF(ruta_informe, f"{ctx.sitio} - {carpeta}", secciones, fuentes))
+    return informes, omitidas, descartados
+
+
+def planificar_informe_sitio(ctx, carpeta_salida, rutas_informes):
+    """
+    <sitio>.pdf: "Introducción general" seguida de los informes de carpeta
+    ya ensamblados (`rutas_informes`, en el orden de planificar_informes),
+    con los marcadores anidados por sección, carpeta y documento.
+    None si no hay ningún informe de carpeta.
+    """
+    if not rutas_informes:
+        return None
+    inv = ctx.inventario
+    secciones, fuentes = [], []
+    carpeta_intro = os.path.join(ctx.ruta, "Introducción general")
+    intro = [os.path.join(carpeta_intro, f) for f in sorted(inv.archivos(carpeta_intro)) if f.lower().endswith(".pdf")] \
+        if inv.es_carpeta(carpeta_intro) else []
+    if not intro and inv.es_archivo(os.path.join(ctx.ruta, "IntroduccionGeneral.pdf")):
+        intro = [os.path.join(ctx.ruta, "IntroduccionGeneral.pdf")]  # sin el paso 7
+    intro = [r for r in intro if _veredictos_pdf(ctx, [r])[r].veredicto not in VEREDICTOS_OMITIDOS]
+    if intro:
+        secciones.append(("Introducción general", intro[0] if len(intro) == 1
+                          else [(_titulo(os.path.basename(r)), r) for r in intro]))
+        fuentes += [carpeta_intro] + intro
+    for titulo in ("Excavación por ID Monumento", "Registros únicos"):
+        carpeta = os.path.join(carpeta_salida, titulo)
+        propios = [r for r in rutas_informes if os.path.dirname(r) == carpeta]
+        if propios:
+            secciones.append((titulo, [(_titulo(os.path.basename(r)), r, _marcadores_pdf(r)) for r in propios]))
+            # La carpeta cambia si aparece o desaparece el informe de un monumento
+            fuentes += [carpeta] + propios
+    return InformePDF(os.path.join(carpeta_salida, f"{ctx.sitio}.pdf"), ctx.sitio, secciones, fuentes)
+
+
+def _ensamblar_en_paralelo(informes, workers, avance=None):
+    """
+    Ensambla `informes` en un pool de procesos, los de más documentos
+    primero para que el del sitio no quede para el final.
+    `avance(n)` se llama con el número de informes terminados.
+    """
+    informes = sorted(informes, key=lambda i: len(i.fuentes), reverse=True)
+    avance = avance or (lambda n: None)
+    resultados = []
+    if workers <= 1:
+        for informe in informes:
+            avance(len(resultados))
+            resultados.append(ensamblar_informe(informe))
+        return resultados
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for futuro in as_completed([pool.submit(ensamblar_informe, informe) for informe in informes]):
+            resultados.append(futuro.result())
+            avance(len(resultados))
+    return resultados
+
+
+def step9_ensamblar_informes(ctx=None):
+    ctx = _contexto(ctx)
+    if not ctx.ruta:
+        raise ValueError("RUTA_PRINCIPAL no está definida")
+    ctx.log("\n--- Paso 9: Ensamblar Informes PDF ---")
+    carpeta = os.path.join(_carpeta_informes(ctx), f"{ctx.sitio}_informes_pdf")
+    informes, omitidas, descartados = planificar_informes(ctx, carpeta)
+    for r in descartados:
+        ctx.log(f"⚠️ Se omite del informe {os.path.relpath(r.ruta, ctx.ruta)} ({r.veredicto}"
+                f"{': ' + r.error if r.error else ''})")
+    for nombre, motivo, ruta_informe in omitidas:
+        ctx.log(f"⏭️ Sin informe para '{nombre}': {motivo}")
+        if os.path.exists(ruta_informe):
+            # El de una ejecución anterior ya no corresponde a la carpeta
+            try:
+                os.remove(ruta_informe)
+            except OSError as e:
+                ctx.log(f"⚠️ No se pudo eliminar el informe anterior {os.path.relpath(ruta_informe, carpeta)}: {e}")
+            else:
+                ctx.log(f"🗑️ Se eliminó el informe anterior: {os.path.relpath(ruta_informe, carpeta)}")
+
+    def ensamblar(informes, workers):
+        pendientes, al_dia = [], []
+        for informe in informes:
+            if _informe_al_dia(informe):
+                al_dia.append(ResultadoInforme(informe.ruta, "al_dia"))
+            else:
+                pendientes.append(informe)
+        ctx.contar("escaneados", sum(len(i.fuentes) for i in pendientes))
+        workers = max(1, min(workers, len(pendientes)))
+        return _ensamblar_en_paralelo(pendientes, workers, lambda n: ctx.avance(n, len(pendientes))), al_dia
+
+    resultados, al_dia = ensamblar(informes, ctx.ensamblado_workers or os.cpu_count() or 1)
+    if INFORME_SITIO:
+        # Solo con los informes de carpeta que quedaron bien: uno que falla no arrastra al del sitio
+        correctos = {r.ruta for r in resultados + al_dia if r.estado != "error"}
+        sitio = planificar_informe_sitio(ctx, carpeta, [i.ruta for i in informes if i.ruta in correctos])
+        if sitio is not None:
+            hechos, ya = ensamblar([sitio], 1)
+            resultados += hechos
+            al_dia += ya
+    errores = [r for r in resultados if r.estado == "error"]
+    ctx.contar("errores", len(errores))
+    for r in sorted(resultados):
+        if r.estado == "error":
+            ctx.log(f"❌ No se pudo ensamblar {os.path.relpath(r.ruta, carpeta)}: {r.error}")
+        else:
+            ctx.log(f"📕 {os.path.relpath(r.ruta, carpeta)}: {r.paginas} página(s)")
+    ctx.log(f"\n📚 Informes en {carpeta}: {len(resultados) - len(errores)} ensamblados, "
+            f"{len(al_dia)} ya al día, {len(errores)} con errores, {len(omitidas)} carpetas sin informe.")
+    return sorted(resultados + al_dia)
+
+
+# =============================================================================
+# Función principal
+# =============================================================================
+PASOS = [
+    step1_renombrar_carpetas,
+    step2_renombrar_archivos,
+    step3_mover_archivos_renombrados,
+    step4_crear_subcarpetas,
+    step5_encarpetar_archivos,
+    step6_verificacion_archivos,
+    step7_encarpetar_introduccion_general,
+    step8_buscar_pdfs_vacios,
+    step9_ensamblar_informes,
+]
+
+# Pasos que mueven PDF: el paso 8 espera a que terminen, porque un PDF que
+# cambia de ruta mientras se revisa se daría por ilegible
+MUEVEN_PDF = (1, 2, 3, 5, 7)
+# Pasos que deben terminar antes de cada paso (ver _dependencias): el 4 crea
+# las carpetas de los grupos dentro de "Excavación por ID Monumento", que crea
+# el paso 3, y el 5 reparte lo que dejan el 3 y el 4. El 7 no depende de
+# ninguno; el 9 ensambla las carpetas que deja el 5 y la introducción que
+# encarpeta el 7, sin los PDF que el 8 encontró vacíos o dañados.
+DEPENDENCIAS = {1: (), 2: (1,), 3: (2,), 4: (3,), 5: (3, 4), 6: (5,), 7: (), 8: MUEVEN_PDF, 9: (5, 7, 8)}
+NECESITAN_EXCEL = (4, 6)
+PASOS_SIMULTANEOS = 1  # pasos que main() ejecuta a la vez (1 = uno tras otro, en orden)
+
+# Pasos que modifican el árbol y su planificador (los pasos 6 y 8 solo leen)
+PLANIFICADORES = {
+    1: planificar_paso1,
+    2: planificar_paso2,
+    3: planificar_paso3,
+    4: planificar_paso4,
+    5: planificar_paso5,
+    7: planificar_paso7,
+}
+
+
+def planificar_sitio(ctx, pasos=None):
+    """
+    Plan completo de los pasos que modifican el árbol (o solo de `pasos`),
+    simulado sobre una copia del inventario: cada paso se planifica con el
+    resultado de los anteriores y no se toca el disco.
+    """
+    inv = ctx.inventario.copia()
+    plan = []
+    for numero, planificar in PLANIFICADORES.items():
+        if pasos is None or numero in pasos:
+            plan.extend(planificar(ctx, inv))
+    return plan
+
+
+def imprimir_plan(plan, log=print):
+    """Muestra el plan agrupado por paso, con los conflictos al principio de cada uno."""
+    por_paso = defaultdict(list)
+    for op in plan:
+        por_paso[op.paso].append(op)
+    for numero, ops in sorted(por_paso.items()):
+        cambios = [op for op in ops if op.accion not in ("aviso", "conflicto")]
+        conflictos = [op for op in ops if op.accion == "conflicto"]
+        log(f"\n--- Paso {numero}: {len(cambios)} operaciones, {len(conflictos)} conflictos ---")
+        for op in conflictos:
+            log(op.mensaje)
+        for op in cambios:
+            destino = f" → {op.destino}" if op.destino else ""
+            log(f"  {op.accion:<13} {op.origen}{destino}")
+
+
+def _ejecutar_paso(ctx, numero, funcion, diario=None):
+    """Ejecuta y mide un paso; con `diario` lo marca como completado al terminar."""
+    ctx.paso = numero
+    with medir_paso(ctx, numero, funcion.__name__):
+        ctx.avance(0, 1)
+        resultado = ctx.resultados[numero] = funcion(ctx)
+        ctx.avance(1, 1)
+    if diario is not None:
+        diario.paso_completado(numero)
+    return resultado
+
+
+def _dependencias(numero, pasos):
+    """
+    Pasos de `pasos` que deben terminar antes del paso `numero`: los de
+    DEPENDENCIAS que se ejecutan y, en lugar de los que no, sus propias
+    dependencias.
+    """
+    dependencias, pendientes = set(), list(DEPENDENCIAS[numero])
+    while pendientes:
+        d = pendientes.pop()
+        if d in pasos:
+            dependencias.add(d)
+        else:
+            pendientes.extend(DEPENDENCIAS[d])
+    return dependencias
+
+
+def _ejecutar_simultaneos(ctx, pasos, jobs, diario):
+    """
+    Ejecuta `pasos` con hasta `jobs` hilos: cada paso empieza en cuanto
+    terminan los pasos de los que depende (ver _dependencias). Si un paso
+    falla no se empiezan más, se esperan los que están en curso y se relanza
+    el error. Devuelve el resultado del último paso.
+    """
+    pendientes = {numero: _dependencias(numero, pasos) for numero in pasos}
+    hechos, resultados, error = set(), {}, None
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        en_curso = {}
+        while True:
+            if error is None:
+                for numero, dependencias in list(pendientes.items()):
+                    if dependencias <= hechos:
+                        del pendientes[numero]
+                        en_curso[pool.submit(_ejecutar_paso, ctx, numero, PASOS[numero - 1], diario)] = numero
+            if not en_curso:
+                break
+            listos, _ = wait(en_curso, return_when=FIRST_COMPLETED)
+            for futuro in listos:
+                numero = en_curso.pop(futuro)
+                try:
+                    resultados[numero] = futuro.result()
+                except BaseException as e:
+                    error = error or e
+                else:
+                    hechos.add(numero)
+    if error is not None:
+        raise error
+    return resultados[max(pasos)]
+
+
+def main(ctx=None, pasos=None, jobs=None):
+    """
+    Ejecuta los pasos sobre un sitio y devuelve el resultado del último (con
+    todos los pasos, los informes del paso 9); el de cada paso queda en
+    ctx.resultados.
+    Sin `ctx` se usa un contexto nuevo a partir de RUTA_PRINCIPAL y EXCEL_PATH.
+    `pasos` elige qué pasos se ejecutan (por defecto todos); los que no se
+    ejecutan se dan por hechos. Con `jobs` > 1 (por defecto
+    PASOS_SIMULTANEOS) los pasos independientes se ejecutan a la vez, ver
+    _ejecutar_simultaneos.
+    Si una ejecución anterior quedó interrumpida, se reanuda a partir de su
+    diario (ver Diario) y se omiten los pasos que ya había completado.
+    """
+    global _CONTEXTO
+    if ctx is None:
+        # Validar
+        if RUTA_PRINCIPAL is None or EXCEL_PATH is None:
+            raise ValueError("RUTA_PRINCIPAL y EXCEL_PATH deben asignarse antes de ejecutar main()")
+        ctx = _CONTEXTO = ContextoSitio(RUTA_PRINCIPAL, EXCEL_PATH, ruta_cache_pdf=RUTA_CACHE_PDF)
+    todos = range(1, len(PASOS) + 1)
+    pasos = sorted(set(pasos)) if pasos else list(todos)
+    desconocidos = [n for n in pasos if n not in todos]
+    if desconocidos:
+        raise ValueError(f"Pasos desconocidos: {desconocidos} (van del 1 al {len(PASOS)})")
+    if not ctx.tiene_excel() and any(n in NECESITAN_EXCEL for n in pasos):
+        raise ValueError(f"Los pasos {' y '.join(map(str, NECESITAN_EXCEL))} necesitan el Excel")
+    jobs = jobs or PASOS_SIMULTANEOS
+    if jobs > 1 and ctx.perfilar:
+        ctx.log("⚠️ Con perfilado los pasos se ejecutan uno tras otro.")
+        jobs = 1
+    # Excel una sola vez; el diario repara lo que una ejecución interrumpida dejó
+    # a medias antes de escanear el sitio. Si se eligieron algunos pasos y se
+    # reanuda otra ejecución, el diario se conserva hasta completarlos todos.
+    diario = None
+    if ctx.usar_diario:
+        reanuda = os.path.exists(os.path.join(ctx.ruta, NOMBRE_DIARIO))
+        diario = Diario(ctx.ruta, clave_excel=ctx.base_datos.clave if ctx.tiene_excel() else None, log=ctx.log)
+        for numero in [n for n in pasos if n in diario.pasos_hechos]:
+            ctx.log(f"\n⏭️ Paso {numero} ya completado en la ejecución anterior, se omite.")
+        pendientes = [n for n in pasos if n not in diario.pasos_hechos]
+    else:
+        pendientes = pasos
+    # Inventario del sitio en una sola pasada; los pasos lo comparten
+    ctx.inventario.diario = diario
+    terminado = False
+    try:
+        resultado = None
+        if jobs > 1 and len(pendientes) > 1:
+            resultado = _ejecutar_simultaneos(ctx, pendientes, jobs, diario)
+        else:
+            # Llamadas secuenciales
+            for numero in pendientes:
+                resultado = _ejecutar_paso(ctx, numero, PASOS[numero - 1], diario)
+        terminado = diario is None or not reanuda or set(todos) <= diario.pasos_hechos
+        ctx.log("\n📊 Métricas por paso:\n" + tabla_metricas(ctx.metricas))
+    finally:
+        ctx.inventario.diario = None
+        if diario is not None:
+            diario.cerrar(terminado, ctx.inventario)
+    return resultado
+
+
+# =============================================================================
+# MODO LOTE: TODOS LOS SITIOS DE UNA CARPETA EN PARALELO
+# =============================================================================
+LOTE_WORKERS = None  # sitios procesados a la vez (None = número de CPU)
+
+# Resumen de un sitio procesado en lote; estado: "ok" o "error"
+ResumenSitio = namedtuple(
+    "ResumenSitio",
+    ["sitio", "ruta", "estado", "error", "duracion", "pdfs_vacios", "pdfs_danados", "registro"],
+)
+
+
+def _procesar_sitio(ruta, base_datos, registro, opciones):
+    """Ejecuta todos los pasos sobre un sitio (dentro del pool) con su propio registro."""
+    inicio = time.perf_counter()
+    with open(registro, "w", encoding="utf-8") as f:
+        log = functools.partial(print, file=f, flush=True)
+        ctx = ContextoSitio(ruta, base_datos=base_datos, log=log, **opciones)
+        try:
+            main(ctx)
+            # Si el paso 8 ya estaba hecho en la ejecución que se reanudó, sus resultados salen de la caché
+            if 8 in ctx.resultados:
+                resultados = ctx.resultados[8]
+            else:
+                resultados = list(_veredictos_pdf(ctx, _rutas_pdf(ctx.inventario, ctx.ruta)).values())
+        except Exception as e:
+            log(traceback.format_exc())
+            return ResumenSitio(ctx.sitio, ruta, "error", f"{type(e).__name__}: {e}",
+                                time.perf_counter() - inicio, None, None, registro)
+    return ResumenSitio(
+        ctx.sitio, ruta, "ok", None, time.perf_counter() - inicio,
+        sum(r.veredicto == "vacio" for r in resultados),
+        sum(r.veredicto in ("corrupto", "error") for r in resultados),
+        registro,
+    )
+
+
+def procesar_lote(carpeta_padre, excel_path, workers=None, carpeta_registros=None, log=print):
+    """
+    Procesa todas las subcarpetas de `carpeta_padre` cuyo nombre coincide con
+    un "Nombre Sitio" del Excel, cada una en un proceso del pool.
+
+    El Excel se lee una sola vez y cada sitio recibe solo sus filas. Cada sitio
+    escribe su registro en `carpeta_registros/<sitio>.log` (por defecto
+    "_registros" dentro de `carpeta_padre`) y un sitio que falla no detiene a
+    los demás. Devuelve la lista de ResumenSitio ordenada por sitio.
+    """
+    base = cargar_base_datos(excel_path, log=log)
+    sitios_excel = set(base.sitios())
+    carpetas = sorted(e.name for e in os.scandir(carpeta_padre) if e.is_dir())
+    sitios = [c for c in carpetas if c in sitios_excel]
+    sin_carpeta = sorted(sitios_excel - set(carpetas))
+    if sin_carpeta:
+        log(f"⚠️ Sitios del Excel sin carpeta en {carpeta_padre}: {', '.join(sin_carpeta)}")
+    if not sitios:
+        log(f"❌ Ninguna carpeta de {carpeta_padre} coincide con un 'Nombre Sitio' del Excel.")
+        return []
+
+    carpeta_registros = carpeta_registros or os.path.join(carpeta_padre, "_registros")
+    os.makedirs(carpeta_registros, exist_ok=True)
+    workers = max(1, min(workers or LOTE_WORKERS or os.cpu_count() or 1, len(sitios)))
+    # Los procesos de los pasos 8 y 9 se reparten entre los sitios que corren a la vez
+    opciones = {
+        "estrategia_encarpetado": ESTRATEGIA_ENCARPETADO,
+        "pdf_workers": max(1, (PDF_WORKERS or os.cpu_count() or 1) // workers),
+        "ensamblado_workers": max(1, (ENSAMBLADO_WORKERS or os.cpu_count() or 1) // workers),
+        "cache_pdf": CACHE_PDF,
+        "io_workers": IO_WORKERS,
+        "metricas_jsonl": METRICAS_JSONL,
+        "nivel_pdf": NIVEL_PDF,
+        "duplicados": DUPLICADOS,
+        "colapsar_duplicados": COLAPSAR_DUPLICADOS,
+        "usar_diario": DIARIO,
+        "perfilar": PERFILAR,
+        "carpeta_perfiles": CARPETA_PERFILES,
+        "carpeta_informes": CARPETA_INFORMES,
+    }
+    log(f"Procesando {len(sitios)} sitios con {workers} procesos...")
+
+    resumenes = []
+    # Procesos nuevos (spawn) y no copias de este (fork): un fork hecho mientras
+    # otro hilo tiene tomado un lock (el de logging, el del pool de pasos...)
+    # deja ese lock tomado para siempre en el hijo. Por eso las opciones del
+    # sitio viajan en `opciones` y no en las variables globales.
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futuros = {
+            pool.submit(
+                _procesar_sitio,
+                os.path.join(carpeta_padre, sitio),
+                BaseDatos(base.sitio(sitio, compactar=True), base.columnas, origen=excel_path, clave=base.clave),
+                os.path.join(carpeta_registros, f"{sitio}.log"),
+                opciones,
+            ): sitio
+            for sitio in sitios
+        }
+        for futuro in as_completed(futuros):
+            sitio = futuros[futuro]
+            try:
+                resumen = futuro.result()
+            except Exception as e:  # p. ej. el proceso del sitio terminó abruptamente
+                resumen = ResumenSitio(sitio, os.path.join(carpeta_padre, sitio), "error",
+                                       f"{type(e).__name__}: {e}", None, None, None,
+                                       os.path.join(carpeta_registros, f"{sitio}.log"))
+            if resumen.estado == "ok":
+                log(f"✅ {sitio}: {resumen.duracion:.1f} s, {resumen.pdfs_vacios} PDF vacíos, "
+                    f"{resumen.pdfs_danados} dañados")
+            else:
+                log(f"❌ {sitio}: {resumen.error} (ver {resumen.registro})")
+            resumenes.append(resumen)
+    return sorted(resumenes, key=lambda r: r.sitio)
+
+
+# =============================================================================
+# MODO VIGILANCIA: PROCESAR LOS PDF NUEVOS A MEDIDA QUE LLEGAN
+# =============================================================================
+VIGILAR_ESPERA     = 2.0   # segundos sin cambios antes de procesar una tanda
+VIGILAR_ESPERA_MAX = 30.0  # segundos como máximo que una tanda acumula cambios
+VIGILAR_TANDA_MAX  = 2000  # cambios por tanda
+VIGILAR_SONDEO     = 5.0   # segundos entre recorridos del árbol cuando no hay inotify
+VIGILAR_INOTIFY    = True  # usar inotify en Linux (False = siempre sondeo)
+
+
+def _ignorada(ruta, ignorar, raiz):
+    """True si `ruta` o alguna de sus carpetas (hasta `raiz`) está en `ignorar`."""
+    while True:
+        if ruta in ignorar:
+            return True
+        padre = os.path.dirname(ruta)
+        if ruta == raiz or padre == ruta:
+            return False
+        ruta = padre
+
+
+class _VigilanteInotify:
+    """
+    Cambios del árbol con inotify (Linux) a través de ctypes: un watch por
+    carpeta, que se agregan también para las carpetas nuevas.
+
+    esperar() devuelve {ruta: tipo} con tipo "cambio" (PDF escrito o traído
+    de otra carpeta), "borrado" (PDF o carpeta que desapareció), "carpeta"
+    (carpeta nueva) o "desbordado" (la cola del núcleo se llenó y hay que
+    volver a leer el árbol).
+    """
+
+    IN_CLOSE_WRITE, IN_MOVED_FROM, IN_MOVED_TO, IN_CREATE, IN_DELETE = 0x8, 0x40, 0x80, 0x100, 0x200
+    IN_Q_OVERFLOW, IN_IGNORED, IN_ISDIR = 0x4000, 0x8000, 0x40000000
+    MASCARA = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    EVENTO = struct.Struct("iIII")  # wd, mask, cookie, len (seguido del nombre)
+
+    def __init__(self, raiz):
+        import ctypes
+        import ctypes.util
+        self.raiz = raiz
+        self._ctypes = ctypes
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+        if self._fd < 0:
+            self._error()
+        self._carpetas = {}  # wd → ruta
+        self._ignorar = set()
+        try:
+            self._agregar(raiz)
+        except OSError:
+            os.close(self._fd)
+            raise
+
+    def _error(self, ruta=None):
+        err = self._ctypes.get_errno()
+        raise OSError(err, os.strerror(err), ruta)
+
+    def _agregar(self, ruta, cambios=None):
+        """Vigila `ruta` y sus subcarpetas; con `cambios`, anota lo que ya contienen."""
+        pila = [ruta]
+        while pila:
+            carpeta = pila.pop()
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(carpeta), self.MASCARA)
+            if wd < 0:
+                if self._ctypes.get_errno() == errno.ENOSPC:
+                    self._error(carpeta)  # límite de fs.inotify.max_user_watches
+                continue  # la carpeta ya no existe
+            # Una carpeta movida conserva su wd: solo cambia la ruta
+            self._carpetas[wd] = carpeta
+            # Se lista después de agregar el watch: lo que llegue entre medias no se pierde
+            try:
+                with os.scandir(carpeta) as it:
+                    for entrada in it:
+                        if entrada.is_dir(follow_symlinks=False):
+                            pila.append(entrada.path)
+                            if cambios is not None:
+                                cambios[entrada.path] = "carpeta"
+                        elif cambios is not None and entrada.name.lower().endswith(".pdf"):
+                            cambios[entrada.path] = "cambio"
+            except OSError:
+                pass
+
+    def esperar(self, timeout):
+        cambios = {}
+        listos, _, _ = select.select([self._fd], [], [], timeout)
+        if not listos:
+            return cambios
+        while True:
+            try:
+                datos = os.read(self._fd, 1 << 16)
+            except BlockingIOError:
+                break
+            self._interpretar(datos, cambios)
+        self._ignorar = set()
+        return cambios
+
+    def _interpretar(self, datos, cambios):
+        pos = 0
+        while pos < len(datos):
+            wd, mascara, _, largo = self.EVENTO.unpack_from(datos, pos)
+            nombre = os.fsdecode(datos[pos + self.EVENTO.size:pos + self.EVENTO.size + largo].rstrip(b"\0"))
+            pos += self.EVENTO.size + largo
+            if mascara & self.IN_Q_OVERFLOW:
+                cambios[self.raiz] = "desbordado"
+                continue
+            if mascara & self.IN_IGNORED:
+                self._carpetas.pop(wd, None)
+                continue
+            carpeta = self._carpetas.get(wd)
+            if carpeta is None or not nombre:
+                continue
+            ruta = os.path.join(carpeta, nombre)
+            propia = ruta in self._ignorar
+            if mascara & self.IN_ISDIR:
+                if mascara & (self.IN_CREATE | self.IN_MOVED_TO):
+                    # Las carpetas creadas o renombradas por el propio flujo solo se vigilan
+                    self._agregar(ruta, None if propia else cambios)
+                    if not propia:
+                        cambios[ruta] = "carpeta"
+                elif not propia:
+                    cambios[ruta] = "borrado"
+            elif not propia and nombre.lower().endswith(".pdf"):
+                if mascara & (self.IN_CLOSE_WRITE | self.IN_MOVED_TO):
+                    cambios[ruta] = "cambio"
+                elif mascara & (self.IN_DELETE | self.IN_MOVED_FROM):
+                    cambios[ruta] = "borrado"
+
+    def ignorar(self, rutas):
+        """No informar en la próxima espera los eventos de `rutas` (operaciones del propio flujo)."""
+        self._ignorar = set(rutas)
+
+    def cerrar(self):
+        os.close(self._fd)
+
+
+class _VigilanteSondeo:
+    """
+    Cambios del árbol comparando recorridos periódicos (tamaño y mtime de
+    cada PDF, y las carpetas); mismo esperar() que _VigilanteInotify.
+
+    Sin inotify no se sabe cuándo termina de copiarse un archivo: un PDF
+    nuevo o modificado se informa recién cuando el recorrido siguiente lo
+    encuentra con el mismo tamaño y mtime, así uno que se está subiendo
+    (p. ej. a una unidad de red) no se mueve a medio copiar.
+    """
+
+    def __init__(self, raiz, intervalo):
+        self.raiz = raiz
+        self.intervalo = intervalo
+        self._ignorar = set()
+        self._pendientes = set()  # PDF que cambiaron en el último recorrido
+        self._estado = self._foto()
+        self._proximo = time.monotonic() + intervalo
+
+    def _foto(self):
+        estado = {}  # ruta → (tamaño, mtime) de los PDF, None de las carpetas
+        pila = [self.raiz]
+        while pila:
+            try:
+                with os.scandir(pila.pop()) as it:
+                    for entrada in it:
+                        if entrada.is_dir(follow_symlinks=False):
+                            estado[entrada.path] = None
+                            pila.append(entrada.path)
+                        elif entrada.name.lower().endswith(".pdf"):
+                            st = entrada.stat()
+                            estado[entrada.path] = (st.st_size, st.st_mtime_ns)
+            except OSError:
+                pass
+        return estado
+
+    def esperar(self, timeout):
+        restante = self._proximo - time.monotonic()
+        if restante > timeout:
+            time.sleep(timeout)
+            return {}
+        time.sleep(max(0.0, restante))
+        self._proximo = time.monotonic() + self.intervalo
+        nuevo = self._foto()
+        cambios = {}
+        for ruta, firma in nuevo.items():
+            if ruta not in self._estado or self._estado[ruta] != firma:
+                cambios[ruta] = "carpeta" if firma is None else "cambio"
+        for ruta in self._estado.keys() - nuevo.keys():
+            cambios[ruta] = "borrado"
+        self._estado = nuevo
+        if self._ignorar:
+            cambios = {r: t for r, t in cambios.items() if not _ignorada(r, self._ignorar, self.raiz)}
+            self._ignorar = set()
+        estables = [r for r in self._pendientes if r in nuevo and r not in cambios]
+        self._pendientes = {r for r, tipo in cambios.items() if tipo == "cambio"}
+        cambios = {r: tipo for r, tipo in cambios.items() if tipo != "cambio"}
+        cambios.update(dict.fromkeys(estables, "cambio"))
+        return cambios
+
+    def ignorar(self, rutas):
+        self._ignorar = set(rutas)
+
+    def cerrar(self):
+        pass
+
+
+def _crear_vigilante(raiz, sondeo=None, log=print):
+    """inotify si está disponible (y no se pidió `sondeo` en segundos); si no, sondeo periódico."""
+    if sondeo is None and VIGILAR_INOTIFY and sys.platform.startswith("linux"):
+        try:
+            vigilante = _VigilanteInotify(raiz)
+            log(f"👀 Vigilando {raiz} con inotify.")
+            return vigilante
+        except (OSError, AttributeError) as e:
+            log(f"⚠️ inotify no disponible ({e}); se recorre el árbol cada {VIGILAR_SONDEO} s.")
+    vigilante = _VigilanteSondeo(raiz, sondeo or VIGILAR_SONDEO)
+    log(f"👀 Vigilando {raiz} cada {vigilante.intervalo} s.")
+    return vigilante
+
+
+def _en_carpeta_monumento(ctx, ruta):
+    """True si `ruta` está dentro de una subcarpeta de monumento ("T1_1", "T1_1, T1_2", ...) de su sección."""
+    carpeta = os.path.dirname(ruta)
+    if _clave(os.path.dirname(carpeta)) not in {
+        _clave(os.path.join(ctx.ruta, seccion)) for seccion in CARPETA_POR_TIPO.values()
+    }:
+        return False
+    return all(PATRON_ID.fullmatch(i.strip()) for i in os.path.basename(carpeta).split(","))
+
+
+def _pdfs_por_encarpetar(ctx):
+    """PDF de las carpetas de entrada que todavía no están en la subcarpeta de su monumento."""
+    inv = ctx.inventario
+    rutas = []
+    for nombre in ("Excavación", "Registros únicos", "Excavación por ID Monumento"):
+        for root, dirs, files in inv.recorrer(os.path.join(ctx.ruta, nombre)):
+            rutas += [os.path.join(root, f) for f in files if f.lower().endswith(".pdf")]
+    return [r for r in rutas if not _en_carpeta_monumento(ctx, r)]
+
+
+def _seguir(rutas, plan, inv):
+    """
+    Rutas de `rutas` después de aplicar `plan`: sigue los renombrados de
+    carpetas y los movimientos, renombrados y enlaces de cada archivo (un PDF
+    con varios IDs termina en varias rutas). Solo se devuelven las que existen.
+    """
+    destinos = defaultdict(list)
+    for op in plan:
+        if op.accion in ("renombrar", "mover", "enlazar"):
+            destinos[_clave(op.origen)].append(op.destino)
+    carpetas = [op for op in plan if op.accion == "renombrar" and inv.es_carpeta(op.destino)]
+    resultado = []
+    for ruta in rutas:
+        for op in carpetas:
+            prefijo = _clave(op.origen).rstrip(os.sep) + os.sep
+            if _clave(ruta).startswith(prefijo):
+                ruta = os.path.join(op.destino, ruta[len(prefijo):])
+        for candidata in [ruta] + destinos.get(_clave(ruta), []):
+            if inv.es_archivo(candidata) and candidata not in resultado:
+                resultado.append(candidata)
+    return resultado
+
+
+def procesar_tanda(ctx, cambios, informe):
+    """
+    Lleva los PDF de una tanda de `cambios` ({ruta: tipo}, ver
+    _VigilanteInotify) por los pasos que les corresponden: renombrar
+    carpetas (si llegó alguna con el nombre de origen), sufijo de la
+    subcarpeta, mover y encarpetar por ID (pasos 1, 2, 3 y 5, solo con esos
+    archivos); después revisa si están vacíos o dañados y actualiza el
+    `informe` de verificación de las carpetas afectadas.
+    Devuelve las rutas que tocaron las operaciones, para no volver a procesarlas.
+    """
+    inv = ctx.inventario
+    if "desbordado" in cambios.values() or any(
+        tipo == "borrado" and inv.es_carpeta(ruta) for ruta, tipo in cambios.items()
+    ):
+        ctx.log("🔄 Cambios que no se pueden seguir uno a uno: se vuelve a leer el árbol.")
+        inv.reescanear()
+    else:
+        for ruta, tipo in sorted(cambios.items()):
+            if tipo == "carpeta" and os.path.isdir(ruta):
+                inv.registrar_carpeta(ruta)
+            elif tipo == "cambio" and os.path.isfile(ruta):
+                inv.registrar_carpeta(os.path.dirname(ruta))
+                inv.registrar_archivo(ruta)
+            elif tipo == "borrado":
+                inv.registrar_eliminado(ruta)
+
+    rutas = sorted(r for r, tipo in cambios.items() if tipo == "cambio" and inv.es_archivo(r))
+    afectadas = {os.path.dirname(r) for r, tipo in cambios.items() if tipo == "borrado"}
+    propias = set()
+    planificadores = [
+        (2, planificar_paso2),
+        (3, planificar_paso3),
+        (5, lambda ctx, inv, solo: planificar_paso5(ctx, inv, None, solo)),
+    ]
+    if any(tipo == "carpeta" and os.path.basename(r) in RENOMBRAR_CARPETAS for r, tipo in cambios.items()):
+        planificadores.insert(0, (1, lambda ctx, inv, solo: planificar_paso1(ctx, inv)))
+    for numero, planificar in planificadores:
+        ctx.paso = numero
+        solo = {_clave(r) for r in rutas if not _en_carpeta_monumento(ctx, r)}
+        if not solo and numero != 1:
+            break
+        plan = planificar(ctx, inv.copia(), solo)
+        ejecutar_plan(ctx, plan, por_niveles=numero == 1)
+        for op in plan:
+            for ruta in (op.origen, op.destino):
+                if ruta:
+                    propias.add(os.path.normpath(ruta))
+                    afectadas.add(os.path.dirname(ruta))
+        rutas = _seguir(rutas, plan, inv)
+
+    # Revisión de los PDF que llegaron, ya en su sitio
+    if rutas:
+        ctx.paso = 8
+        workers = max(1, min(ctx.pdf_workers or os.cpu_count() or 1, len(rutas)))
+        resultados = _revisar_en_paralelo(rutas, workers, nivel=ctx.nivel_pdf)
+        ctx.contar("escaneados", len(resultados))
+        if ctx.cache_pdf:
+            cache = CachePDF(ctx.ruta_cache_pdf or os.path.join(ctx.ruta, ".informes_cache.sqlite"), ctx.ruta)
+            try:
+                pares = []
+                for r in resultados:
+                    try:
+                        pares.append((r, os.stat(r.ruta)))
+                    except OSError:
+                        pass
+                cache.guardar(pares, ctx.nivel_pdf)
+            finally:
+                cache.cerrar()
+        for r in resultados:
+            if r.veredicto == "vacio":
+                ctx.log(f"📭 PDF vacío: {r.ruta}")
+            elif r.veredicto == "en_blanco":
+                ctx.log(f"📄 PDF con todas las páginas en blanco: {r.ruta}")
+            elif r.veredicto in ("corrupto", "error"):
+                if r.veredicto == "error":
+                    ctx.contar("errores")
+                ctx.log(f"🚨 PDF dañado o ilegible: {r.ruta}: {r.error}")
+            afectadas.add(os.path.dirname(r.ruta))
+
+    # Verificación solo de las carpetas afectadas
+    ctx.paso = 6
+    for fila in actualizar_verificacion(ctx, informe, afectadas):
+        detalle = "; ".join(
+            f"{nombre}: {', '.join(valor)}"
+            for nombre, valor in (("faltan", fila["faltantes"]), ("adicionales", fila["adicionales"]),
+                                  ("duplicados", list(fila["duplicados"])))
+            if valor
+        )
+        ctx.log(f"🔍 {fila['carpeta']}: {fila['estado']}" + (f" ({detalle})" if detalle else ""))
+    carpeta = _carpeta_informes(ctx)
+    try:
+        escribir_informe_verificacion(informe, carpeta)
+    except OSError as e:
+        ctx.log(f"❌ No se pudo guardar el informe de verificación en {carpeta}: {e}")
+    return propias
+
+
+def vigilar_sitio(ctx=None, detener=None, sondeo=None):
+    """
+    Modo vigilancia: en lugar de repetir main() sobre todo el sitio, espera
+    PDF nuevos o modificados (inotify en Linux; si no, un recorrido cada
+    VIGILAR_SONDEO segundos, o cada `sondeo` segundos si se indica) y los
+    procesa por tandas con procesar_tanda().
+
+    Los cambios se agrupan: una tanda se procesa cuando pasan VIGILAR_ESPERA
+    segundos sin cambios nuevos, cuando lleva VIGILAR_ESPERA_MAX segundos
+    acumulando o cuando junta VIGILAR_TANDA_MAX cambios; así una subida
+    masiva se procesa en pocas tandas grandes.
+
+    Si el sitio nunca se procesó (no hay índice de rutas del paso 4) o hay
+    una ejecución interrumpida, primero se ejecuta main(). Termina cuando se
+    activa `detener` o ctx.cancelar (threading.Event) o con Ctrl+C.
+    """
+    ctx = _contexto(ctx)
+    if not ctx.ruta or not ctx.tiene_excel():
+        raise ValueError("Debe definir RUTA_PRINCIPAL y EXCEL_PATH")
+    detener = detener or ctx.cancelar or threading.Event()
+    if os.path.exists(os.path.join(ctx.ruta, NOMBRE_DIARIO)) \
+            or not os.path.exists(os.path.join(ctx.ruta, NOMBRE_INDICE_RUTAS)):
+        ctx.log("▶️ Se completa primero el flujo sobre todo el sitio.")
+        main(ctx)
+    vigilante = _crear_vigilante(ctx.ruta, sondeo, ctx.log)
+    try:
+        # Lo que llegó antes de empezar a vigilar no generó eventos: se parte del disco
+        ctx.inventario.reescanear()
+        informe = verificar_sitio(ctx)
+        # Lo que ya espera en las carpetas de entrada es la primera tanda
+        tanda = {r: "cambio" for r in _pdfs_por_encarpetar(ctx)}
+        primera = ultima = float("-inf") if tanda else None
+        while not detener.is_set():
+            ahora = time.monotonic()
+            if tanda and (ahora - ultima >= VIGILAR_ESPERA or ahora - primera >= VIGILAR_ESPERA_MAX
+                          or len(tanda) >= VIGILAR_TANDA_MAX):
+                ctx.log(f"\n📥 Tanda de {len(tanda)} cambio(s) — {time.strftime('%H:%M:%S')}")
+                diario = Diario(ctx.ruta, clave_excel=ctx.base_datos.clave, log=ctx.log) if ctx.usar_diario else None
+                ctx.inventario.diario = diario
+                terminada = False
+                try:
+                    with medir_paso(ctx, "tanda", "procesar_tanda"):
+                        propias = procesar_tanda(ctx, tanda, informe)
+                    terminada = True
+                finally:
+                    ctx.inventario.diario = None
+                    if diario is not None:
+                        diario.cerrar(terminada, ctx.inventario)
+                # Las operaciones propias generan eventos que no deben volver a procesarse
+                vigilante.ignorar(propias)
+                tanda, primera = {}, None
+                continue
+            cambios = vigilante.esperar(min(VIGILAR_ESPERA, 1.0))
+            if cambios:
+                tanda.update(cambios)
+                ultima = time.monotonic()
+                if primera is None:
+                    primera = ultima
+    except (KeyboardInterrupt, EjecucionCancelada):
+        ctx.log("\n⏹️ Vigilancia detenida.")
+    finally:
+        vigilante.cerrar()
+
+
+# =============================================================================
+# LÍNEA DE COMANDOS
+# =============================================================================
+def _leer_pasos(texto):
+    """Pasos de la línea de órdenes: "6", "1-5,8"... → [1, 2, 3, 4, 5, 8]."""
+    import argparse
+
+    pasos = set()
+    try:
+        for parte in texto.split(","):
+            desde, _, hasta = parte.partition("-")
+            pasos.update(range(int(desde), int(hasta or desde) + 1))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"pasos no válidos: {texto!r} (p. ej. 6 o 1-5,8)")
+    if not pasos or not pasos <= set(range(1, len(PASOS) + 1)):
+        raise argparse.ArgumentTypeError(f"los pasos van del 1 al {len(PASOS)}: {texto!r}")
+    return sorted(pasos)
+
+
+def cli(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Organiza y verifica las carpetas de un sitio.")
+    parser.add_argument("--site", required=True, help="carpeta principal del sitio")
+    parser.add_argument("--excel", help="Excel con la base de datos de monumentos (lo necesitan los pasos 4 y 6)")
+    parser.add_argument("--steps", type=_leer_pasos, metavar="PASOS",
+                        help="pasos a ejecutar, p. ej. 6 o 1-5,8 (por defecto todos)")
+    parser.add_argument("--jobs", type=int, default=PASOS_SIMULTANEOS,
+                        help="pasos independientes que se ejecutan a la vez "
+                             f"(por defecto {PASOS_SIMULTANEOS}: uno tras otro)")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="mostrar el plan de operaciones sin tocar el disco")
+    parser.add_argument("--io-workers", type=int, default=IO_WORKERS,
+                        help=f"hilos para aplicar las operaciones (por defecto {IO_WORKERS})")
+    parser.add_argument("--nivel-pdf", choices=list(NIVELES_PDF), default=NIVEL_PDF,
+                        help=f"revisión de los PDF en el paso 8 (por defecto {NIVEL_PDF})")
+    parser.add_argument("--colapsar-duplicados", action="store_true",
+                        help="sustituir los PDF repetidos por enlaces duros al primero (paso 8)")
+    parser.add_argument("--metricas", metavar="ARCHIVO.jsonl",
+                        help="agregar las métricas de cada paso como líneas JSON")
+    parser.add_argument("--perfilar", choices=["cprofile", "tracemalloc"],
+                        help="perfilar cada paso con cProfile (.prof) o tracemalloc (pico de memoria)")
+    parser.add_argument("--vigilar", action="store_true",
+                        help="quedarse vigilando el sitio y procesar los PDF nuevos a medida que llegan")
+    parser.add_argument("--sondeo", type=float, metavar="SEGUNDOS",
+                        help="con --vigilar, recorrer el árbol cada SEGUNDOS en lugar de usar inotify")
+    parser.add_argument("--silencioso", action="store_true",
+                        help="no mostrar el registro de cada operación, solo la tabla de métricas")
+    args = parser.parse_args(argv)
+    pasos = args.steps or list(range(1, len(PASOS) + 1))
+    if not args.excel and (args.vigilar or any(n in NECESITAN_EXCEL for n in pasos)):
+        parser.error(f"--excel es obligatorio con --vigilar o con los pasos {' y '.join(map(str, NECESITAN_EXCEL))}")
+
+    ctx = ContextoSitio(args.site, args.excel, log=None if args.silencioso else print,
+                        io_workers=args.io_workers, metricas_jsonl=args.metricas, perfilar=args.perfilar,
+                        nivel_pdf=args.nivel_pdf, colapsar_duplicados=args.colapsar_duplicados or None)
+    if args.vigilar:
+        return vigilar_sitio(ctx, sondeo=args.sondeo)
+    if args.dry_run:
+        inicio = time.perf_counter()
+        plan = planificar_sitio(ctx, pasos)
+        # El plan es la salida de --dry-run: va siempre a la salida estándar, aun con --silencioso
+        imprimir_plan(plan)
+        print(f"\n📝 Plan de {sum(op.accion not in ('aviso', 'conflicto') for op in plan)} operaciones "
+              f"en {time.perf_counter() - inicio:.3f} s (no se modificó nada).")
+        return plan
+    resultado = main(ctx, pasos=pasos, jobs=args.jobs)
+    if args.silencioso:
+        print(tabla_metricas(ctx.metricas))
+    return resultado
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,88 @@
+"""Utilidades comunes de las pruebas de miscript."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def pdf_bytes(paginas):
+    """
+    PDF con una página por cada stream de contenido de `paginas` y una tabla
+    xref clásica con los desplazamientos correctos. La fuente /F1 está
+    declarada en todas las páginas.
+    """
+    objetos = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    hijos = []
+    for contenido in paginas:
+        numero = len(objetos) + 1
+        hijos.append(b"%d 0 R" % numero)
+        objetos.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 200 200] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (numero + 1))
+        objetos.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(contenido), contenido))
+    objetos[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(hijos), len(paginas))
+
+    datos = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    desplazamientos = []
+    for numero, objeto in enumerate(objetos, 1):
+        desplazamientos.append(len(datos))
+        datos += b"%d 0 obj\n%s\nendobj\n" % (numero, objeto)
+    inicio_xref = len(datos)
+    datos += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objetos) + 1)
+    for desplazamiento in desplazamientos:
+        datos += b"%010d 00000 n \n" % desplazamiento
+    datos += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objetos) + 1, inicio_xref)
+    return bytes(datos)
+
+
+@pytest.fixture
+def escribir_pdf():
+    """escribir_pdf(ruta, paginas): escribe en `ruta` el PDF de pdf_bytes(paginas) y devuelve la ruta."""
+    def escribir(ruta, paginas=(b"BT /F1 12 Tf 20 100 Td (Ficha) Tj ET",)):
+        os.makedirs(os.path.dirname(str(ruta)), exist_ok=True)
+        with open(ruta, "wb") as f:
+            f.write(pdf_bytes(paginas))
+        return str(ruta)
+    return escribir
+
+
+@pytest.fixture
+def sitio(monkeypatch, tmp_path_factory):
+    """
+    sitio(carpeta, monumentos=6): crea en `carpeta` el sitio "Sitio" tal como
+    llega del campo (Excavacion/<subcarpeta>/T1_<n>.pdf, Prospeccion,
+    RegistroUnico, IntroduccionGeneral.pdf) y su Excel. Devuelve (ruta del
+    sitio, ruta del Excel). La caché del Excel queda en una carpeta temporal.
+    """
+    import miscript
+
+    monkeypatch.setattr(miscript, "CACHE_EXCEL_DIR", str(tmp_path_factory.mktemp("cache_excel")))
+
+    def crear(carpeta, monumentos=6):
+        import pandas as pd
+
+        ruta = os.path.join(str(carpeta), "Sitio")
+
+        def pdf(relativa):
+            destino = os.path.join(ruta, relativa)
+            os.makedirs(os.path.dirname(destino), exist_ok=True)
+            with open(destino, "wb") as f:
+                f.write(pdf_bytes([b"BT /F1 12 Tf 20 100 Td (%s) Tj ET" % relativa.encode()]))
+
+        ids = [f"T1_{i}" for i in range(1, monumentos + 1)]
+        for sub in ("Introduccion", "FichaDeExcavacion", "Dibujos", "RegistroDeCapas"):
+            for id_ in ids:
+                pdf(os.path.join("Excavacion", sub, f"{id_}.pdf"))
+        for id_ in ids:
+            pdf(os.path.join("Prospeccion", f"{id_}.pdf"))
+        pdf(os.path.join("RegistroUnico", "RegistrosArqueologicos", "T2_1.pdf"))
+        pdf("IntroduccionGeneral.pdf")
+
+        filas = [("Sitio", id_, ids[i - 1] if i % 3 == 1 else "", "", "Excavación") for i, id_ in enumerate(ids)]
+        filas.append(("Sitio", "T2_1", "", "", "Registro único"))
+        excel = os.path.join(str(carpeta), "base.xlsx")
+        pd.DataFrame(filas, columns=miscript.COLUMNAS_EXCEL).to_excel(excel, index=False)
+        return ruta, excel
+
+    return crear
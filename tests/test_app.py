@@ -0,0 +1,82 @@
+"""Sitio comprimido de la página (app.py): extraer el .zip subido."""
+import io
+import os
+import zipfile
+
+import pytest
+
+pytest.importorskip("streamlit")
+import app  # noqa: E402  (sin servidor, Streamlit se ejecuta en modo "bare")
+
+
+def _zip(*entradas):
+    datos = io.BytesIO()
+    with zipfile.ZipFile(datos, "w") as zf:
+        for nombre, contenido in entradas:
+            zf.writestr(nombre, contenido)
+    datos.seek(0)
+    return datos
+
+
+@pytest.mark.parametrize("nombre", ["../fuera.txt", "/absoluta.txt", "C:/fuera.txt", "Sitio/../../fuera.txt",
+                                    "Sitio\\..\\..\\fuera.txt"])
+def test_zip_slip_se_rechaza_sin_escribir_nada(tmp_path, nombre):
+    destino = tmp_path / "trabajo"
+    destino.mkdir()
+    with pytest.raises(ValueError, match="Ruta no permitida"):
+        app.extraer_zip(_zip(("Sitio/a.pdf", b"a"), (nombre, b"x")), str(destino), log=lambda *a: None)
+    assert not os.listdir(destino)
+    assert not (tmp_path / "fuera.txt").exists()
+
+
+def test_enlace_simbolico_se_omite(tmp_path):
+    datos = io.BytesIO()
+    with zipfile.ZipFile(datos, "w") as zf:
+        enlace = zipfile.ZipInfo("Sitio/enlace")
+        enlace.external_attr = 0o120777 << 16
+        zf.writestr(enlace, "/etc/passwd")
+        zf.writestr("Sitio/a.pdf", b"a")
+    principal = app.extraer_zip(datos, str(tmp_path), log=lambda *a: None)
+    assert principal == os.path.join(str(tmp_path), "Sitio")
+    assert os.listdir(principal) == ["a.pdf"]
+
+
+def test_zip_demasiado_grande_se_rechaza_antes_de_extraer(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "MAX_DESCOMPRIMIDO", 1000)
+    with pytest.raises(ValueError, match="máximo"):
+        app.extraer_zip(_zip(("Sitio/a.pdf", b"0" * 600), ("Sitio/b.pdf", b"0" * 600)), str(tmp_path),
+                        log=lambda *a: None)
+    assert not os.listdir(tmp_path)
+
+
+def test_sitio_zip_sin_descomprimir(tmp_path):
+    datos = _zip(("Sitio/Excavacion/a.pdf", b"a"), ("Sitio/b.pdf", b"b"))
+    assert app.sitio_zip(datos) == "Sitio"
+    assert datos.tell() == 0
+    sueltos = _zip(("a.pdf", b"a"), ("b.pdf", b"b"))
+    sueltos.name = "Chaktemal.zip"
+    assert app.sitio_zip(sueltos) == "Chaktemal"
+    assert not os.listdir(tmp_path)
+
+
+def test_ejecucion_devuelve_el_inventario_para_la_siguiente(tmp_path, sitio):
+    import miscript
+
+    ruta, excel = sitio(tmp_path)
+    base_datos = miscript.cargar_base_datos(excel, log=lambda *a: None, sitio="Sitio")
+    ejecucion = app.Ejecucion(ruta, base_datos)
+    ejecucion.iniciar()
+    ejecucion.hilo.join()
+    assert ejecucion.estado == "completado", ejecucion.lineas
+    assert ejecucion.inventario is not None and ejecucion.base_datos is None
+
+    app.guardar_inventario(ruta, ejecucion.inventario)
+    inventario = app.tomar_inventario(ruta)
+    assert inventario is ejecucion.inventario
+    assert app.tomar_inventario(ruta) is None  # mientras una ejecución lo usa
+
+    segunda = app.Ejecucion(ruta, base_datos, inventario=inventario)
+    segunda.iniciar()
+    segunda.hilo.join()
+    assert segunda.estado == "completado", segunda.lineas
+    assert any("se reutiliza su inventario" in linea for linea in segunda.lineas)
@@ -0,0 +1,70 @@
+"""Caché persistente de veredictos de PDF (CachePDF)."""
+import os
+
+import miscript
+
+
+def _guardar(cache, *rutas):
+    cache.guardar([(miscript.revisar_pdf(ruta), os.stat(ruta)) for ruta in rutas])
+
+
+def test_cache_reabierta_conserva_los_veredictos(tmp_path, escribir_pdf):
+    raiz = tmp_path / "sitio"
+    valido = escribir_pdf(raiz / "T1_1.pdf")
+    vacio = raiz / "T1_2.pdf"
+    vacio.write_bytes(b"")
+    ruta_db = str(tmp_path / "cache.sqlite")
+
+    cache = miscript.CachePDF(ruta_db, str(raiz))
+    _guardar(cache, valido, str(vacio))
+    cache.cerrar()
+
+    cache = miscript.CachePDF(ruta_db, str(raiz))
+    try:
+        assert cache.buscar(valido, os.stat(valido)) == miscript.revisar_pdf(valido)
+        assert cache.buscar(str(vacio), os.stat(vacio)).veredicto == "vacio"
+    finally:
+        cache.cerrar()
+
+
+def test_entrada_invalida_si_el_archivo_cambia(tmp_path, escribir_pdf):
+    raiz = tmp_path / "sitio"
+    ruta = escribir_pdf(raiz / "T1_1.pdf")
+    cache = miscript.CachePDF(str(tmp_path / "cache.sqlite"), str(raiz))
+    try:
+        _guardar(cache, ruta)
+        with open(ruta, "ab") as f:
+            f.write(b"\n")
+        assert cache.buscar(ruta, os.stat(ruta)) is None
+    finally:
+        cache.cerrar()
+
+
+def test_archivo_movido_se_reconoce_por_inodo(tmp_path, escribir_pdf):
+    raiz = tmp_path / "sitio"
+    ruta = escribir_pdf(raiz / "T1_1.pdf")
+    cache = miscript.CachePDF(str(tmp_path / "cache.sqlite"), str(raiz))
+    try:
+        _guardar(cache, ruta)
+        movida = str(raiz / "Excavación por ID Monumento" / "T1_1.pdf")
+        os.makedirs(os.path.dirname(movida))
+        os.rename(ruta, movida)
+        assert cache.buscar(movida, os.stat(movida)).veredicto == "ok"
+    finally:
+        cache.cerrar()
+
+
+def test_compactar_elimina_archivos_que_ya_no_existen(tmp_path, escribir_pdf):
+    raiz = tmp_path / "sitio"
+    conservado = escribir_pdf(raiz / "T1_1.pdf")
+    borrado = escribir_pdf(raiz / "T1_2.pdf")
+    cache = miscript.CachePDF(str(tmp_path / "cache.sqlite"), str(raiz))
+    try:
+        _guardar(cache, conservado, borrado)
+        st = os.stat(borrado)
+        os.remove(borrado)
+        assert cache.compactar([conservado]) == 1
+        assert cache.buscar(borrado, st) is None
+        assert cache.buscar(conservado, os.stat(conservado)) is not None
+    finally:
+        cache.cerrar()
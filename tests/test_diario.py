@@ -0,0 +1,110 @@
+"""Diario de operaciones: reanudar una ejecución interrumpida."""
+import json
+import os
+
+import pytest
+
+import miscript
+
+
+class Corte(BaseException):
+    """Simula que el proceso muere: no lo atrapa ningún `except Exception`."""
+
+
+def _arbol(raiz):
+    """Rutas relativas de las carpetas y archivos del sitio, sin los internos de miscript."""
+    rutas = set()
+    for carpeta, dirs, archivos in os.walk(raiz):
+        for nombre in dirs + archivos:
+            if not nombre.startswith(".informes_"):
+                rutas.add(os.path.relpath(os.path.join(carpeta, nombre), raiz))
+    return rutas
+
+
+def _escribir_diario(raiz, *registros):
+    with open(os.path.join(raiz, miscript.NOMBRE_DIARIO), "w", encoding="utf-8") as f:
+        for registro in registros:
+            f.write(json.dumps(registro) + "\n")
+
+
+@pytest.mark.parametrize("io_workers", [1, 4])
+def test_reanudar_tras_un_corte_deja_el_mismo_arbol(tmp_path, sitio, monkeypatch, io_workers):
+    referencia, excel = sitio(tmp_path / "referencia")
+    miscript.main(miscript.ContextoSitio(referencia, excel, log=None))
+
+    ruta, excel = sitio(tmp_path / "cortado")
+    mover, movidos = miscript.InventarioSitio.mover, []
+
+    def mover_y_cortar(self, origen, destino):
+        if len(movidos) == 7:
+            raise Corte()
+        movidos.append(origen)
+        return mover(self, origen, destino)
+
+    monkeypatch.setattr(miscript.InventarioSitio, "mover", mover_y_cortar)
+    with pytest.raises(Corte):
+        miscript.main(miscript.ContextoSitio(ruta, excel, log=None, io_workers=io_workers))
+    monkeypatch.undo()
+
+    # El corte deja el último registro del diario a medio escribir
+    ruta_diario = os.path.join(ruta, miscript.NOMBRE_DIARIO)
+    with open(ruta_diario, "rb+") as f:
+        f.truncate(os.path.getsize(ruta_diario) - 5)
+
+    mensajes = []
+    miscript.main(miscript.ContextoSitio(ruta, excel, log=mensajes.append))
+    assert any("Reanudando" in m for m in mensajes)
+    assert any("Paso 1 ya completado" in m for m in mensajes)
+    assert _arbol(ruta) == _arbol(referencia)
+    assert not os.path.exists(ruta_diario)
+
+
+def test_copia_sin_confirmar_se_elimina(tmp_path):
+    (tmp_path / "T1_1.pdf").write_bytes(b"%PDF-1.4 completo")
+    (tmp_path / "T1_1").mkdir()
+    (tmp_path / "T1_1" / "T1_1.pdf").write_bytes(b"%PDF-1")
+    (tmp_path / "T1_2.pdf").write_bytes(b"%PDF-1.4 completo")
+    (tmp_path / "T1_2").mkdir()
+    (tmp_path / "T1_2" / "T1_2.pdf").write_bytes(b"%PDF-1.4 completo")
+    _escribir_diario(
+        tmp_path,
+        {"inicio": 0, "clave_excel": "x"},
+        {"ops": [{"op": 0, "accion": "enlazar", "origen": "T1_1.pdf", "destino": "T1_1/T1_1.pdf"},
+                 {"op": 1, "accion": "enlazar", "origen": "T1_2.pdf", "destino": "T1_2/T1_2.pdf"}],
+         "estado": "plan"},
+        {"op": 1, "estado": "hecho"},
+    )
+    diario = miscript.Diario(str(tmp_path), clave_excel="x", log=lambda m: None)
+    diario.cerrar()
+    assert not (tmp_path / "T1_1" / "T1_1.pdf").exists()  # sin "hecho": pudo quedar a medio copiar
+    assert (tmp_path / "T1_1.pdf").exists()
+    assert (tmp_path / "T1_2" / "T1_2.pdf").exists()
+
+
+def test_pasos_completados_y_cambio_de_excel(tmp_path):
+    _escribir_diario(tmp_path, {"inicio": 0, "clave_excel": "x"}, {"paso": 1}, {"paso": 2})
+    with open(os.path.join(tmp_path, miscript.NOMBRE_DIARIO), "a", encoding="utf-8") as f:
+        f.write('{"op": 0, "accion": "renom')  # registro cortado
+
+    diario = miscript.Diario(str(tmp_path), clave_excel="x", log=lambda m: None)
+    assert diario.pasos_hechos == {1, 2}
+    diario.cerrar()
+
+    diario = miscript.Diario(str(tmp_path), clave_excel="otro", log=lambda m: None)
+    assert diario.pasos_hechos == set()
+    diario.cerrar(terminado=True)
+    assert not os.path.exists(os.path.join(tmp_path, miscript.NOMBRE_DIARIO))
+
+
+def test_diario_eliminado_sale_del_inventario(tmp_path, sitio):
+    ruta, excel = sitio(tmp_path)
+    ctx = miscript.ContextoSitio(ruta, excel, log=None)
+    miscript.main(ctx)
+    ruta_diario = os.path.join(ruta, miscript.NOMBRE_DIARIO)
+    assert not os.path.exists(ruta_diario)
+    assert not ctx.inventario.existe(ruta_diario)
+
+    # Todo lo que lista el inventario, que la página reutiliza, existe en disco
+    for carpeta, _, archivos in ctx.inventario.recorrer(ruta):
+        for nombre in archivos:
+            assert os.path.isfile(os.path.join(carpeta, nombre))
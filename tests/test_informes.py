@@ -0,0 +1,26 @@
+"""Ensamblado de informes PDF (EscritorPDF)."""
+import PyPDF2
+
+import miscript
+
+
+def test_informe_con_flujos_comprimidos_y_sin_comprimir(tmp_path, escribir_pdf):
+    plano = escribir_pdf(tmp_path / "plano.pdf", [b"BT /F1 12 Tf 20 100 Td (Uno) Tj ET",
+                                                  b"BT /F1 12 Tf 20 100 Td (Dos) Tj ET"])
+    escritor = PyPDF2.PdfWriter()
+    escritor.append(escribir_pdf(tmp_path / "origen.pdf", [b"BT /F1 12 Tf 20 100 Td (Tres) Tj ET"]))
+    for pagina in escritor.pages:
+        pagina.compress_content_streams()  # /FlateDecode
+    comprimido = str(tmp_path / "comprimido.pdf")
+    with open(comprimido, "wb") as f:
+        escritor.write(f)
+
+    informe = str(tmp_path / "informe.pdf")
+    salida = miscript.EscritorPDF(informe)
+    assert salida.agregar(plano) == 0
+    assert salida.agregar(comprimido) == 2
+    salida.cerrar([("Plano", 0, []), ("Comprimido", 2, [])])
+
+    lector = PyPDF2.PdfReader(informe)
+    assert [p.extract_text().strip() for p in lector.pages] == ["Uno", "Dos", "Tres"]
+    assert [m.title for m in lector.outline] == ["Plano", "Comprimido"]
@@ -0,0 +1,95 @@
+"""Agrupación de monumentos del paso 4 (agrupar_monumentos)."""
+import random
+
+import pandas as pd
+
+import miscript
+
+COLUMNAS = ["ID Monumento", "Monumentos superiores", "Monumentos Asociados por cercanía", "Tipo de intervención"]
+
+
+def _carpetas_originales(df):
+    """(carpeta padre, nombre) que creaba el paso 4 original recorriendo df.iterrows()."""
+    handled_ids, created_combos, carpetas = set(), set(), []
+    for _, row in df.iterrows():
+        base_id = row["ID Monumento"].strip()
+        sup = row.get("Monumentos superiores", "").strip()
+        assoc = row.get("Monumentos Asociados por cercanía", "").strip()
+        include_base = not (sup.startswith("A") or assoc.startswith("A"))
+        other_ts = [row.get(col, "").strip() for col in ["Monumentos superiores", "Monumentos Asociados por cercanía"]
+                    if row.get(col, "").strip().startswith("T")]
+        if not include_base and not other_ts:
+            continue
+        ids = set()
+        if include_base:
+            ids.add(base_id)
+        for col in ["Monumentos superiores", "Monumentos Asociados por cercanía"]:
+            val = row.get(col, "").strip()
+            if val.startswith("T"):
+                ids.add(val)
+        if ids & handled_ids:
+            continue
+        handled_ids.update(ids)
+        combo_key = tuple(sorted(ids))
+        if combo_key in created_combos:
+            continue
+        created_combos.add(combo_key)
+        tipo = row.get("Tipo de intervención", "").strip()
+        if tipo in miscript.CARPETA_POR_TIPO:
+            carpetas.append((miscript.CARPETA_POR_TIPO[tipo], ", ".join(sorted(ids))))
+    return carpetas
+
+
+def _carpetas(df):
+    return [(miscript.CARPETA_POR_TIPO[g.tipo], g.nombre) for g in miscript.agrupar_monumentos(df, log=lambda m: None)
+            if g.tipo is not None]
+
+
+def test_mismos_nombres_que_el_paso_4_original():
+    df = pd.DataFrame([
+        ("T1_1", "", "T1_2", "Excavación"),
+        ("T1_2", "T1_3", "", "Excavación"),      # T1_2 ya tiene carpeta: la fila no crea otra
+        ("T1_3", "", "", "Excavación"),
+        ("T1_10", "A5", "T1_11", "Excavación"),  # relación con "A": sin el ID propio
+        ("T1_12", "A1", "", "Excavación"),       # nada que agrupar
+        ("T2_1", "", "", "Registro único"),
+        ("T1_20", "T1_19", "", "Excavación"),
+        ("T1_21", "T1_20", "T1_22", "Excavación"),
+        ("T3_1", "", "", "Otro"),                # tipo desconocido: sin carpeta
+        ("T1_9", " T1_8 ", "", " Excavación "),
+        ("T1_30", "", "T1_100", "Excavación"),
+    ], columns=COLUMNAS)
+    esperadas = [
+        ("Excavación por ID Monumento", "T1_1, T1_2"),
+        ("Excavación por ID Monumento", "T1_3"),
+        ("Excavación por ID Monumento", "T1_11"),
+        ("Registros únicos", "T2_1"),
+        ("Excavación por ID Monumento", "T1_19, T1_20"),
+        ("Excavación por ID Monumento", "T1_8, T1_9"),
+        ("Excavación por ID Monumento", "T1_100, T1_30"),
+    ]
+    assert _carpetas_originales(df) == esperadas
+    assert _carpetas(df) == esperadas
+
+
+def test_avisa_los_ids_que_se_quedan_sin_carpeta():
+    df = pd.DataFrame([
+        ("T1_1", "", "T1_2", "Excavación"),
+        ("T1_3", "T1_2", "", "Excavación"),
+    ], columns=COLUMNAS)
+    avisos = []
+    grupos = miscript.agrupar_monumentos(df, log=avisos.append)
+    assert [g.nombre for g in grupos] == ["T1_1, T1_2"]
+    assert len(avisos) == 1 and "T1_3" in avisos[0]
+
+
+def test_coincide_con_el_original_en_un_libro_aleatorio():
+    azar = random.Random(5)
+    ids = [f"T1_{i}" for i in range(1, 400)]
+    filas = []
+    for id_ in ids:
+        relacion = lambda: azar.choice(["", "", "", azar.choice(ids), "A" + id_[1:]])  # noqa: E731
+        filas.append((id_, relacion(), relacion(), azar.choice(["Excavación", "Registro único", "Otro"])))
+    azar.shuffle(filas)
+    df = pd.DataFrame(filas, columns=COLUMNAS, index=pd.RangeIndex(10, 10 + len(filas)))
+    assert _carpetas(df) == _carpetas_originales(df)
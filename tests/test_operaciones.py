@@ -0,0 +1,63 @@
+"""Reparto de un plan en tandas y grupos independientes (ejecutar_plan)."""
+import os
+
+import miscript
+
+
+def _renombrar(origen, destino):
+    return miscript.Operacion(1, "renombrar", origen, destino, None)
+
+
+def _relacionadas(a, b):
+    """Si una ruta de `a` es igual a una de `b` o está dentro de ella (o al revés)."""
+    for x in (a.origen, a.destino):
+        for y in (b.origen, b.destino):
+            if x and y and (x == y or x.startswith(y + os.sep) or y.startswith(x + os.sep)):
+                return True
+    return False
+
+
+def test_carpeta_y_subcarpeta_nunca_en_la_misma_tanda():
+    raiz = os.path.join("sitio")
+    plan = [
+        _renombrar(os.path.join(raiz, "Excavacion"), os.path.join(raiz, "Excavación")),
+        _renombrar(os.path.join(raiz, "Excavacion", "Dibujos"), os.path.join(raiz, "Excavacion", "Dibujos arq")),
+        _renombrar(os.path.join(raiz, "Excavacion", "Dibujos", "Capas"), os.path.join(raiz, "Excavacion", "Dibujos", "C")),
+        _renombrar(os.path.join(raiz, "Prospeccion"), os.path.join(raiz, "Prospección")),
+        _renombrar(os.path.join(raiz, "Excavacion", "Introduccion"), os.path.join(raiz, "Excavacion", "Introducción")),
+    ]
+    tandas = miscript._tandas(plan, por_niveles=True)
+    # De la más profunda a la menos profunda
+    assert [[op.origen for grupo in tanda for op in grupo] for tanda in tandas] == [
+        [plan[2].origen], [plan[1].origen, plan[4].origen], [plan[0].origen, plan[3].origen],
+    ]
+    for tanda in tandas:
+        ops = [op for grupo in tanda for op in grupo]
+        assert not any(_relacionadas(a, b) for i, a in enumerate(ops) for b in ops[i + 1:])
+
+
+def test_rutas_anidadas_van_al_mismo_grupo():
+    plan = [
+        _renombrar(os.path.join("s", "A", "x.pdf"), os.path.join("s", "A", "y.pdf")),
+        _renombrar(os.path.join("s", "B", "z.pdf"), os.path.join("s", "B", "w.pdf")),
+        _renombrar(os.path.join("s", "A"), os.path.join("s", "C")),
+        _renombrar(os.path.join("s", "D", "q.pdf"), os.path.join("s", "C", "q.pdf")),
+        _renombrar(os.path.join("s", "E", "r.pdf"), os.path.join("s", "E", "r2.pdf")),
+    ]
+    grupos = miscript._agrupar_operaciones(plan)
+    assert grupos == [[plan[0], plan[2], plan[3]], [plan[1]], [plan[4]]]
+    for i, grupo in enumerate(grupos):
+        for otro in grupos[i + 1:]:
+            assert not any(_relacionadas(a, b) for a in grupo for b in otro)
+
+
+def test_paso_1_con_varios_hilos(tmp_path, sitio):
+    ruta, excel = sitio(tmp_path)
+    ctx = miscript.ContextoSitio(ruta, excel, log=None, io_workers=8, usar_diario=False)
+    miscript.step1_renombrar_carpetas(ctx)
+    assert sorted(os.listdir(ruta)) == ["Excavación", "IntroduccionGeneral.pdf", "Prospección", "Registros únicos"]
+    assert sorted(os.listdir(os.path.join(ruta, "Excavación"))) == [
+        "Dibujos arquitectónicos", "Ficha de excavación", "Introducción", "Registro de capas",
+    ]
+    assert os.listdir(os.path.join(ruta, "Registros únicos")) == ["Registros arqueológicos"]
+    assert len(os.listdir(os.path.join(ruta, "Excavación", "Dibujos arquitectónicos"))) == 6
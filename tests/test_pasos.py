@@ -0,0 +1,37 @@
+"""Pasos simultáneos (main con jobs > 1)."""
+import os
+
+import miscript
+
+
+def _arbol(raiz):
+    rutas = set()
+    for carpeta, dirs, archivos in os.walk(raiz):
+        for nombre in dirs + archivos:
+            if not nombre.startswith(".informes_"):
+                rutas.add(os.path.relpath(os.path.join(carpeta, nombre), raiz))
+    return rutas
+
+
+def test_dependencias_de_pasos_que_no_se_ejecutan():
+    assert miscript._dependencias(4, [1, 2, 3, 4]) == {3}
+    # Sin el 3 ni el 2, el 4 espera al 1
+    assert miscript._dependencias(4, [1, 4]) == {1}
+    assert miscript._dependencias(8, range(1, 10)) == set(miscript.MUEVEN_PDF)
+    assert miscript._dependencias(6, [6, 8]) == set()
+
+
+def test_varios_pasos_a_la_vez_dejan_el_mismo_arbol(tmp_path, sitio):
+    referencia, excel = sitio(tmp_path / "referencia")
+    uno_tras_otro = miscript.ContextoSitio(referencia, excel, log=None)
+    miscript.main(uno_tras_otro, jobs=1)
+
+    ruta, excel = sitio(tmp_path / "simultaneo")
+    ctx = miscript.ContextoSitio(ruta, excel, log=None)
+    miscript.main(ctx, jobs=4)
+    assert _arbol(ruta) == _arbol(referencia)
+    assert len(ctx.resultados) == len(miscript.PASOS)
+    # El paso 8 revisa los PDF ya en su sitio definitivo
+    assert [(os.path.relpath(r.ruta, ruta), r.veredicto) for r in ctx.resultados[8]] == [
+        (os.path.relpath(r.ruta, referencia), r.veredicto) for r in uno_tras_otro.resultados[8]
+    ]
@@ -0,0 +1,89 @@
+"""Revisión de PDF del paso 8: estructura, páginas por xref y páginas en blanco."""
+import io
+import mmap
+
+import pytest
+import PyPDF2
+
+import miscript
+from conftest import pdf_bytes
+
+TEXTO = b"BT /F1 12 Tf 20 100 Td (Ficha de excavaci\\363n) Tj ET"
+
+
+def _paginas(datos):
+    with mmap.mmap(-1, len(datos)) as mm:
+        mm.write(datos)
+        error, inicio_xref = miscript._estructura_pdf(mm)
+        assert error is None
+        return miscript._paginas_por_xref(mm, inicio_xref)
+
+
+def _pagina(contenido):
+    return PyPDF2.PdfReader(io.BytesIO(pdf_bytes([contenido]))).pages[0]
+
+
+def test_paginas_por_xref():
+    assert _paginas(pdf_bytes([TEXTO] * 3)) == 3
+    escritor = PyPDF2.PdfWriter()
+    for _ in range(4):
+        escritor.add_blank_page(width=200, height=200)
+    salida = io.BytesIO()
+    escritor.write(salida)
+    assert _paginas(salida.getvalue()) == 4
+
+
+def test_xref_mal_formada_se_deja_a_pypdf2():
+    datos = pdf_bytes([TEXTO])
+    # Desplazamientos que no apuntan a los objetos: no se adivina, se devuelve None
+    assert _paginas(datos.replace(b"00000 n \n", b"00000 x \n")) is None
+    assert _paginas(datos.replace(b"/Root 1 0 R", b"/Root 9 0 R")) is None
+
+
+@pytest.mark.parametrize("datos, veredicto", [
+    (b"", "vacio"),
+    (pdf_bytes([TEXTO, TEXTO]), "ok"),
+    (pdf_bytes([]), "vacio"),
+    (pdf_bytes([TEXTO])[:200], "corrupto"),             # subida a medias: sin %%EOF
+    (b"esto no es un PDF\n%%EOF\n", "corrupto"),       # sin cabecera
+    (pdf_bytes([TEXTO]).replace(b"startxref\n", b"startxref\n9"), "corrupto"),
+])
+def test_veredictos(tmp_path, datos, veredicto):
+    ruta = tmp_path / "T1_1.pdf"
+    ruta.write_bytes(datos)
+    for nivel in ("paginas", "blancas"):
+        assert miscript.revisar_pdf(str(ruta), nivel).veredicto == veredicto
+
+
+@pytest.mark.parametrize("contenido", [
+    b"",
+    b"BT /F1 12 Tf ET",                      # solo elige la fuente
+    b"q 1 0 0 1 0 0 cm /Fs gs Q",
+    b"% (texto) Tj 0 0 m S\nBT /F1 12 Tf ET",  # comentario
+    b"/Span << /ActualText (S f) >> BDC EMC",
+])
+def test_pagina_en_blanco(contenido):
+    assert miscript._pagina_en_blanco(_pagina(contenido))
+
+
+@pytest.mark.parametrize("contenido", [
+    TEXTO,
+    b"BT /F1 12 Tf [(a) -20 (b)] TJ ET",
+    b"BT /F1 12 Tf (par\\)\\(entesis) ' ET",
+    b"BT /F1 12 Tf <48 6f6c61> Tj ET",
+    b"0 0 m 100 100 l S",
+    b"10 10 50 50 re f*",
+])
+def test_pagina_escrita(contenido):
+    assert not miscript._pagina_en_blanco(_pagina(contenido))
+
+
+def test_paginas_en_blanco_de_un_documento(tmp_path):
+    ruta = tmp_path / "T1_1.pdf"
+    ruta.write_bytes(pdf_bytes([TEXTO, b"BT /F1 12 Tf ET", TEXTO]))
+    resultado = miscript.revisar_pdf(str(ruta), "blancas")
+    assert (resultado.veredicto, resultado.paginas, resultado.blancas) == ("ok", 3, (2,))
+
+    ruta.write_bytes(pdf_bytes([b"BT /F1 12 Tf ET", b""]))
+    resultado = miscript.revisar_pdf(str(ruta), "blancas")
+    assert (resultado.veredicto, resultado.blancas) == ("en_blanco", (1, 2))